@@ -10,19 +10,30 @@ os.environ["PYTHONIOENCODING"] = "utf-8"
 # ─────────────────────────────────────────
 # STANDARD IMPORTS
 # ─────────────────────────────────────────
+import re
 import json
 import time
-import urllib.request
+import difflib
+import hashlib
+import sqlite3
+import codecs
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from html.parser import HTMLParser
+from email.utils import parsedate_tz, mktime_tz
 from datetime import datetime, date
+from types import SimpleNamespace
 
 # ─────────────────────────────────────────
 # GROQ - AI CLIENT
 # ─────────────────────────────────────────
-from groq import Groq
+from groq import Groq, AsyncGroq
+import httpx  # installed with groq
 
 API_KEY = ""  # ← PASTE YOUR API KEY HERE
-client = Groq(api_key=API_KEY)
+client  = Groq(api_key=API_KEY)
+aclient = AsyncGroq(api_key=API_KEY)  # async sessions (--batch)
 
 # ─────────────────────────────────────────
 # MODELS - DUAL STRATEGY
@@ -30,20 +41,15 @@ client = Groq(api_key=API_KEY)
 MODEL_FAST  = "llama-3.1-8b-instant"       # 14,400 req/day - simple tasks
 MODEL_SMART = "llama-3.3-70b-versatile"    # 1,000 req/day  - complex tasks
 
+STREAM_RESPONSES = True  # print text as it arrives, start tools before the reply ends
+
 _smart_calls_today = 0
 _smart_calls_date  = date.today()
 _MAX_SMART_CALLS   = 800  # safety buffer
 
 
-def choose_model(user_message: str) -> str:
-    """Automatically selects a model based on task complexity."""
-    global _smart_calls_today, _smart_calls_date
-
-    # Reset counter at midnight
-    if date.today() != _smart_calls_date:
-        _smart_calls_today = 0
-        _smart_calls_date  = date.today()
-
+def keyword_model(user_message: str) -> str:
+    """The model the task's wording asks for, before quota and measurements."""
     msg_lower = user_message.lower()
 
     simple_keywords = [
@@ -63,16 +69,42 @@ def choose_model(user_message: str) -> str:
     if len(user_message) > 200:
         is_complex = True
 
-    if is_complex and _smart_calls_today < _MAX_SMART_CALLS:
-        _smart_calls_today += 1
-        return MODEL_SMART
-    elif is_simple and not is_complex:
-        return MODEL_FAST
-    elif _smart_calls_today < _MAX_SMART_CALLS:
+    return MODEL_FAST if is_simple and not is_complex else MODEL_SMART
+
+
+def choose_model(user_message: str) -> str:
+    """Automatically selects a model based on task complexity."""
+    global _smart_calls_today, _smart_calls_date
+
+    # Reset counter at midnight
+    if date.today() != _smart_calls_date:
+        _smart_calls_today = 0
+        _smart_calls_date  = date.today()
+
+    model = keyword_model(user_message)
+    # Replays must pick what the recording asked for, whatever the stats say now
+    if LLM_CACHE_MODE == "replay":
+        return model
+
+    smart_left = _smart_calls_today < _MAX_SMART_CALLS
+    if not smart_left:
+        model = MODEL_FAST
+
+    # Measured latency, reliability and quota can overrule the keywords
+    return model_router.route(model, user_message, smart_left)
+
+
+def count_model_call(model: str) -> None:
+    """Charge a request that actually goes out to the daily smart budget.
+
+    Cached and replayed responses cost no quota, so they are not counted.
+    """
+    global _smart_calls_today, _smart_calls_date
+    if date.today() != _smart_calls_date:
+        _smart_calls_today = 0
+        _smart_calls_date  = date.today()
+    if model == MODEL_SMART:
         _smart_calls_today += 1
-        return MODEL_SMART
-    else:
-        return MODEL_FAST
 
 
 # ─────────────────────────────────────────
@@ -103,10 +135,93 @@ except ImportError:
 # ─────────────────────────────────────────
 DESKTOP = os.path.join(os.path.expanduser("~"), "Desktop")
 
-# Playwright - single instance per session
+# Playwright - single browser per session. _page is the "active" page the
+# single-page tools drive; page_pool lends extra pages for batch work. Each
+# --batch session drives a page of its own (_session_pages).
 _playwright = None
 _browser    = None
+_context    = None
 _page       = None
+_session_pages = {}                 # session name -> its page
+_browser_owner = threading.local()  # .session: whose browser tool is running
+
+BROWSER_POOL_SIZE = 4   # pages browser_open_many loads side by side
+MAX_OPEN_MANY     = 12  # URLs per browser_open_many call
+
+# Browser performance profiles. "fast" runs headless without slow_mo and
+# aborts images, media, fonts and tracker requests; "visible" shows the window
+# with full rendering; "debug" also slows every action down to watch it.
+BROWSER_PROFILES = {
+    "fast":    {"headless": True,  "slow_mo": 0,   "block": True},
+    "visible": {"headless": False, "slow_mo": 0,   "block": False},
+    "debug":   {"headless": False, "slow_mo": 100, "block": False},
+}
+BROWSER_PROFILE = os.environ.get("AGENT_BROWSER_PROFILE", "fast").lower()
+if BROWSER_PROFILE not in BROWSER_PROFILES:
+    BROWSER_PROFILE = "fast"
+# Cookies, localStorage and the HTTP disk cache live here across restarts
+# ("" = throwaway profile). The browser is launched in the background at
+# startup so the first browser tool doesn't pay for it.
+BROWSER_USER_DATA = os.environ.get("AGENT_BROWSER_DATA",
+                                   os.path.join(os.path.expanduser("~"), ".groqagent", "browser_profile"))
+BROWSER_PREWARM   = os.environ.get("AGENT_BROWSER_PREWARM", "1") != "0"
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+TRACKER_DOMAINS = ("doubleclick.net", "googlesyndication.com", "google-analytics.com",
+                   "googletagmanager.com", "googleadservices.com", "facebook.net",
+                   "connect.facebook.com", "scorecardresearch.com", "hotjar.com",
+                   "adnxs.com", "criteo.com", "taboola.com", "outbrain.com", "amazon-adsystem.com")
+blocked_requests = 0
+
+# Condition-based waits. Interactive tools return as soon as the page reacts:
+# a new document has loaded, or the DOM has gone quiet for ACTION_QUIET_MS.
+ACTION_QUIET_MS   = 150    # DOM quiet window after click / type / scroll / key
+ACTION_SETTLE_MS  = 2000   # give up waiting for a quiet DOM after this long
+WAIT_FOR_TIMEOUT  = 10000  # default browser_wait_for timeout (ms)
+NETWORK_QUIET_MS  = 500    # default quiet window for network_idle
+
+# Locator strategies of browser_click / browser_type are raced, not tried one
+# after another, and the winner per (domain, selector) is remembered on disk.
+LOCATE_TIMEOUT      = 3000  # ms all strategies share before "Element not found"
+SELECTOR_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".groqagent", "selector_cache.json")
+
+TEXT_CHUNK = 6000  # chars browser_get_text returns per call
+PAGE_OBSERVATIONS = 20  # pages whose last text browser_get_text(diff=True) compares against
+
+SCREENSHOT_MAX_HEIGHT   = 10000  # px; taller full-page captures are split into tiles
+SCREENSHOT_JPEG_QUALITY = 80
+LINKS_PAGE              = 40     # links browser_get_links returns per call
+SNAPSHOT_MAX_ELEMENTS   = 150    # interactive elements listed by browser_snapshot
+
+# Plain web fetches (read_webpage, read_webpages) share one keep-alive
+# pool: connections and TLS sessions are reused per host, and bodies arrive
+# compressed (gzip / deflate, plus br when the brotli package is installed).
+HTTP_CONNECT_TIMEOUT  = 5   # s to resolve and connect
+HTTP_READ_TIMEOUT     = 15  # s between bytes of a response
+HTTP_MAX_CONNECTIONS  = 20  # open connections across all hosts
+HTTP_KEEPALIVE        = 10  # idle connections kept for reuse
+HTTP_KEEPALIVE_EXPIRY = 30  # s an idle connection stays open
+HTTP_CHUNK            = 16384  # bytes handed to the extractor at a time
+
+# read_webpage streams the body into the extractor and stops downloading once
+# READ_SCAN_CHARS of text have been seen (enough to pick the main content and
+# fill READ_TEXT_CHARS from it), or at READ_MAX_BYTES on the wire.
+READ_TEXT_CHARS = 8000
+READ_SCAN_CHARS = 4 * READ_TEXT_CHARS
+READ_MAX_BYTES  = 5 * 1024 * 1024
+
+# Extracted pages are kept on disk across sessions with their validators.
+# Fresh ones (Cache-Control max-age / Expires) are served without a request,
+# stale ones are revalidated with If-None-Match / If-Modified-Since.
+# AGENT_HTTP_CACHE=off turns it off; the file is only created on first use.
+HTTP_DISK_CACHE           = os.environ.get("AGENT_HTTP_CACHE", "on").lower() != "off"
+HTTP_DISK_CACHE_PATH      = os.path.join(os.path.expanduser("~"), ".groqagent", "http_cache.sqlite")
+HTTP_DISK_CACHE_MAX_BYTES = 20 * 1024 * 1024  # least recently used pages go first
+HTTP_HEURISTIC_MAX_AGE    = 24 * 3600         # cap for pages with only Last-Modified (10% of their age)
+
+WEB_BATCH_MAX     = 20     # URLs per read_webpages call
+WEB_BATCH_WORKERS = 8      # pages read_webpages fetches at once
+WEB_PER_HOST      = 2      # concurrent read_webpages requests to one host
+WEB_BATCH_CHARS   = 24000  # text budget shared by the pages of one batch
 
 # ─────────────────────────────────────────
 # HELPER - PATH NORMALIZATION
@@ -121,25 +236,254 @@ def fix_path(path: str) -> str:
 # ─────────────────────────────────────────
 # BROWSER
 # ─────────────────────────────────────────
+def _is_tracker(url: str) -> bool:
+    host = url.split("://", 1)[-1].split("/", 1)[0].split(":", 1)[0].lower()
+    return any(host == d or host.endswith("." + d) for d in TRACKER_DOMAINS)
+
+
+def _route_filter(route):
+    """Abort heavy and tracking requests in the "fast" profile."""
+    global blocked_requests
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or _is_tracker(request.url):
+        blocked_requests += 1
+        route.abort()
+    else:
+        route.continue_()
+
+
+def _get_context():
+    global _playwright, _browser, _context
+    if _context is None:
+        profile     = BROWSER_PROFILES[BROWSER_PROFILE]
+        options     = {"headless": profile["headless"], "slow_mo": profile["slow_mo"]}
+        viewport    = {"width": 1280, "height": 800}
+        _playwright = sync_playwright().start()
+        if BROWSER_USER_DATA:
+            try:
+                _context = _playwright.chromium.launch_persistent_context(
+                    BROWSER_USER_DATA, viewport=viewport, **options)
+            except Exception as e:  # e.g. the profile is in use by another agent process
+                print(f"  [⚠️ Browser profile unavailable ({str(e).splitlines()[0][:80]}), "
+                      f"using a temporary one]")
+        if _context is None:
+            _browser = _playwright.chromium.launch(**options)
+            _context = _browser.new_context(viewport=viewport)
+        if profile["block"]:
+            _context.route("**/*", _route_filter)
+    return _context
+
+
+def _watch_page(page):
+    _track_network(page)
+    page.on("framenavigated", _on_navigated)
+    return page
+
+
 def get_page():
-    global _playwright, _browser, _page
+    global _page
+    session = getattr(_browser_owner, "session", None)
+    if session is not None:
+        page = _session_pages.get(session)
+        if page is None or page.is_closed():
+            page = _session_pages[session] = _watch_page(_get_context().new_page())
+        return page
     if _page is None:
-        _playwright = sync_playwright().start()
-        _browser    = _playwright.chromium.launch(headless=False, slow_mo=100)
-        _page       = _browser.new_page()
-        _page.set_viewport_size({"width": 1280, "height": 800})
+        context = _get_context()
+        # A persistent context opens with a blank tab - drive that one
+        free  = [p for p in context.pages
+                 if p not in page_pool and p not in _session_pages.values() and not p.is_closed()]
+        _page = _watch_page(free[0] if free else context.new_page())
     return _page
 
 
+def close_session_page(session: str) -> None:
+    """Close the page of a finished --batch session (browser thread only)."""
+    page = _session_pages.pop(session, None)
+    if page is not None:
+        _net_activity.pop(page, None)
+        try: page.close()
+        except: pass
+
+
+_page_version = 0  # bumped on navigation and after actions; browser_snapshot's cache key
+
+
+def _page_changed() -> None:
+    global _page_version
+    _page_version += 1
+
+
+def _on_navigated(frame) -> None:
+    if frame.parent_frame is None:  # iframes navigating don't replace the page
+        _page_changed()
+
+
+def prewarm_browser() -> None:
+    """Launch the browser on the browser thread in the background."""
+    if not (PLAYWRIGHT_AVAILABLE and BROWSER_PREWARM):
+        return
+
+    def warm():
+        try:
+            get_page()
+        except Exception as e:
+            print(f"  [⚠️ Browser pre-launch failed: {e}]")
+
+    tool_executor.submit_to_browser_thread(warm)
+
+
+_net_activity = {}  # page -> [requests in flight, monotonic time of the last start/end]
+
+
+def _track_network(page) -> None:
+    state = _net_activity[page] = [0, time.monotonic()]
+
+    def started(_):
+        state[0] += 1
+        state[1] = time.monotonic()
+
+    def ended(_):
+        state[0] = max(0, state[0] - 1)
+        state[1] = time.monotonic()
+
+    page.on("request", started)
+    page.on("requestfinished", ended)
+    page.on("requestfailed", ended)
+
+
+# Resolves once no node was added, removed or retexted for `quiet` ms (or after
+# `limit` ms). Attribute changes are ignored: animations rewrite styles non-stop.
+_DOM_SETTLE_JS = """([quiet, limit]) => new Promise(resolve => {
+    const start = performance.now(); let last = start;
+    const obs = new MutationObserver(() => { last = performance.now(); });
+    obs.observe(document, {subtree: true, childList: true, characterData: true});
+    const tick = () => {
+        const now = performance.now();
+        if (now - last >= quiet || now - start >= limit) { obs.disconnect(); resolve(now - last >= quiet); }
+        else setTimeout(tick, Math.min(50, quiet));
+    };
+    setTimeout(tick, Math.min(50, quiet));
+})"""
+
+
+def _wait_dom_settled(page, quiet_ms: int, timeout_ms: int) -> bool:
+    return bool(page.evaluate(_DOM_SETTLE_JS, [quiet_ms, timeout_ms]))
+
+
+def _wait_network_idle(page, quiet_ms: int, timeout_ms: int) -> bool:
+    """True once no request has been in flight for quiet_ms."""
+    state = _net_activity.get(page)
+    if state is None:
+        page.wait_for_load_state("networkidle", timeout=timeout_ms)
+        return True
+    deadline = time.monotonic() + timeout_ms / 1000
+    while time.monotonic() < deadline:
+        if state[0] == 0 and time.monotonic() - state[1] >= quiet_ms / 1000:
+            return True
+        page.wait_for_timeout(50)  # lets Playwright deliver the request events
+    return False
+
+
+def _after_action(page, url_before: str) -> None:
+    """Wait until an interaction has taken effect, but no longer than needed.
+
+    A navigation (the URL changed, or the settle script's document went away)
+    waits for domcontentloaded; otherwise the DOM only has to go quiet.
+    """
+    _page_changed()
+    try:
+        if page.url == url_before:
+            _wait_dom_settled(page, ACTION_QUIET_MS, ACTION_SETTLE_MS)
+            if page.url == url_before:
+                return
+    except Exception:
+        pass  # "execution context was destroyed" - a navigation started
+    try:
+        page.wait_for_load_state("domcontentloaded", timeout=10000)
+    except Exception:
+        pass
+
+
+class PagePool:
+    """Extra pages in the shared browser context, lent out with checkout()
+    and handed back with release(). Like all Playwright objects they are only
+    touched from the browser thread, so no locking is needed."""
+
+    def __init__(self, size: int):
+        self.size  = size
+        self._idle = []
+        self._busy = set()
+
+    def checkout(self):
+        """Return an idle page, opening one while under size; None when all are busy."""
+        while self._idle:
+            page = self._idle.pop()
+            if not page.is_closed():
+                break
+        else:
+            if len(self._busy) >= self.size:
+                return None
+            page = _get_context().new_page()
+        self._busy.add(page)
+        return page
+
+    def release(self, page) -> None:
+        self._busy.discard(page)
+        if page.is_closed():
+            return
+        try:
+            page.goto("about:blank")  # stop timers and media of the old document
+            self._idle.append(page)
+        except Exception:
+            try: page.close()
+            except: pass
+
+    def __contains__(self, page) -> bool:
+        return page in self._busy or page in self._idle
+
+    def reset(self) -> None:
+        """Forget all pages (the browser is closing)."""
+        self._idle, self._busy = [], set()
+
+
+page_pool = PagePool(BROWSER_POOL_SIZE)
+
+
 def close_browser():
-    global _playwright, _browser, _page
+    global _playwright, _browser, _context, _page
+    if _context:
+        try: _context.close()  # flushes cookies and storage of a persistent profile
+        except: pass
     if _browser:
         try: _browser.close()
         except: pass
     if _playwright:
         try: _playwright.stop()
         except: pass
-    _page = _browser = _playwright = None
+    page_pool.reset()
+    _session_pages.clear()
+    _net_activity.clear()
+    _snapshot_cache["page"] = None
+    _page = _context = _browser = _playwright = None
+
+
+def _describe_profile() -> str:
+    p = BROWSER_PROFILES[BROWSER_PROFILE]
+    return (f"{'headless' if p['headless'] else 'visible'}, slow_mo {p['slow_mo']} ms, "
+            f"{'blocking images/media/fonts/trackers' if p['block'] else 'full rendering'}")
+
+
+def browser_set_profile(profile: str) -> str:
+    """Switch the browser profile. The browser restarts with it on the next browser tool."""
+    global BROWSER_PROFILE
+    profile = profile.lower()
+    if profile not in BROWSER_PROFILES:
+        return f"Unknown profile: {profile}. Available: {', '.join(BROWSER_PROFILES)}"
+    if profile != BROWSER_PROFILE:
+        BROWSER_PROFILE = profile
+        close_browser()
+    return f"Browser profile: {profile} ({_describe_profile()})"
 
 
 def browser_goto(url: str) -> str:
@@ -148,33 +492,147 @@ def browser_goto(url: str) -> str:
     try:
         if not url.startswith("http"):
             url = "https://" + url
-        page = get_page()
+        page    = get_page()
+        blocked = blocked_requests
+        started = time.perf_counter()
         page.goto(url, wait_until="domcontentloaded", timeout=20000)
-        return f"Opened: {url} | Title: {page.title()}"
+        load_ms = (time.perf_counter() - started) * 1000
+        timing  = f"loaded in {load_ms:.0f} ms"
+        try:
+            ttfb = page.evaluate("() => { const n = performance.getEntriesByType('navigation')[0];"
+                                 " return n ? n.responseStart : null; }")
+            if ttfb:
+                timing += f" (TTFB {ttfb:.0f} ms)"
+        except Exception:
+            pass
+        if blocked_requests > blocked:
+            timing += f", {blocked_requests - blocked} requests blocked"
+        return f"Opened: {url} | Title: {page.title()} | {timing}"
     except Exception as e:
         return f"Navigation error: {e}"
 
 
+CLICK_STRATEGIES = {
+    "text":   lambda page, s: page.get_by_text(s, exact=False),
+    "button": lambda page, s: page.get_by_role("button", name=s),
+    "link":   lambda page, s: page.get_by_role("link", name=s),
+    "css":    lambda page, s: page.locator(s),
+}
+TYPE_STRATEGIES = {
+    "placeholder": lambda page, s: page.get_by_placeholder(s),
+    "label":       lambda page, s: page.get_by_label(s),
+    "textbox":     lambda page, s: page.get_by_role("textbox", name=s),
+    "css":         lambda page, s: page.locator(s),
+    "searchbox":   lambda page, s: page.get_by_role("searchbox"),  # any search field
+}
+# Catch-alls that ignore the selector: tried only once the others missed, never cached
+FALLBACK_STRATEGIES = {"searchbox"}
+
+
+class SelectorCache:
+    """Winning locator strategy per (domain, selector), persisted across restarts.
+
+    Only the browser thread uses it, so no locking is needed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, domain: str, selector: str):
+        return self.entries.get(domain, {}).get(selector)
+
+    def put(self, domain: str, selector: str, strategy: str) -> None:
+        if self.get(domain, selector) == strategy:
+            return
+        self.entries.setdefault(domain, {})[selector] = strategy
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, indent=1)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass  # a lost hint only costs speed
+
+
+selector_cache = SelectorCache(SELECTOR_CACHE_PATH)
+
+
+def _url_domain(url: str) -> str:
+    return url.split("://", 1)[-1].split("/", 1)[0].lower()
+
+
+def _element_ref(selector: str):
+    """The browser_snapshot ref in a selector ("e12" or "ref=e12"), else None."""
+    m = re.fullmatch(r"\[?(?:ref=)?(e\d+)\]?", selector.strip())
+    return m.group(1) if m else None
+
+
+def _not_found(kind: str, selector: str) -> str:
+    if _element_ref(selector):
+        return f"{kind} not found: {selector} (refs expire when the page changes - call browser_snapshot again)"
+    return f"{kind} not found: {selector}"
+
+
+def _locate(page, selector: str, strategies: dict, timeout_ms: int = LOCATE_TIMEOUT):
+    """Race the locator strategies and return (name, locator) of the first visible match.
+
+    Every round checks each strategy once without waiting (is_visible), so a
+    miss costs timeout_ms in total instead of timeout_ms per strategy. The
+    strategy cached for this domain goes first and wins ties. Fallback
+    strategies are checked once, after the others ran out of time. (None, None)
+    when nothing matched. A snapshot ref resolves directly.
+    """
+    ref = _element_ref(selector)
+    if ref:
+        locator = page.locator(f'[data-agent-ref="{ref}"]').first
+        return ("ref", locator) if locator.count() else (None, None)
+    cached    = selector_cache.get(_url_domain(page.url), selector)
+    order     = sorted((n for n in strategies if n not in FALLBACK_STRATEGIES), key=lambda name: name != cached)
+    fallbacks = [n for n in strategies if n in FALLBACK_STRATEGIES]
+    deadline  = time.monotonic() + timeout_ms / 1000
+
+    def first_visible(names):
+        for name in names:
+            locator = strategies[name](page, selector).first
+            try:
+                if locator.is_visible():
+                    return name, locator
+            except Exception:
+                pass  # e.g. visible text that is not valid CSS
+        return None, None
+
+    while True:
+        name, locator = first_visible(order)
+        if locator is not None:
+            return name, locator
+        if time.monotonic() >= deadline:
+            return first_visible(fallbacks)
+        page.wait_for_timeout(100)
+
+
+def _remember_strategy(url: str, selector: str, strategy: str) -> None:
+    if strategy != "ref" and strategy not in FALLBACK_STRATEGIES:
+        selector_cache.put(_url_domain(url), selector, strategy)
+
+
 def browser_click(selector: str) -> str:
     if not PLAYWRIGHT_AVAILABLE:
         return "Playwright not available."
     try:
         page = get_page()
-        clicked = False
-        for strategy in [
-            lambda: page.get_by_text(selector, exact=False).first.click(timeout=3000),
-            lambda: page.get_by_role("button", name=selector).first.click(timeout=3000),
-            lambda: page.get_by_role("link",   name=selector).first.click(timeout=3000),
-            lambda: page.click(selector, timeout=3000),
-        ]:
-            try:
-                strategy()
-                clicked = True
-                break
-            except: pass
-        if not clicked:
-            return f"Element not found: {selector}"
-        page.wait_for_load_state("domcontentloaded")
+        url_before = page.url
+        strategy, locator = _locate(page, selector, CLICK_STRATEGIES)
+        if locator is None:
+            return _not_found("Element", selector)
+        locator.click(timeout=LOCATE_TIMEOUT)
+        _remember_strategy(url_before, selector, strategy)
+        _after_action(page, url_before)
         return f"Clicked: {selector}"
     except Exception as e:
         return f"Click error: {e}"
@@ -185,80 +643,491 @@ def browser_type(selector: str, text: str) -> str:
         return "Playwright not available."
     try:
         page = get_page()
-        filled = False
-        for strategy in [
-            lambda: page.get_by_placeholder(selector).first.fill(text, timeout=3000),
-            lambda: page.get_by_label(selector).first.fill(text, timeout=3000),
-            lambda: page.get_by_role("textbox", name=selector).first.fill(text, timeout=3000),
-            lambda: page.get_by_role("searchbox").first.fill(text, timeout=3000),
-            lambda: page.fill(selector, text, timeout=3000),
-        ]:
-            try:
-                strategy()
-                filled = True
-                break
-            except: pass
-        if not filled:
-            return f"Input field not found: {selector}"
+        url_before = page.url
+        strategy, locator = _locate(page, selector, TYPE_STRATEGIES)
+        if locator is None:
+            return _not_found("Input field", selector)
+        locator.fill(text, timeout=LOCATE_TIMEOUT)
+        _remember_strategy(url_before, selector, strategy)
+        _after_action(page, url_before)  # autocomplete / live validation
         return f"Typed '{text}' into: {selector}"
     except Exception as e:
         return f"Type error: {e}"
 
 
-def browser_get_text() -> str:
+# Runs in the page: picks the main content block by text density (paragraph
+# scores, discounted by link density), drops boilerplate (nav, footers, cookie
+# banners, hidden elements) and renders compact markdown. The text is kept in
+# window.__agentText, so continuation calls only slice it instead of
+# extracting again. Returns {text, end, total, root, all}; all is the whole
+# text when `full` is set (browser_get_text keeps it for diffs), else null.
+_PAGE_TEXT_JS = r"""([mode, offset, size, full]) => {
+    const SKIP = new Set(["SCRIPT", "STYLE", "NOSCRIPT", "TEMPLATE", "SVG", "CANVAS", "IFRAME",
+                          "NAV", "ASIDE", "FOOTER", "BUTTON", "SELECT", "OPTION", "DIALOG"]);
+    const BLOCK = new Set(["P", "DIV", "SECTION", "ARTICLE", "MAIN", "HEADER", "BLOCKQUOTE", "UL", "OL",
+                           "DL", "DT", "DD", "TABLE", "TBODY", "THEAD", "FIGURE", "FIGCAPTION", "FORM"]);
+    const BOILER = /(^|[\s_-])(nav|navbar|menu|footer|sidebar|breadcrumbs?|cookies?|consent|gdpr|banner|newsletter|subscribe|share|social|related|promo|advert|ads?|popup|modal|comments?)($|[\s_-])/i;
+    const BOILER_ROLES = new Set(["navigation", "banner", "contentinfo", "complementary", "dialog", "alert"]);
+
+    const boilerplate = el => {
+        const role = el.getAttribute("role");
+        if (role && BOILER_ROLES.has(role)) return true;
+        if (el.getAttribute("aria-hidden") === "true") return true;
+        const cls = typeof el.className === "string" ? el.className : "";
+        return BOILER.test(el.id + " " + cls);
+    };
+
+    const linkDensity = el => {
+        const total = el.textContent.length || 1;
+        let links = 0;
+        for (const a of el.querySelectorAll("a")) links += a.textContent.length;
+        return Math.min(1, links / total);
+    };
+
+    const pickRoot = () => {
+        const scores = new Map();
+        for (const p of document.body.querySelectorAll("p, pre, blockquote, td, li, h2, h3")) {
+            const text = p.textContent.trim();
+            if (text.length < 25) continue;
+            const score = 1 + (text.match(/,/g) || []).length + Math.min(text.length / 100, 3);
+            let node = p.parentElement, weight = 1;
+            for (let d = 0; node && node !== document.documentElement && d < 3; d++) {
+                scores.set(node, (scores.get(node) || 0) + score * weight);
+                node = node.parentElement; weight /= 2;
+            }
+        }
+        let best = null, bestScore = 0;
+        for (const [el, score] of scores) {
+            let s = score * (1 - linkDensity(el));
+            if (/^(ARTICLE|MAIN)$/.test(el.tagName) || el.getAttribute("role") === "main") s *= 1.5;
+            if (boilerplate(el)) s *= 0.2;
+            if (s > bestScore) { best = el; bestScore = s; }
+        }
+        return best && best.textContent.trim().length >= 500 ? best : document.body;
+    };
+
+    const render = root => {
+        const out = []; let line = "";
+        const flush = () => {
+            const l = line.replace(/\s+/g, " ").trim();
+            if (l && !/^(#+|-)$/.test(l)) out.push(l);
+            line = "";
+        };
+        const walk = el => {
+            for (const n of el.childNodes) {
+                if (n.nodeType === 3) { line += n.textContent; continue; }
+                if (n.nodeType !== 1) continue;
+                const tag = n.tagName;
+                if (SKIP.has(tag) || (n !== root && boilerplate(n))) continue;
+                if (n.checkVisibility && !n.checkVisibility()) continue;
+                if (root === document.body && tag === "HEADER" && !n.closest("article, main")) continue;
+                const h = /^H([1-6])$/.exec(tag);
+                if (h) { flush(); line = "#".repeat(+h[1]) + " "; walk(n); flush(); }
+                else if (tag === "LI") { flush(); line = "- "; walk(n); flush(); }
+                else if (tag === "TR") {
+                    flush();
+                    const cells = [...n.children].map(c => c.innerText.replace(/\s+/g, " ").trim());
+                    if (cells.some(Boolean)) out.push("| " + cells.join(" | ") + " |");
+                }
+                else if (tag === "PRE") { flush(); out.push("```\n" + n.innerText.trimEnd() + "\n```"); }
+                else if (tag === "BR") flush();
+                else if (BLOCK.has(tag)) { flush(); walk(n); flush(); }
+                else walk(n);
+            }
+        };
+        walk(root); flush();
+        return out.join("\n");
+    };
+
+    if (offset === 0 || window.__agentTextMode !== mode || typeof window.__agentText !== "string") {
+        const root = mode === "all" ? document.body : pickRoot();
+        window.__agentText = render(root);
+        window.__agentTextMode = mode;
+        window.__agentTextRoot = root.tagName.toLowerCase() + (root.id ? "#" + root.id : "")
+            + (typeof root.className === "string" && root.className.trim()
+               ? "." + root.className.trim().split(/\s+/)[0] : "");
+    }
+    const text = window.__agentText, total = text.length;
+    let end = Math.min(total, offset + size);
+    if (end < total) {
+        const cut = text.lastIndexOf("\n", end);
+        if (cut > offset + size / 2) end = cut + 1;
+    }
+    return {text: text.slice(offset, end), end, total, root: window.__agentTextRoot, all: full ? text : null};
+}"""
+
+
+_observations = {}  # (page, url without fragment, mode) -> text last returned, most recent last
+
+
+def _observe(key: tuple, text: str) -> None:
+    _observations.pop(key, None)
+    _observations[key] = text
+    while len(_observations) > PAGE_OBSERVATIONS:
+        _observations.pop(next(iter(_observations)))
+
+
+def _text_diff(old: str, new: str):
+    """Changed lines of new vs old, each hunk anchored on the line before it.
+
+    Returns (text, added, removed).
+    """
+    a, b = old.splitlines(), new.splitlines()
+    out, added, removed = [], 0, 0
+    for op, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if op == "equal":
+            continue
+        out.append(f"@ after: {b[j1 - 1][:80] if j1 else '(top of page)'}")
+        out += ["- " + line for line in a[i1:i2]]
+        out += ["+ " + line for line in b[j1:j2]]
+        removed += i2 - i1
+        added   += j2 - j1
+    return "\n".join(out), added, removed
+
+
+def browser_get_text(offset: int = 0, mode: str = "main", diff: bool = False) -> str:
+    """Page text as compact markdown, TEXT_CHUNK chars at a time.
+
+    mode "main" keeps the main content block, "all" the whole cleaned page.
+    offset continues where the previous chunk ended. diff returns only the
+    lines added and removed since this page's text was last returned.
+    """
     if not PLAYWRIGHT_AVAILABLE:
         return "Playwright not available."
     try:
-        page = get_page()
-        text = page.inner_text("body")
-        if len(text) > 6000:
-            text = text[:6000] + "\n[... truncated to 6000 chars]"
-        return text
+        page   = get_page()
+        mode   = "all" if mode == "all" else "main"
+        offset = 0 if diff else max(0, int(offset or 0))
+        r      = page.evaluate(_PAGE_TEXT_JS, [mode, offset, TEXT_CHUNK, offset == 0])
+        note   = ""
+        if offset == 0:
+            key      = (page, page.url.split("#")[0], mode)
+            previous = _observations.get(key)
+            _observe(key, r["all"])
+            if diff and previous is not None:
+                if previous == r["all"]:
+                    return f"[no changes since the last observation of {page.url}]"
+                changes, added, removed = _text_diff(previous, r["all"])
+                if len(changes) <= len(r["all"]) * 0.6:
+                    if len(changes) > TEXT_CHUNK:
+                        changes = changes[:TEXT_CHUNK] + "\n[... diff truncated]"
+                    return (f"[changes since the last observation of {page.url} | "
+                            f"+{added} / -{removed} lines]\n{changes}")
+                note = "[the page changed substantially - full text]\n"
+            elif diff:
+                note = "[no earlier observation of this page - full text]\n"
+        if not r["total"]:
+            return "No text on the page."
+        if offset >= r["total"]:
+            return f"No more text (the page has {r['total']} chars)."
+        head = f"[{'page' if mode == 'all' else 'main content: ' + r['root']} | " \
+               f"chars {offset}-{r['end']} of {r['total']}]"
+        more = (f"\n[... more: browser_get_text(offset={r['end']}{', mode=all' if mode == 'all' else ''})]"
+                if r["end"] < r["total"] else "")
+        return f"{note}{head}\n{r['text']}{more}"
     except Exception as e:
         return f"Get text error: {e}"
 
 
-def browser_screenshot(path: str) -> str:
+def _screenshot_path(path: str, fmt: str = "") -> str:
+    """Normalize the target file; the extension picks the format unless fmt is given."""
+    path = fix_path(path)
+    ext  = os.path.splitext(path)[1].lower()
+    if fmt in ("jpeg", "jpg"):
+        return path if ext in (".jpg", ".jpeg") else path + ".jpg"
+    if ext in (".jpg", ".jpeg", ".png"):
+        return path
+    return path + ".png"
+
+
+class ScreenshotWriter:
+    """Writes captured screenshots to disk on a background thread.
+
+    browser_screenshot returns as soon as the bytes are captured. Tools that
+    touch a path with a pending write wait for it first (see handle_tool_call).
+    """
+
+    def __init__(self):
+        self._pool    = ThreadPoolExecutor(max_workers=1, thread_name_prefix="screenshot")
+        self._lock    = threading.Lock()
+        self._pending = {}  # path key -> Future of its write
+        self.written  = 0
+        self.failed   = 0
+        self.write_ms = 0.0
+
+    def write(self, path: str, data: bytes) -> None:
+        key = _path_key(path)
+        with self._lock:
+            future = self._pending[key] = self._pool.submit(self._write, path, data)
+        future.add_done_callback(lambda f: self._forget(key, f))
+
+    def _forget(self, key: str, future) -> None:
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+    def _write(self, path: str, data: bytes) -> None:
+        started = time.perf_counter()
+        try:
+            dir_name = os.path.dirname(path)
+            if dir_name:
+                os.makedirs(dir_name, exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+            self.written  += 1
+            self.write_ms += (time.perf_counter() - started) * 1000
+        except OSError as e:
+            self.failed += 1
+            print(f"  [⚠️ Screenshot write failed: {path}: {e}]")
+
+    def wait_for(self, resources: set) -> None:
+        """Block until pending writes to any of these resources are on disk."""
+        with self._lock:
+            futures = [f for key, f in self._pending.items() if _resources_conflict({key}, resources)]
+        wait(futures)
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+
+screenshot_writer = ScreenshotWriter()
+
+
+def browser_screenshot(path: str, scope: str = "full", selector: str = "", clip: dict = None,
+                       fmt: str = "", quality: int = SCREENSHOT_JPEG_QUALITY,
+                       max_height: int = SCREENSHOT_MAX_HEIGHT) -> str:
+    """Capture the page, viewport, an element or a clip region and queue the write.
+
+    Full pages taller than max_height are captured as numbered tiles.
+    """
     if not PLAYWRIGHT_AVAILABLE:
         return "Playwright not available."
-    path = fix_path(path)
-    if not path.endswith(".png"):
-        path += ".png"
+    path    = _screenshot_path(path, fmt)
+    options = {"type": "jpeg" if path.lower().endswith((".jpg", ".jpeg")) else "png"}
+    if options["type"] == "jpeg":
+        options["quality"] = max(1, min(int(quality or SCREENSHOT_JPEG_QUALITY), 100))
     try:
-        page = get_page()
-        dir_name = os.path.dirname(path)
-        if dir_name:
-            os.makedirs(dir_name, exist_ok=True)
-        page.screenshot(path=path, full_page=True)
-        return f"Screenshot saved: {path}"
+        page    = get_page()
+        started = time.perf_counter()
+        shots   = []  # (path, bytes)
+        if scope == "element":
+            if not selector:
+                return "Screenshot error: scope 'element' needs a selector."
+            shots.append((path, page.locator(selector).first.screenshot(timeout=LOCATE_TIMEOUT, **options)))
+        elif scope == "clip":
+            if not clip:
+                return "Screenshot error: scope 'clip' needs clip {x, y, width, height}."
+            region = {k: float(clip[k]) for k in ("x", "y", "width", "height")}
+            shots.append((path, page.screenshot(clip=region, full_page=True, **options)))
+        elif scope == "viewport":
+            shots.append((path, page.screenshot(**options)))
+        else:
+            width, height = page.evaluate(
+                "() => [document.documentElement.scrollWidth, document.documentElement.scrollHeight]")
+            max_height = int(max_height or 0)
+            if not max_height or height <= max_height:
+                shots.append((path, page.screenshot(full_page=True, **options)))
+            else:
+                base, ext = os.path.splitext(path)
+                for n, y in enumerate(range(0, height, max_height), start=1):
+                    region = {"x": 0, "y": y, "width": width, "height": min(max_height, height - y)}
+                    shots.append((f"{base}_{n}{ext}", page.screenshot(clip=region, full_page=True, **options)))
+        capture_ms = (time.perf_counter() - started) * 1000
+        for shot_path, data in shots:
+            screenshot_writer.write(shot_path, data)
+        size  = sum(len(data) for _, data in shots) / 1024
+        where = shots[0][0] if len(shots) == 1 else f"{len(shots)} tiles {shots[0][0]} ... {shots[-1][0]}"
+        return (f"Screenshot saved: {where} | {options['type'].upper()}, {size:.0f} KB, "
+                f"capture+encode {capture_ms:.0f} ms, write queued")
     except Exception as e:
         return f"Screenshot error: {e}"
 
 
-def browser_get_links() -> str:
+# Runs in the page: http(s) links deduped by URL without fragment, same-page
+# anchors dropped, nav/header/footer/banner regions skipped (an article's own
+# header is kept) unless a filter asks for something specific, ranked
+# visible-first then top to bottom. Links keep their full URL.
+# filter is a substring, or /regex/, matched against text and URL.
+_LINKS_JS = r"""([filter, domain, offset, limit]) => {
+    const BOILER = /(^|[\s_-])(nav|navbar|menu|footer|sidebar|breadcrumbs?|cookies?|consent|banner|social|share|promo|advert|ads?)($|[\s_-])/i;
+    const HEADER = /(^|[\s_-])header($|[\s_-])/i;
+    // Inside an article / main, headers hold the title link, and the wrappers
+    // around the region (e.g. "has-sidebar" layouts) say nothing about it
+    const boilerplate = a => {
+        const region = a.closest("article, main, [role=main]");
+        const chrome = a.closest(region ? "nav, footer, aside, [role=navigation], [role=contentinfo]"
+                                        : "nav, header, footer, aside, [role=navigation], [role=banner], [role=contentinfo]");
+        if (chrome && !(region && chrome.contains(region))) return true;
+        for (let el = a.parentElement; el && el !== document.body && el !== region; el = el.parentElement) {
+            const words = el.id + " " + (typeof el.className === "string" ? el.className : "");
+            if (BOILER.test(words) || (!region && HEADER.test(words))) return true;
+        }
+        return false;
+    };
+    let match = () => true;
+    if (filter) {
+        const rx = /^\/(.+)\/$/.exec(filter);
+        if (rx) { const re = new RegExp(rx[1], "i"); match = s => re.test(s); }
+        else { const needle = filter.toLowerCase(); match = s => s.toLowerCase().includes(needle); }
+    }
+    const norm = u => { u.hash = ""; return u.href.replace(/\/$/, ""); };  // de-dup key only
+    const here = norm(new URL(location.href));
+    const best = new Map();
+    for (const a of document.querySelectorAll("a[href]")) {
+        let url;
+        try { url = new URL(a.href, location.href); } catch (e) { continue; }
+        if (url.protocol !== "http:" && url.protocol !== "https:") continue;
+        const href = url.href;
+        const key = norm(url);
+        if (key === here) continue;  // same-page anchor
+        if (domain && url.hostname !== domain && !url.hostname.endsWith("." + domain)) continue;
+        const text = (a.innerText || a.getAttribute("aria-label") || a.title || "").replace(/\s+/g, " ").trim();
+        if (!text || !match(text + " " + key)) continue;
+        if (!filter && boilerplate(a)) continue;
+        const r = a.getBoundingClientRect();
+        const visible = r.width > 0 && r.height > 0 && (!a.checkVisibility || a.checkVisibility());
+        const rank = (visible ? 0 : 1e7) + r.top + window.scrollY;  // visible first, then top to bottom
+        const prev = best.get(key);
+        if (!prev || rank < prev.rank) best.set(key, {text: text.slice(0, 80), href, rank});
+    }
+    const links = [...best.values()].sort((x, y) => x.rank - y.rank);
+    return {total: links.length, links: links.slice(offset, offset + limit).map(l => [l.text, l.href])};
+}"""
+
+
+def browser_get_links(match: str = "", domain: str = "", offset: int = 0, limit: int = LINKS_PAGE) -> str:
     if not PLAYWRIGHT_AVAILABLE:
         return "Playwright not available."
     try:
-        page = get_page()
-        links = page.eval_on_selector_all(
-            "a[href]",
-            "els => els.map(e => ({text: e.innerText.trim(), href: e.href}))"
-            ".filter(l => l.text && l.href)"
-        )
-        result = [f"{l['text'][:60]} -> {l['href']}" for l in links[:40]]
-        return "\n".join(result) if result else "No links found."
+        page   = get_page()
+        offset = max(0, int(offset or 0))
+        limit  = max(1, min(int(limit or LINKS_PAGE), 200))
+        domain = domain.lower().removeprefix("www.") if domain else ""
+        r = page.evaluate(_LINKS_JS, [match or "", domain, offset, limit])
+        if not r["total"]:
+            return "No links found."
+        if not r["links"]:
+            return f"No more links (the page has {r['total']})."
+        result = [f"{n}. {text} -> {href}" for n, (text, href) in enumerate(r["links"], start=offset + 1)]
+        end    = offset + len(r["links"])
+        result.append(f"[links {offset + 1}-{end} of {r['total']}"
+                      + (f" - more: browser_get_links(offset={end})]" if end < r["total"] else "]"))
+        return "\n".join(result)
     except Exception as e:
         return f"Get links error: {e}"
 
 
+# Runs in the page: lists visible interactive elements (links, buttons, fields,
+# ARIA widgets) with role, accessible name and state, plus h1-h3 for context.
+# Each element is tagged data-agent-ref="eN"; a tagged element keeps its ref in
+# later snapshots and numbering continues from seq, so refs are never reused.
+_SNAPSHOT_JS = r"""([seq, max]) => {
+    const SEL = "a[href], button, input:not([type=hidden]), textarea, select, summary, [contenteditable=''], "
+              + "[contenteditable=true], [role=button], [role=link], [role=checkbox], [role=radio], [role=tab], "
+              + "[role=menuitem], [role=option], [role=switch], [role=combobox], [role=textbox], [role=searchbox], "
+              + "h1, h2, h3";
+    const clean = s => (s || "").replace(/\s+/g, " ").trim().slice(0, 80);
+    const role = el => {
+        const r = el.getAttribute("role"), t = el.tagName;
+        if (r) return r;
+        if (t === "A") return "link";
+        if (t === "BUTTON" || t === "SUMMARY") return "button";
+        if (t === "SELECT") return "combobox";
+        if (t === "INPUT") {
+            if (el.type === "checkbox" || el.type === "radio") return el.type;
+            if (/^(submit|button|reset|image)$/.test(el.type)) return "button";
+            return el.type === "search" ? "searchbox" : "textbox";
+        }
+        return "textbox";  // textarea, contenteditable
+    };
+    const name = el => {
+        const by = el.getAttribute("aria-labelledby");
+        if (by) {
+            const t = clean(by.split(/\s+/).map(id => (document.getElementById(id) || {}).innerText || "").join(" "));
+            if (t) return t;
+        }
+        if (el.getAttribute("aria-label")) return clean(el.getAttribute("aria-label"));
+        if (el.labels && el.labels.length) return clean(el.labels[0].innerText);
+        if (el.tagName === "INPUT" && /^(submit|button|reset)$/.test(el.type)) return clean(el.value);
+        const text = clean(el.innerText);
+        if (text && el.tagName !== "SELECT") return text;
+        const img = el.querySelector("img[alt]");
+        if (img && clean(img.alt)) return clean(img.alt);
+        return clean(el.getAttribute("placeholder") || el.getAttribute("title") || el.getAttribute("name") || "");
+    };
+    const lines = [];
+    let count = 0, skipped = 0;
+    for (const el of document.querySelectorAll(SEL)) {
+        if (el.checkVisibility ? !el.checkVisibility() : !el.getClientRects().length) continue;
+        const h = /^H([1-3])$/.exec(el.tagName);
+        if (h) {
+            const t = clean(el.innerText);
+            if (t) lines.push("#".repeat(+h[1]) + " " + t);
+            continue;
+        }
+        if (count >= max) { skipped++; continue; }
+        let ref = el.getAttribute("data-agent-ref");
+        if (!ref) { ref = "e" + (++seq); el.setAttribute("data-agent-ref", ref); }
+        count++;
+        const r = role(el);
+        let line = `[${ref}] ${r} "${name(el)}"`;
+        if (el.checked || el.getAttribute("aria-checked") === "true") line += " checked";
+        if (el.getAttribute("aria-expanded")) line += el.getAttribute("aria-expanded") === "true" ? " expanded" : " collapsed";
+        if (el.getAttribute("aria-selected") === "true") line += " selected";
+        if (el.tagName === "SELECT") line += ` = "${clean((el.selectedOptions[0] || {}).text)}"`;
+        else if (r === "textbox" || r === "searchbox") {
+            if (el.value && el.type !== "password") line += ` = "${clean(el.value)}"`;
+            else if (el.placeholder && name(el) !== clean(el.placeholder)) line += ` (${clean(el.placeholder)})`;
+        }
+        if (el.disabled || el.getAttribute("aria-disabled") === "true") line += " disabled";
+        if (r === "link") {
+            const href = el.getAttribute("href") || "";
+            if (href && !href.startsWith("javascript:") && href !== "#") line += " -> " + href.slice(0, 80);
+        }
+        lines.push(line);
+    }
+    return {text: lines.join("\n"), seq, count, skipped};
+}"""
+
+_snapshot_cache = {"page": None, "version": -1, "text": ""}
+_ref_seq        = 0
+
+
+def browser_snapshot() -> str:
+    """Numbered list of the page's interactive elements; refs work as click/type selectors.
+
+    Served from cache until the page navigates or an action may have changed it.
+    """
+    global _ref_seq
+    if not PLAYWRIGHT_AVAILABLE:
+        return "Playwright not available."
+    try:
+        page = get_page()
+        if _snapshot_cache["page"] is page and _snapshot_cache["version"] == _page_version:
+            return _snapshot_cache["text"] + "\n[unchanged since the last snapshot]"
+        r = page.evaluate(_SNAPSHOT_JS, [_ref_seq, SNAPSHOT_MAX_ELEMENTS])
+        _ref_seq = r["seq"]
+        head = f"[snapshot of {page.url} | {r['count']} elements - pass a ref (e.g. e12) as the " \
+               f"selector of browser_click / browser_type]"
+        more = f"\n[{r['skipped']} more elements not listed]" if r["skipped"] else ""
+        text = f"{head}\n{r['text'] or 'No interactive elements.'}{more}"
+        _snapshot_cache.update(page=page, version=_page_version, text=text)
+        return text
+    except Exception as e:
+        return f"Snapshot error: {e}"
+
+
 def browser_scroll(direction: str) -> str:
     if not PLAYWRIGHT_AVAILABLE:
         return "Playwright not available."
     try:
         page = get_page()
+        url_before = page.url
         key_map = {"down": "PageDown", "up": "PageUp", "top": "Home", "bottom": "End"}
         page.keyboard.press(key_map.get(direction, "PageDown"))
-        time.sleep(0.3)
+        _after_action(page, url_before)  # lazy-loaded content
         return f"Scrolled: {direction}"
     except Exception as e:
         return f"Scroll error: {e}"
@@ -269,8 +1138,9 @@ def browser_press_key(key: str) -> str:
         return "Playwright not available."
     try:
         page = get_page()
+        url_before = page.url
         page.keyboard.press(key)
-        time.sleep(0.5)
+        _after_action(page, url_before)
         return f"Pressed: {key}"
     except Exception as e:
         return f"Key error: {e}"
@@ -285,6 +1155,7 @@ def browser_select_option(selector: str, value: str) -> str:
             page.select_option(selector, label=value, timeout=5000)
         except:
             page.select_option(selector, value=value, timeout=5000)
+        _page_changed()
         return f"Selected '{value}' in: {selector}"
     except Exception as e:
         return f"Select error: {e}"
@@ -299,6 +1170,44 @@ def browser_wait(seconds) -> str:
         return f"Wait error: {e}"
 
 
+def browser_wait_for(condition: str, value: str = "", timeout_ms: int = WAIT_FOR_TIMEOUT) -> str:
+    """Wait until the page meets a condition instead of sleeping a fixed time.
+
+    selector / text  - an element (CSS selector / visible text) is visible
+    url              - the URL contains value, or just changes when value is empty
+    network_idle     - no request in flight for value ms (default NETWORK_QUIET_MS)
+    dom_settle       - no DOM mutation for value ms (default 300)
+    """
+    if not PLAYWRIGHT_AVAILABLE:
+        return "Playwright not available."
+    try:
+        page    = get_page()
+        timeout = min(int(timeout_ms or WAIT_FOR_TIMEOUT), 30000)
+        started = time.perf_counter()
+        ready   = True
+        if condition == "selector":
+            page.wait_for_selector(value, state="visible", timeout=timeout)
+        elif condition == "text":
+            page.get_by_text(value, exact=False).first.wait_for(state="visible", timeout=timeout)
+        elif condition == "url":
+            current = page.url
+            page.wait_for_url(lambda u: value in u if value else u != current, timeout=timeout)
+        elif condition == "network_idle":
+            ready = _wait_network_idle(page, int(value or NETWORK_QUIET_MS), timeout)
+        elif condition == "dom_settle":
+            ready = _wait_dom_settled(page, int(value or 300), timeout)
+        else:
+            return f"Unknown condition: {condition}. Use selector, text, url, network_idle or dom_settle."
+        took = (time.perf_counter() - started) * 1000
+        if not ready:
+            return f"Timed out after {took:.0f} ms waiting for {condition}"
+        return f"Ready after {took:.0f} ms: {condition}{' ' + value if value else ''}"
+    except Exception as e:
+        if "Timeout" in type(e).__name__ or "Timeout" in str(e):
+            return f"Timed out waiting for {condition} {value}".rstrip()
+        return f"Wait error: {e}"
+
+
 def browser_current_url() -> str:
     if not PLAYWRIGHT_AVAILABLE:
         return "Playwright not available."
@@ -326,15 +1235,311 @@ def browser_eval_js(script: str) -> str:
     try:
         page = get_page()
         result = page.evaluate(script)
+        _page_changed()
         return str(result)[:3000] if result else "OK (no result)"
     except Exception as e:
         return f"JS error: {e}"
 
 
+def browser_open_many(urls: list) -> str:
+    """Load several URLs side by side in pooled pages and summarize each.
+
+    The active page is left alone. Every navigation in a batch is started
+    (goto returns on commit) before any is waited on, so the pages load
+    concurrently even though sync Playwright runs on one thread.
+    """
+    if not PLAYWRIGHT_AVAILABLE:
+        return "Playwright not available."
+    urls = [u if u.startswith("http") else "https://" + u for u in urls if u][:MAX_OPEN_MANY]
+    if not urls:
+        return "No URLs given."
+    per_url = max(300, 6000 // len(urls))
+    out     = []
+    try:
+        for i in range(0, len(urls), page_pool.size):
+            batch, loaded = urls[i:i + page_pool.size], []
+            for url in batch:
+                page = page_pool.checkout()
+                try:
+                    page.goto(url, wait_until="commit", timeout=20000)
+                    loaded.append((url, page, None))
+                except Exception as e:
+                    loaded.append((url, page, e))
+            for n, (url, page, error) in enumerate(loaded, start=i + 1):
+                try:
+                    if error:
+                        raise error
+                    page.wait_for_load_state("domcontentloaded", timeout=20000)
+                    r    = page.evaluate(_PAGE_TEXT_JS, ["main", 0, per_url])
+                    text = r["text"] + (" [...]" if r["end"] < r["total"] else "")
+                    out.append(f"[{n}] {url} | Title: {page.title()}\n{text}")
+                except Exception as e:
+                    out.append(f"[{n}] {url} | Navigation error: {str(e).splitlines()[0][:200]}")
+                finally:
+                    page_pool.release(page)
+        return "\n\n".join(out)
+    except Exception as e:
+        return f"Open many error: {e}"
+
+
 # ─────────────────────────────────────────
 # WEB (without browser)
 # ─────────────────────────────────────────
+# read_webpage's extractor is the HTTP twin of _PAGE_TEXT_JS: skipped regions
+# (scripts, nav, footers, cookie banners, hidden nodes) are tracked by depth,
+# blocks become compact markdown, and once the page has been parsed the main
+# content block is picked by text density.
+SKIP_TAGS    = {"head", "script", "style", "noscript", "template", "svg", "canvas", "iframe",
+                "nav", "aside", "footer", "button", "select", "option", "dialog"}
+VOID_TAGS    = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+                "param", "source", "track", "wbr"}
+BLOCK_TAGS   = {"p", "div", "section", "article", "main", "header", "blockquote", "ul", "ol",
+                "dl", "dt", "dd", "table", "tbody", "thead", "figure", "figcaption", "form"}
+HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+PARA_TAGS    = {"p", "pre", "blockquote", "tr", "li", "h2", "h3"}  # lines that score their ancestors
+# Class / id words of boilerplate; "has-sidebar" style state modifiers don't count
+BOILER_RE    = re.compile(r"(^|\s|(?<!\bhas)(?<!\bwith)(?<!\bno)[_-])"
+                          r"(nav|navbar|menu|footer|sidebar|breadcrumbs?|cookies?|consent|gdpr|"
+                          r"banner|newsletter|subscribe|share|social|related|promo|advert|ads?|popup|"
+                          r"modal|comments?)($|[\s_-])", re.I)
+BOILER_ROLES = {"navigation", "banner", "contentinfo", "complementary", "dialog", "alert"}
+# A start tag closes the open tags in its set, searching up to the first boundary tag
+IMPLIED_END  = {"li": ({"li"}, {"ul", "ol"}), "dt": ({"dt", "dd"}, {"dl"}), "dd": ({"dt", "dd"}, {"dl"}),
+                "tr": ({"tr", "td", "th"}, {"table", "tbody", "thead", "tfoot"}),
+                "td": ({"td", "th"}, {"tr", "table"}), "th": ({"td", "th"}, {"tr", "table"})}
+
+
+class _Node:
+    """An open or closed element: its text and link chars and its density score."""
+
+    __slots__ = ("tag", "parent", "bonus", "text", "links", "score")
+
+    def __init__(self, tag: str, parent, attrs: dict):
+        self.tag    = tag
+        self.parent = parent
+        self.bonus  = 1.5 if tag in ("article", "main") or attrs.get("role") == "main" else 1.0
+        self.text   = 0
+        self.links  = 0
+        self.score  = 0.0
+
+
 class TextExtractor(HTMLParser):
+    """Streaming HTML to compact markdown, keeping only the main content.
+
+    Feed it chunks as they arrive; size counts the text extracted so far.
+    markdown() picks the element whose paragraphs score highest (commas and
+    length, discounted by link density) and renders the lines inside it,
+    or the whole page when no block has at least 500 chars.
+
+    A region skipped only for its boilerplate-looking class or id is entered
+    again for an article / main inside it, since a wrapper such as
+    "site-content has-sidebar" can hold the page's content.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.root     = _Node("document", None, {})
+        self.stack    = [self.root]  # open elements, innermost last
+        self.skip_at  = 0            # stack depth of the element that opened a skipped region
+        self.by_class = False        # the skipped region was opened by a class / id match
+        self.kept     = []           # (depth, skip_at) of main content kept inside such a region
+        self.in_link  = 0
+        self.in_title = False
+        self.title    = ""
+        self.line     = []           # inline text of the current block
+        self.prefix   = ""           # "# " / "- " of the current heading or list item
+        self.cells    = None         # cells of the open table row
+        self.pre      = None         # raw text of the open <pre>
+        self.lines    = []           # (markdown line, element it was emitted in)
+        self.scored   = set()
+        self.size     = 0
+
+    def _boilerplate(self, tag: str, attrs: dict) -> bool:
+        if tag == "header" and not any(n.tag in ("article", "main") for n in self.stack):
+            return True
+        if not attrs:
+            return False
+        if attrs.get("role") in BOILER_ROLES or attrs.get("aria-hidden") == "true" or "hidden" in attrs:
+            return True
+        style = attrs.get("style", "").replace(" ", "").lower()
+        if "display:none" in style or "visibility:hidden" in style:
+            return True
+        return False
+
+    @staticmethod
+    def _boilerplate_class(tag: str, attrs: dict) -> bool:
+        if not attrs or tag in ("html", "body", "main", "article") or attrs.get("role") == "main":
+            return False
+        return bool(BOILER_RE.search(attrs.get("id", "") + " " + attrs.get("class", "")))
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title" and not self.title:
+            # Only the document title: not an <svg><title> or one in a hidden region
+            opener = self.stack[self.skip_at - 1].tag if self.skip_at else None
+            self.in_title = opener == "head" or (opener is None and
+                                                 not any(n.tag == "body" for n in self.stack))
+        if tag in VOID_TAGS:
+            if tag == "br" and not self.skip_at:
+                self._flush()
+            return
+        if tag in IMPLIED_END:
+            closes, boundary = IMPLIED_END[tag]
+            match = 0
+            for i in range(len(self.stack) - 1, 0, -1):
+                if self.stack[i].tag in closes:
+                    match = i
+                elif self.stack[i].tag in boundary:
+                    break
+            if match:
+                self._close_to(match)
+        elif self.stack[-1].tag == "p" and (tag in BLOCK_TAGS or tag in HEADING_TAGS or tag == "pre"):
+            self._close_to(len(self.stack) - 1)
+        attrs = {k: v or "" for k, v in attrs}
+        self.stack.append(_Node(tag, self.stack[-1], attrs))
+        if self.skip_at:
+            if not (self.by_class and self.stack[-1].bonus > 1):
+                return
+            self.kept.append((len(self.stack), self.skip_at))
+            self.skip_at = 0
+        if tag in SKIP_TAGS or self._boilerplate(tag, attrs):
+            self.skip_at, self.by_class = len(self.stack), False
+        elif self._boilerplate_class(tag, attrs):
+            self.skip_at, self.by_class = len(self.stack), True
+        elif tag in HEADING_TAGS:
+            self._flush()
+            self.prefix = "#" * HEADING_TAGS[tag] + " "
+        elif tag == "li":
+            self._flush()
+            self.prefix = "- "
+        elif tag == "tr":
+            self._flush()
+            self.cells = []
+        elif tag in ("td", "th") and self.cells is not None:
+            self.cells.append([])
+        elif tag == "pre":
+            self._flush()
+            self.pre = []
+        elif tag == "a":
+            self.in_link += 1
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self.in_title = False
+        if tag in VOID_TAGS:
+            return
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].tag == tag:
+                self._close_to(i)
+                return
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title += data
+            return
+        if self.skip_at:
+            return
+        node        = self.stack[-1]
+        chars       = len(data.strip())
+        node.text  += chars
+        if self.in_link:
+            node.links += chars
+        if self.pre is not None:
+            self.pre.append(data)
+        elif self.cells is not None:
+            if not self.cells:
+                self.cells.append([])
+            self.cells[-1].append(data)
+        else:
+            self.line.append(data)
+
+    def _close_to(self, depth: int) -> None:
+        """Close the open elements from the innermost down to stack[depth]."""
+        while len(self.stack) > depth:
+            node = self.stack[-1]
+            if self.skip_at:
+                if len(self.stack) == self.skip_at:
+                    self.skip_at = 0
+            else:
+                self._end(node)
+                if self.kept and self.kept[-1][0] == len(self.stack):
+                    self.skip_at, self.by_class = self.kept.pop()[1], True
+            self.stack.pop()
+            node.parent.text  += node.text
+            node.parent.links += node.links
+
+    def _end(self, node: _Node) -> None:
+        tag = node.tag
+        if tag == "a":
+            self.in_link = max(0, self.in_link - 1)
+        elif tag == "pre" and self.pre is not None:
+            text, self.pre = "".join(self.pre).strip("\n"), None
+            if text.strip():
+                self._emit(f"```\n{text}\n```", node)
+        elif tag == "tr" and self.cells is not None:
+            cells, self.cells = [" ".join("".join(c).split()) for c in self.cells], None
+            if any(cells):
+                self._emit("| " + " | ".join(cells) + " |", node)
+        elif tag in HEADING_TAGS or tag == "li":
+            self._flush()
+            self.prefix = ""
+        elif tag in BLOCK_TAGS:
+            self._flush()
+
+    def _flush(self) -> None:
+        text, self.line = " ".join("".join(self.line).split()), []
+        if text:
+            self._emit(self.prefix + text, self.stack[-1])
+            self.prefix = ""
+
+    def _emit(self, line: str, node: _Node) -> None:
+        self.lines.append((line, node))
+        self.size += len(line) + 1
+        if node.tag in PARA_TAGS and len(line) >= 25:
+            score  = 1 + line.count(",") + min(len(line) / 100, 3)
+            parent = node.parent
+            for weight in (1, 0.5, 0.25):
+                if parent is None:
+                    break
+                parent.score += score * weight
+                self.scored.add(parent)
+                parent = parent.parent
+
+    def _main(self) -> _Node:
+        best, best_score = self.root, 0.0
+        for node in self.scored:
+            score = node.score * (1 - min(1.0, node.links / max(node.text, 1))) * node.bonus
+            if score > best_score and node.text >= 500:
+                best, best_score = node, score
+        return best
+
+    def markdown(self) -> str:
+        """The main content as markdown, led by the page title. Closes what is still open."""
+        self._flush()
+        self._close_to(1)
+        main   = self._main()
+        inside = {main: True, self.root: main is self.root}
+
+        def within(node):
+            chain = []
+            while node not in inside:
+                chain.append(node)
+                node = node.parent
+            for n in chain:
+                inside[n] = inside[node]
+            return inside[node]
+
+        lines = [line for line, node in self.lines if within(node)]
+        title = " ".join(self.title.split())
+        if title:
+            lines.insert(0, f"Title: {title}")
+        return "\n".join(lines)
+
+
+class _PlainTextExtractor(HTMLParser):
+    """The earlier flat extractor, kept as the --bench-extract baseline."""
+
     def __init__(self):
         super().__init__()
         self.text = []
@@ -355,25 +1560,526 @@ class TextExtractor(HTMLParser):
                 self.text.append(s)
 
 
+def benchmark_extractors(folder: str, rounds: int = 5) -> str:
+    """Compare TextExtractor with the flat parser on saved .html pages.
+
+    Reports the time each takes on the whole page, the time TextExtractor
+    takes the way read_webpage streams it (stopping at READ_SCAN_CHARS),
+    the chars each returns within READ_TEXT_CHARS and the share of the
+    flat parser's output the new one leaves out as boilerplate.
+    """
+    files = sorted(f for f in os.listdir(folder) if f.lower().endswith((".html", ".htm")))
+    if not files:
+        return f"No .html files in {folder}"
+    rows   = [f"{'page':<30} {'KB':>6} {'flat ms':>8} {'new ms':>8} {'streamed':>9} "
+              f"{'flat chars':>10} {'new chars':>9} {'dropped':>8}"]
+    totals = [0, 0.0, 0.0, 0.0]
+    for name in files:
+        with open(os.path.join(folder, name), "r", encoding="utf-8", errors="replace") as f:
+            html = f.read()
+        started = time.perf_counter()
+        for _ in range(rounds):
+            flat = _PlainTextExtractor()
+            flat.feed(html)
+            flat.close()
+            flat_text = "\n".join(flat.text)
+        flat_ms = (time.perf_counter() - started) * 1000 / rounds
+        started = time.perf_counter()
+        for _ in range(rounds):
+            new = TextExtractor()
+            new.feed(html)
+            new.close()
+            new_text = new.markdown()
+        new_ms  = (time.perf_counter() - started) * 1000 / rounds
+        started = time.perf_counter()
+        for _ in range(rounds):
+            streamed = TextExtractor()
+            for i in range(0, len(html), HTTP_CHUNK):
+                streamed.feed(html[i:i + HTTP_CHUNK])
+                if streamed.size >= READ_SCAN_CHARS:
+                    break
+            streamed.markdown()
+        streamed_ms = (time.perf_counter() - started) * 1000 / rounds
+        flat_lines = flat_text[:READ_TEXT_CHARS].splitlines()
+        dropped    = sum(len(line) for line in flat_lines if line not in new_text)
+        rows.append(f"{name[:30]:<30} {len(html) / 1024:>6.0f} {flat_ms:>8.1f} {new_ms:>8.1f} {streamed_ms:>9.1f} "
+                    f"{min(len(flat_text), READ_TEXT_CHARS):>10} {min(len(new_text), READ_TEXT_CHARS):>9} "
+                    f"{dropped / max(sum(map(len, flat_lines)), 1):>8.0%}")
+        totals[0] += len(html)
+        totals[1] += flat_ms
+        totals[2] += new_ms
+        totals[3] += streamed_ms
+    rows.append(f"{f'{len(files)} pages':<30} {totals[0] / 1024:>6.0f} {totals[1]:>8.1f} {totals[2]:>8.1f} "
+                f"{totals[3]:>9.1f}")
+    return "\n".join(rows)
+
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+
+class HttpClient:
+    """Keep-alive HTTP for every plain web fetch, with per-request timing.
+
+    A sync pool serves tool threads and an async pool the event loop; both
+    keep connections and TLS sessions open per host and decompress bodies.
+    Each request is timed from httpcore trace events: connect (DNS + TCP),
+    TLS handshake, time to first byte and total. With a sink, the body is
+    streamed instead of read whole, so the caller can stop the download.
+    """
+
+    PHASES = ("connect", "tls", "ttfb", "total")
+
+    def __init__(self):
+        self._client  = None
+        self._async   = None  # created on first use inside the event loop
+        self._lock    = threading.Lock()
+        self.requests = 0
+        self.reused   = 0     # requests that found an open connection
+        self.wire     = 0     # bytes received, before decompression
+        self.body     = 0     # bytes after decompression
+        self.totals   = dict.fromkeys(self.PHASES, 0.0)  # ms
+
+    @staticmethod
+    def _options() -> dict:
+        return {
+            "headers": {"User-Agent": USER_AGENT},
+            "follow_redirects": True,
+            "timeout": httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            "limits": httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                                   max_keepalive_connections=HTTP_KEEPALIVE,
+                                   keepalive_expiry=HTTP_KEEPALIVE_EXPIRY),
+        }
+
+    def _record(self, r, marks: dict, started: float, body: int) -> dict:
+        def span(name):
+            begin, end = marks.get(name + ".started"), marks.get(name + ".complete")
+            return (end - begin) * 1000 if begin and end else 0.0
+
+        ended   = time.perf_counter()
+        headers = (marks.get("http11.receive_response_headers.complete")
+                   or marks.get("http2.receive_response_headers.complete") or ended)
+        timing  = {"connect": span("connection.connect_tcp"),
+                   "tls":     span("connection.start_tls"),
+                   "ttfb":    (headers - started) * 1000,
+                   "total":   (ended - started) * 1000,
+                   "reused":  "connection.connect_tcp.started" not in marks,
+                   "status":  r.status_code,
+                   "wire":    r.num_bytes_downloaded,
+                   "body":    body,
+                   "encoding": r.headers.get("Content-Encoding", "")}
+        with self._lock:
+            self.requests += 1
+            self.reused   += timing["reused"]
+            self.wire     += timing["wire"]
+            self.body     += timing["body"]
+            for phase in self.PHASES:
+                self.totals[phase] += timing[phase]
+        return timing
+
+    @staticmethod
+    def _decoder(r):
+        try:
+            return codecs.getincrementaldecoder(r.encoding or "utf-8")(errors="replace")
+        except LookupError:
+            return codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    @staticmethod
+    def _feed(r, decoder, chunk: bytes, sink):
+        """Pass one chunk on; returns why reading stops ("enough" / "cap") or None."""
+        if sink(decoder.decode(chunk)):
+            return "enough"
+        if r.num_bytes_downloaded >= READ_MAX_BYTES:
+            return "cap"
+        return None
+
+    def get(self, url: str, headers: dict = None, method: str = "GET", sink=None):
+        """Sync request; returns (response, timing).
+
+        Without sink the body is read whole. With sink, decoded text is passed
+        to sink(text) chunk by chunk until it returns True or READ_MAX_BYTES
+        have arrived; timing["stopped"] then says why.
+        """
+        with self._lock:
+            if self._client is None:
+                self._client = httpx.Client(**self._options())
+        marks   = {}
+        started = time.perf_counter()
+        ext     = {"trace": lambda event, info: marks.__setitem__(event, time.perf_counter())}
+        if sink is None:
+            r = self._client.request(method, url, headers=headers, extensions=ext)
+            return r, self._record(r, marks, started, len(r.content))
+        with self._client.stream(method, url, headers=headers, extensions=ext) as r:
+            body, stopped, decoder = 0, None, self._decoder(r)
+            if not r.is_error:
+                for chunk in r.iter_bytes(HTTP_CHUNK):
+                    body   += len(chunk)
+                    stopped = self._feed(r, decoder, chunk, sink)
+                    if stopped:
+                        break
+                else:
+                    sink(decoder.decode(b"", final=True))
+            timing = self._record(r, marks, started, body)
+        timing["stopped"] = stopped
+        return r, timing
+
+    async def aget(self, url: str, headers: dict = None, method: str = "GET", sink=None):
+        """Async twin of get() on the event loop's pool."""
+        if self._async is None:
+            self._async = httpx.AsyncClient(**self._options())
+        marks = {}
+
+        async def trace(event, info):
+            marks[event] = time.perf_counter()
+
+        started = time.perf_counter()
+        if sink is None:
+            r = await self._async.request(method, url, headers=headers, extensions={"trace": trace})
+            return r, self._record(r, marks, started, len(r.content))
+        async with self._async.stream(method, url, headers=headers, extensions={"trace": trace}) as r:
+            body, stopped, decoder = 0, None, self._decoder(r)
+            if not r.is_error:
+                async for chunk in r.aiter_bytes(HTTP_CHUNK):
+                    body   += len(chunk)
+                    stopped = self._feed(r, decoder, chunk, sink)
+                    if stopped:
+                        break
+                else:
+                    sink(decoder.decode(b"", final=True))
+            timing = self._record(r, marks, started, body)
+        timing["stopped"] = stopped
+        return r, timing
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self) -> None:
+        if self._async is not None:
+            await self._async.aclose()
+            self._async = None
+
+    @staticmethod
+    def describe_timing(t: dict) -> str:
+        size = f"{t['body'] / 1024:.0f} KB"
+        if t["encoding"]:
+            size += f" ({t['encoding']} {t['wire'] / 1024:.0f} KB)"
+        link = "reused connection" if t["reused"] else f"connect {t['connect']:.0f} ms, tls {t['tls']:.0f} ms"
+        return f"{t['status']} | {size} | {link}, ttfb {t['ttfb']:.0f} ms, total {t['total']:.0f} ms"
+
+    def describe(self) -> str:
+        if not self.requests:
+            return "no requests yet"
+        fresh = max(self.requests - self.reused, 1)
+        return (f"{self.requests} requests, {self.reused} on reused connections | avg connect "
+                f"{self.totals['connect'] / fresh:.0f} ms, tls {self.totals['tls'] / fresh:.0f} ms (new "
+                f"connections), ttfb {self.totals['ttfb'] / self.requests:.0f} ms, total "
+                f"{self.totals['total'] / self.requests:.0f} ms | "
+                f"{self.wire / 1024:.0f} KB received for {self.body / 1024:.0f} KB of content")
+
+
+http_client = HttpClient()
+
+
+class _PageReader:
+    """Sink for HttpClient: feeds streamed HTML to a TextExtractor and
+    reports enough once READ_SCAN_CHARS of text have been extracted."""
+
+    def __init__(self):
+        self.parser = TextExtractor()
+
+    def __call__(self, html: str) -> bool:
+        self.parser.feed(html)
+        return self.parser.size >= READ_SCAN_CHARS
+
+    def text(self, r, timing: dict) -> str:
+        if not timing["stopped"]:
+            self.parser.close()
+        text  = self.parser.markdown()
+        notes = []
+        if not text:
+            return "No content."
+        if len(text) > READ_TEXT_CHARS:
+            text = text[:READ_TEXT_CHARS]
+            notes.append(f"truncated to {READ_TEXT_CHARS} chars")
+        if timing["stopped"]:
+            read   = f"{timing['wire'] / 1024:.0f} KB"
+            length = r.headers.get("Content-Length", "")
+            if length.isdigit() and int(length) > timing["wire"]:
+                read += f" of {int(length) / 1024:.0f} KB, {(int(length) - timing['wire']) / 1024:.0f} KB skipped"
+            if timing["stopped"] == "cap":
+                notes.append(f"download capped at {READ_MAX_BYTES // (1024 * 1024)} MB: read {read}")
+            else:
+                notes.append(f"stopped reading after {read}")
+        return text + (f"\n[... {'; '.join(notes)}]" if notes else "")
+
+
+def _http_date(value: str):
+    parsed = parsedate_tz(value or "")
+    return mktime_tz(parsed) if parsed else None
+
+
+def _freshness(headers):
+    """Seconds a response may be reused without asking the server; None = don't store it.
+
+    The freshness lifetime (max-age, Expires - Date, or 10% of the
+    Last-Modified age) minus the response's current age: its Age header, or
+    the time since its Date when that is longer (RFC 9111 4.2.3).
+    """
+    directives = {}
+    for part in headers.get("Cache-Control", "").lower().split(","):
+        name, _, value = part.strip().partition("=")
+        directives[name] = value.strip('"')
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0
+    now         = time.time()
+    date_header = _http_date(headers.get("Date")) or now
+    age         = headers.get("Age", "").strip()
+    age         = max(int(age) if age.isdigit() else 0, now - date_header, 0)
+    if directives.get("max-age", "").isdigit():
+        lifetime = int(directives["max-age"])
+    elif "Expires" in headers:
+        lifetime = (_http_date(headers.get("Expires")) or 0) - date_header  # invalid dates mean already expired
+    else:
+        modified = _http_date(headers.get("Last-Modified"))
+        lifetime = 0 if modified is None else min(max(0, date_header - modified) / 10, HTTP_HEURISTIC_MAX_AGE)
+    return max(0, lifetime - age)
+
+
+class PageCache:
+    """Extracted pages on disk (SQLite) with their HTTP validators.
+
+    lookup() marks an entry fresh while its max-age / Expires lasts. A stale
+    one is re-requested conditionally: a 304 keeps the text (revalidated), a
+    new body replaces it. Size-bounded, least recently used first.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path        = path
+        self.max_bytes   = max_bytes
+        self.hits        = 0  # served fresh, no request
+        self.revalidated = 0  # 304 Not Modified
+        self.misses      = 0  # body downloaded
+        self._lock       = threading.Lock()
+        self._db         = None
+
+    def _open(self):
+        """The database, opened on first use; call with the lock held."""
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, text TEXT, etag TEXT, "
+                "last_modified TEXT, expires REAL, accessed REAL, size INTEGER)")
+            self._db.commit()
+        return self._db
+
+    def lookup(self, url: str):
+        """{"text", "etag", "last_modified", "fresh"} of a stored page, or None."""
+        with self._lock:
+            db = self._open()
+            row = db.execute("SELECT text, etag, last_modified, expires FROM pages WHERE url = ?",
+                             (url,)).fetchone()
+            if row is None:
+                return None
+            fresh = time.time() < row[3]
+            if fresh:
+                db.execute("UPDATE pages SET accessed = ? WHERE url = ?", (time.time(), url))
+                db.commit()
+                self.hits += 1
+        if fresh:
+            print(f"  [💾 {url} fresh in the page cache]")
+        return {"text": row[0], "etag": row[1], "last_modified": row[2], "fresh": fresh}
+
+    @staticmethod
+    def conditional(entry) -> dict:
+        """Request headers that let the server answer 304 for a stored page."""
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def refresh(self, url: str, headers) -> None:
+        """The server answered 304: the stored text is current for another max-age."""
+        now = time.time()
+        with self._lock:
+            db = self._open()
+            self.revalidated += 1
+            db.execute("UPDATE pages SET expires = ?, accessed = ?, etag = COALESCE(?, etag) WHERE url = ?",
+                       (now + (_freshness(headers) or 0), now, headers.get("ETag"), url))
+            db.commit()
+
+    def store(self, url: str, text: str, headers) -> None:
+        """Record a downloaded page; kept when the server allows it and it can be reused or revalidated."""
+        freshness = _freshness(headers)
+        etag, modified = headers.get("ETag"), headers.get("Last-Modified")
+        now = time.time()
+        with self._lock:
+            db = self._open()
+            self.misses += 1
+            if freshness is None or not (freshness or etag or modified):
+                db.execute("DELETE FROM pages WHERE url = ?", (url,))
+                db.commit()
+                return
+            db.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (url, text, etag, modified, now + freshness, now, len(text)))
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+            for old_url, size in db.execute("SELECT url, size FROM pages ORDER BY accessed").fetchall():
+                if total <= self.max_bytes:
+                    break
+                db.execute("DELETE FROM pages WHERE url = ?", (old_url,))
+                total -= size
+            db.commit()
+
+    def describe(self) -> str:
+        with self._lock:
+            db = self._open()
+            count, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+        return (f"{self.hits} fresh hits / {self.revalidated} revalidated (304) / {self.misses} misses | "
+                f"{count} pages, {size / 1024:.0f} KB")
+
+
+page_cache = PageCache(HTTP_DISK_CACHE_PATH, HTTP_DISK_CACHE_MAX_BYTES) if HTTP_DISK_CACHE else None
+
+
+def _fetched(url: str, r, timing: dict, reader: _PageReader, cached) -> str:
+    print(f"  [🌐 {HttpClient.describe_timing(timing)}]")
+    if r.status_code == 304 and cached:
+        page_cache.refresh(url, r.headers)
+        return cached["text"]
+    r.raise_for_status()
+    text = reader.text(r, timing)
+    if page_cache:
+        page_cache.store(url, text, r.headers)
+    return text
+
+
+def _read_page(url: str, timing: dict) -> str:
+    """One page through the page cache; timing is filled in when a request is made."""
+    cached = page_cache.lookup(url) if page_cache else None
+    if cached and cached["fresh"]:
+        return cached["text"]
+    reader = _PageReader()
+    r, t   = http_client.get(url, PageCache.conditional(cached), sink=reader)
+    timing.update(t)
+    return _fetched(url, r, t, reader, cached)
+
+
+async def _read_page_async(url: str, timing: dict) -> str:
+    """_read_page on the event loop; the SQLite work of the page cache runs in a thread."""
+    cached = await asyncio.to_thread(page_cache.lookup, url) if page_cache else None
+    if cached and cached["fresh"]:
+        return cached["text"]
+    reader = _PageReader()
+    r, t   = await http_client.aget(url, PageCache.conditional(cached), sink=reader)
+    timing.update(t)
+    return await asyncio.to_thread(_fetched, url, r, t, reader, cached)
+
+
 def read_webpage(url: str) -> str:
     try:
-        if not url.startswith("http"):
-            url = "https://" + url
-        req = urllib.request.Request(url, headers={
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-        })
-        with urllib.request.urlopen(req, timeout=15) as r:
-            html = r.read().decode("utf-8", errors="ignore")
-        parser = TextExtractor()
-        parser.feed(html)
-        text = "\n".join(parser.text)
-        if len(text) > 8000:
-            text = text[:8000] + "\n[... truncated to 8000 chars]"
-        return text or "No content."
+        return _read_page(_normalize_url(url), {})
     except Exception as e:
         return f"Error: {e}"
 
 
+async def read_webpage_async(url: str) -> str:
+    try:
+        return await _read_page_async(_normalize_url(url), {})
+    except Exception as e:
+        return f"Error: {e}"
+
+
+_web_pool = ThreadPoolExecutor(max_workers=WEB_BATCH_WORKERS, thread_name_prefix="web")
+
+
+def _batch_urls(urls: list) -> list:
+    out = []
+    for url in urls:
+        url = _normalize_url(url.strip()) if url and url.strip() else ""
+        if url and url not in out:
+            out.append(url)
+    return out[:WEB_BATCH_MAX]
+
+
+def _batch_report(urls: list, results: list, elapsed: float) -> str:
+    """One section per URL: status and timing, then its share of WEB_BATCH_CHARS."""
+    per_url = max(1000, WEB_BATCH_CHARS // len(urls))
+    out     = []
+    for n, (url, (text, timing)) in enumerate(zip(urls, results), start=1):
+        failed = text.startswith("Error")
+        if timing:
+            state = f"{timing['status']} | {timing['total']:.0f} ms"
+        else:
+            state = "failed" if failed else "cached"
+        if failed:
+            out.append(f"[{n}] {url} | {state} | {text.splitlines()[0][:200]}")
+            continue
+        if len(text) > per_url:
+            text = text[:per_url] + " [...]"
+        out.append(f"[{n}] {url} | {state}\n{text}")
+    fetched = sum(not text.startswith("Error") for text, _ in results)
+    head    = (f"Fetched {fetched}/{len(urls)} pages in {elapsed:.1f} s "
+               f"({WEB_BATCH_WORKERS} at a time, at most {WEB_PER_HOST} per host)")
+    return head + "\n\n" + "\n\n".join(out)
+
+
+def read_webpages(urls: list) -> str:
+    """Fetch and extract several pages concurrently, reported in one result.
+
+    Each page goes through the read_webpage caches. Misses are fetched on a
+    pool of WEB_BATCH_WORKERS threads, at most WEB_PER_HOST per host.
+    """
+    urls = _batch_urls(urls)
+    if not urls:
+        return "No URLs given."
+    slots = {host: threading.Semaphore(WEB_PER_HOST) for host in map(_url_domain, urls)}
+
+    def fetch_one(url):
+        timing = {}
+
+        def fetch(args):
+            with slots[_url_domain(url)]:
+                try:
+                    return _read_page(url, timing)
+                except Exception as e:
+                    return f"Error: {e}"
+
+        return tool_cache.call("read_webpage", {"url": url}, fetch), timing
+
+    started = time.perf_counter()
+    results = list(_web_pool.map(fetch_one, urls))
+    return _batch_report(urls, results, time.perf_counter() - started)
+
+
+async def read_webpages_async(urls: list) -> str:
+    urls = _batch_urls(urls)
+    if not urls:
+        return "No URLs given."
+    workers = asyncio.Semaphore(WEB_BATCH_WORKERS)
+    slots   = {host: asyncio.Semaphore(WEB_PER_HOST) for host in map(_url_domain, urls)}
+
+    async def fetch_one(url):
+        timing = {}
+
+        async def fetch(args):
+            async with workers, slots[_url_domain(url)]:
+                try:
+                    return await _read_page_async(url, timing)
+                except Exception as e:
+                    return f"Error: {e}"
+
+        return await tool_cache.acall("read_webpage", {"url": url}, fetch), timing
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(fetch_one(url) for url in urls))
+    return _batch_report(urls, results, time.perf_counter() - started)
+
+
 # ─────────────────────────────────────────
 # FILES
 # ─────────────────────────────────────────
@@ -696,6 +2402,24 @@ def run_command(command: str) -> str:
         return f"Error: {e}"
 
 
+async def run_command_async(command: str) -> str:
+    try:
+        proc = await asyncio.create_subprocess_shell(
+            command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=30)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            return "Timeout - command took too long."
+        output = (stdout + stderr).decode("utf-8", errors="ignore")
+        if len(output) > 5000:
+            output = output[:5000] + "\n[... truncated]"
+        return output or "Command executed (no output)."
+    except Exception as e:
+        return f"Error: {e}"
+
+
 # ─────────────────────────────────────────
 # TOOLS DEFINITION
 # ─────────────────────────────────────────
@@ -770,14 +2494,14 @@ tools = [
 
     {"type": "function", "function": {
         "name": "browser_click",
-        "description": "Click an element on the page - provide visible text or CSS selector.",
+        "description": "Click an element on the page - provide a browser_snapshot ref, visible text or CSS selector.",
         "parameters": {"type": "object", "properties": {
             "selector": {"type": "string"}},
             "required": ["selector"]}}},
 
     {"type": "function", "function": {
         "name": "browser_type",
-        "description": "Type text into a form field. Selector can be placeholder, label, or CSS.",
+        "description": "Type text into a form field. Selector can be a browser_snapshot ref, placeholder, label, or CSS.",
         "parameters": {"type": "object", "properties": {
             "selector": {"type": "string"},
             "text":     {"type": "string"}},
@@ -785,19 +2509,52 @@ tools = [
 
     {"type": "function", "function": {
         "name": "browser_get_text",
-        "description": "Get all visible text from the current page (max 6000 chars).",
-        "parameters": {"type": "object", "properties": {}, "required": []}}},
+        "description": "Get the page's main content as compact markdown (menus, cookie banners and "
+                       "footers removed), 6000 chars per call. Long pages end with the offset that "
+                       "returns the next chunk.",
+        "parameters": {"type": "object", "properties": {
+            "offset": {"type": "integer", "description": "Continue from this char (default 0)"},
+            "mode":   {"type": "string", "enum": ["main", "all"],
+                       "description": "main = main content (default), all = whole page"},
+            "diff":   {"type": "boolean",
+                       "description": "Only the lines added/removed since you last read this page. "
+                                      "Use it after click / type / scroll."}},
+            "required": []}}},
 
     {"type": "function", "function": {
         "name": "browser_screenshot",
-        "description": "Take a full-page screenshot and save as PNG.",
+        "description": "Save a screenshot of the page (default: full page, PNG). A .jpg path or "
+                       "format 'jpeg' saves a much smaller JPEG.",
         "parameters": {"type": "object", "properties": {
-            "path": {"type": "string"}},
+            "path":       {"type": "string"},
+            "scope":      {"type": "string", "enum": ["full", "viewport", "element", "clip"],
+                           "description": "full page (default), visible viewport, one element, or a region"},
+            "selector":   {"type": "string", "description": "CSS selector for scope 'element'"},
+            "clip":       {"type": "object", "description": "Region for scope 'clip' in page pixels",
+                           "properties": {"x": {"type": "number"}, "y": {"type": "number"},
+                                          "width": {"type": "number"}, "height": {"type": "number"}}},
+            "format":     {"type": "string", "enum": ["png", "jpeg"]},
+            "quality":    {"type": "integer", "description": "JPEG quality 1-100 (default 80)"},
+            "max_height": {"type": "integer",
+                           "description": "Split taller full pages into numbered tiles (default 10000 px)"}},
             "required": ["path"]}}},
 
     {"type": "function", "function": {
         "name": "browser_get_links",
-        "description": "Return a list of links from the current page (max 40).",
+        "description": "List the page's content links (deduplicated, menus and footers skipped unless "
+                       "filtered), visible ones first, 40 per call.",
+        "parameters": {"type": "object", "properties": {
+            "filter": {"type": "string", "description": "Substring or /regex/ matched against link text and URL"},
+            "domain": {"type": "string", "description": "Only links to this domain (and its subdomains)"},
+            "offset": {"type": "integer", "description": "Skip this many links (paging)"},
+            "limit":  {"type": "integer", "description": "Links per call (default 40, max 200)"}},
+            "required": []}}},
+
+    {"type": "function", "function": {
+        "name": "browser_snapshot",
+        "description": "List the page's interactive elements (links, buttons, fields...) with numbered refs. "
+                       "Pass a ref such as e12 as the selector of browser_click / browser_type instead of "
+                       "guessing selectors. Refs stay valid until the page changes.",
         "parameters": {"type": "object", "properties": {}, "required": []}}},
 
     {"type": "function", "function": {
@@ -824,11 +2581,25 @@ tools = [
 
     {"type": "function", "function": {
         "name": "browser_wait",
-        "description": "Wait for N seconds (max 30).",
+        "description": "Sleep N seconds (max 30). Prefer browser_wait_for, which returns as soon as "
+                       "the page is ready.",
         "parameters": {"type": "object", "properties": {
             "seconds": {"type": "number"}},
             "required": ["seconds"]}}},
 
+    {"type": "function", "function": {
+        "name": "browser_wait_for",
+        "description": "Wait until the page is ready: an element or text is visible, the URL changes, "
+                       "the network is idle or the DOM stops changing. Returns as soon as it happens.",
+        "parameters": {"type": "object", "properties": {
+            "condition":  {"type": "string",
+                           "enum": ["selector", "text", "url", "network_idle", "dom_settle"]},
+            "value":      {"type": "string",
+                           "description": "CSS selector, text, URL part (empty = any change), "
+                                          "or quiet window in ms for network_idle / dom_settle"},
+            "timeout_ms": {"type": "integer", "description": "Default 10000, max 30000"}},
+            "required": ["condition"]}}},
+
     {"type": "function", "function": {
         "name": "browser_current_url",
         "description": "Return the current URL and page title.",
@@ -846,14 +2617,44 @@ tools = [
             "script": {"type": "string"}},
             "required": ["script"]}}},
 
+    {"type": "function", "function": {
+        "name": "browser_set_profile",
+        "description": "Switch the browser profile: 'fast' (headless, no images/media/fonts/trackers), "
+                       "'visible' (shown window, full rendering - use it for screenshots that need "
+                       "images) or 'debug' (visible and slowed down). The browser restarts.",
+        "parameters": {"type": "object", "properties": {
+            "profile": {"type": "string", "enum": ["fast", "visible", "debug"]}},
+            "required": ["profile"]}}},
+
+    {"type": "function", "function": {
+        "name": "browser_open_many",
+        "description": "Open several URLs at once in background pages and return each page's "
+                       "title and opening text. Use it to compare or skim many pages; "
+                       "the current page is not changed.",
+        "parameters": {"type": "object", "properties": {
+            "urls": {"type": "array", "items": {"type": "string"},
+                     "description": "Up to 12 URLs"}},
+            "required": ["urls"]}}},
+
     # ── WEB (no browser) ────────────────────────────────────────────────────
     {"type": "function", "function": {
         "name": "read_webpage",
-        "description": "Quickly fetch text content from a URL via HTTP (no browser, max 8000 chars).",
+        "description": "Quickly fetch the main content of a URL as markdown via HTTP "
+                       "(no browser, menus and footers removed, max 8000 chars).",
         "parameters": {"type": "object", "properties": {
             "url": {"type": "string"}},
             "required": ["url"]}}},
 
+    {"type": "function", "function": {
+        "name": "read_webpages",
+        "description": "Fetch the text of several URLs at once via HTTP (no browser). Returns every "
+                       "page with its status and timing in one result - use it instead of many "
+                       "read_webpage calls when researching or summarizing several pages.",
+        "parameters": {"type": "object", "properties": {
+            "urls": {"type": "array", "items": {"type": "string"},
+                     "description": "Up to 20 URLs"}},
+            "required": ["urls"]}}},
+
     # ── EXCEL ───────────────────────────────────────────────────────────────
     {"type": "function", "function": {
         "name": "create_excel",
@@ -966,17 +2767,29 @@ TOOL_MAP = {
     "browser_goto":       lambda a: browser_goto(a["url"]),
     "browser_click":      lambda a: browser_click(a["selector"]),
     "browser_type":       lambda a: browser_type(a["selector"], a["text"]),
-    "browser_get_text":   lambda a: browser_get_text(),
-    "browser_screenshot": lambda a: browser_screenshot(a["path"]),
-    "browser_get_links":  lambda a: browser_get_links(),
+    "browser_get_text":   lambda a: browser_get_text(a.get("offset", 0), a.get("mode", "main"),
+                                                    a.get("diff", False)),
+    "browser_screenshot": lambda a: browser_screenshot(a["path"], a.get("scope", "full"),
+                                                       a.get("selector", ""), a.get("clip"),
+                                                       a.get("format", ""),
+                                                       a.get("quality", SCREENSHOT_JPEG_QUALITY),
+                                                       a.get("max_height", SCREENSHOT_MAX_HEIGHT)),
+    "browser_get_links":  lambda a: browser_get_links(a.get("filter", ""), a.get("domain", ""),
+                                                     a.get("offset", 0), a.get("limit", LINKS_PAGE)),
+    "browser_snapshot":   lambda a: browser_snapshot(),
     "browser_scroll":     lambda a: browser_scroll(a["direction"]),
     "browser_press_key":  lambda a: browser_press_key(a["key"]),
     "browser_select_option": lambda a: browser_select_option(a["selector"], a["value"]),
     "browser_wait":       lambda a: browser_wait(a["seconds"]),
+    "browser_wait_for":   lambda a: browser_wait_for(a["condition"], str(a.get("value") or ""),
+                                                     a.get("timeout_ms", WAIT_FOR_TIMEOUT)),
     "browser_current_url":lambda a: browser_current_url(),
     "browser_go_back":    lambda a: browser_go_back(),
     "browser_eval_js":    lambda a: browser_eval_js(a["script"]),
+    "browser_open_many":  lambda a: browser_open_many(a["urls"]),
+    "browser_set_profile": lambda a: browser_set_profile(a["profile"]),
     "read_webpage":       lambda a: read_webpage(a["url"]),
+    "read_webpages":      lambda a: read_webpages(a["urls"]),
     "create_excel":       lambda a: create_excel(a["path"], a["sheets_data"]),
     "read_excel":         lambda a: read_excel(a["path"]),
     "edit_excel_cell":    lambda a: edit_excel_cell(a["path"], a["sheet_name"], a["cell"], a["value"]),
@@ -989,6 +2802,7 @@ TOOL_MAP = {
                                                        a.get("bold", False), a.get("bg_color"),
                                                        a.get("font_size")),
     "run_command":        lambda a: run_command(a["command"]),
+    "request_tools":      lambda a: request_tools(a.get("groups") or ["all"]),
 }
 
 
@@ -996,69 +2810,832 @@ def handle_tool_call(name: str, args: dict) -> str:
     preview = ", ".join(f"{k}={repr(v)[:50]}" for k, v in args.items())
     print(f"  [🔧 {name}({preview})]")
     handler = TOOL_MAP.get(name)
-    if handler:
-        return handler(args)
-    return f"Unknown tool: {name}"
+    if not handler:
+        return f"Unknown tool: {name}"
+    if name not in BROWSER_TOOLS:
+        screenshot_writer.wait_for(tool_resources(name, args))
+    if name in READ_ONLY_TOOLS:
+        return tool_cache.call(name, args, handler)
+    result = handler(args)
+    tool_cache.invalidate(name, args)
+    return result
+
+
+# ─────────────────────────────────────────
+# TOOL EXECUTOR - PARALLEL INDEPENDENT CALLS
+# ─────────────────────────────────────────
+MAX_TOOL_WORKERS = 4
+
+BROWSER_TOOLS = {name for name in TOOL_MAP if name.startswith("browser_")}
+EXCEL_TOOLS   = {"create_excel", "read_excel", "edit_excel_cell", "add_excel_formula",
+                 "add_excel_chart", "add_excel_sheet", "excel_add_rows", "excel_style_range"}
+
+
+def _path_key(path: str, suffix: str = "") -> str:
+    path = fix_path(path or ".")
+    if suffix and not path.endswith(suffix):
+        path += suffix
+    return "path:" + os.path.normcase(os.path.abspath(path))
+
+
+def tool_resources(name: str, args: dict) -> set:
+    """Return the resources a tool call touches. Calls sharing a resource run in order."""
+    if name in BROWSER_TOOLS:
+        keys = {"browser"}
+        if name == "browser_screenshot":
+            keys.add(_path_key(_screenshot_path(args.get("path", ""), args.get("format", ""))))
+        return keys
+    if name in EXCEL_TOOLS:
+        return {_path_key(args.get("path", ""), ".xlsx")}
+    if name in ("copy_file", "move_file"):
+        return {_path_key(args.get("src", "")), _path_key(args.get("dst", ""))}
+    if name == "list_files":
+        return {_path_key(args.get("directory", "."))}
+    if name in ("read_file", "write_file", "open_file", "delete_file", "create_directory"):
+        return {_path_key(args.get("path", ""))}
+    if name == "run_command":
+        return {"*"}  # a shell command can touch anything
+    return set()
+
+
+def _resources_conflict(a: set, b: set) -> bool:
+    if "*" in a or "*" in b:
+        return True
+    for ka in a:
+        for kb in b:
+            if ka == kb:
+                return True
+            # A folder conflicts with anything inside it
+            if ka.startswith("path:") and kb.startswith("path:"):
+                if ka.startswith(kb + os.sep) or kb.startswith(ka + os.sep):
+                    return True
+    return False
+
+
+class ToolExecutor:
+    """Runs tool calls on a bounded thread pool.
+
+    Calls that share a resource wait for the earlier ones, so they still run
+    in the order the model asked for them. Browser tools always run on one
+    dedicated thread because Playwright's sync API is bound to the thread
+    that started it.
+    """
+
+    def __init__(self, max_workers: int = MAX_TOOL_WORKERS):
+        self._pool    = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        self._browser = ThreadPoolExecutor(max_workers=1, thread_name_prefix="browser")
+        self._lock    = threading.Lock()
+        self._pending = []  # (resources, future) of calls submitted but not finished
+
+    def submit(self, name: str, args: dict, session: str = None):
+        """Queue a tool call. Browser tools of a named session drive that
+        session's own page, so they don't wait for other sessions' ones."""
+        keys = tool_resources(name, args)
+        if session is not None and "browser" in keys:
+            keys = (keys - {"browser"}) | {"browser:" + session}
+        with self._lock:
+            self._pending = [(k, f) for k, f in self._pending if not f.done()]
+            deps   = [f for k, f in self._pending if _resources_conflict(keys, k)]
+            pool   = self._browser if name in BROWSER_TOOLS else self._pool
+            future = pool.submit(self._run, deps, name, args, session)
+            self._pending.append((keys, future))
+        return future
+
+    @staticmethod
+    def _run(deps: list, name: str, args: dict, session: str = None) -> str:
+        wait(deps)
+        if name not in BROWSER_TOOLS:
+            return handle_tool_call(name, args)
+        _browser_owner.session = session
+        try:
+            return handle_tool_call(name, args)
+        finally:
+            _browser_owner.session = None
+
+    def run_all(self, calls: list) -> list:
+        """Run (name, args) pairs and return their results in the original order."""
+        futures = [self.submit(name, args) for name, args in calls]
+        return [f.result() for f in futures]
+
+    def submit_to_browser_thread(self, fn):
+        return self._browser.submit(fn)
+
+    def run_in_browser_thread(self, fn):
+        return self.submit_to_browser_thread(fn).result()
+
+
+tool_executor = ToolExecutor()
+
+
+# ─────────────────────────────────────────
+# TOOL RESULT CACHE - READ-ONLY TOOLS
+# ─────────────────────────────────────────
+READ_ONLY_TOOLS = {"read_file", "read_excel", "list_files", "read_webpage"}
+ERROR_PREFIXES  = ("Error", "Read error", "Excel read error", "openpyxl not available")
+
+
+def _normalize_url(url: str) -> str:
+    return url if url.startswith("http") else "https://" + url
+
+
+def _tool_target(name: str, args: dict) -> str:
+    """File or folder a read-only tool looks at."""
+    return fix_path(args.get("directory", ".") if name == "list_files" else args.get("path", ""))
+
+
+def _file_validator(path: str):
+    """mtime and size of a file. A folder's own mtime only changes when entries
+    are added, removed or renamed, so for list_files it is name, mtime and
+    size of every entry instead."""
+    try:
+        if not os.path.isdir(path):
+            st = os.stat(path)
+            return (st.st_mtime_ns, st.st_size)
+        with os.scandir(path) as it:
+            return sorted((e.name, e.stat().st_mtime_ns, e.stat().st_size) for e in it)
+    except OSError:
+        return None
+
+
+class ToolResultCache:
+    """Memoizes read-only tool results for the session.
+
+    File entries are reused while the file's mtime and size are unchanged
+    (for a folder: those of every entry in it). Web pages are not kept here:
+    how long a page may be reused is up to its Cache-Control / Expires, which
+    the page cache honors. Write tools drop entries for the paths they touch,
+    and identical calls already in flight (pages included) share one run.
+    """
+
+    def __init__(self):
+        self._entries  = {}  # key -> {"result", "validator", "paths"}
+        self._inflight = {}  # key -> Future of the call computing it
+        self._lock     = threading.Lock()
+        self.hits      = 0
+        self.misses    = 0
+
+    @staticmethod
+    def _key(name: str, args: dict) -> str:
+        if name == "read_webpage":
+            return "read_webpage:" + _normalize_url(args.get("url", ""))
+        return name + ":" + os.path.normcase(os.path.abspath(_tool_target(name, args)))
+
+    def lookup(self, name: str, args: dict):
+        if name == "read_webpage":
+            return None
+        key   = self._key(name, args)
+        entry = self._entries.get(key)
+        if entry is not None and entry["validator"] == _file_validator(_tool_target(name, args)):
+            self.hits += 1
+            print(f"  [💾 {name} cached]")
+            return entry["result"]
+        self._entries.pop(key, None)
+        self.misses += 1
+        return None
+
+    def store(self, name: str, args: dict, result) -> None:
+        if name == "read_webpage" or str(result).startswith(ERROR_PREFIXES):
+            return
+        validator = _file_validator(_tool_target(name, args))
+        if validator is None:
+            return
+        self._entries[self._key(name, args)] = {
+            "result": result, "validator": validator, "paths": {_path_key(_tool_target(name, args))},
+        }
+
+    def call(self, name: str, args: dict, handler):
+        """Run handler(args) through the cache, joining an identical call in flight."""
+        key = self._key(name, args)
+        with self._lock:
+            future = self._inflight.get(key)
+            owner  = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            print(f"  [💾 {name} joined an identical call in flight]")
+            return future.result()
+        try:
+            result = self.lookup(name, args)
+            if result is None:
+                result = handler(args)
+                self.store(name, args, result)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def acall(self, name: str, args: dict, handler):
+        """call() for a coroutine handler; joins identical calls from other
+        sessions and from tool threads alike."""
+        key = self._key(name, args)
+        with self._lock:
+            future = self._inflight.get(key)
+            owner  = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            print(f"  [💾 {name} joined an identical call in flight]")
+            return await asyncio.wrap_future(future)
+        try:
+            result = await asyncio.to_thread(self.lookup, name, args)
+            if result is None:
+                result = await handler(args)
+                self.store(name, args, result)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def invalidate(self, name: str, args: dict) -> None:
+        """Drop file entries a (possibly) writing tool may have changed."""
+        if name in READ_ONLY_TOOLS:
+            return
+        touched = tool_resources(name, args)
+        for key, entry in list(self._entries.items()):
+            if _resources_conflict(entry["paths"], touched):
+                self._entries.pop(key, None)
+
+
+tool_cache = ToolResultCache()
+
+
+# ─────────────────────────────────────────
+# RESPONSE CACHE - OPT-IN, ON DISK
+# ─────────────────────────────────────────
+# off    - every request goes to the API (default)
+# on     - identical requests (model, messages, tools) are served from disk
+# replay - serve recorded responses only, never touch the network
+LLM_CACHE_MODE      = os.environ.get("AGENT_LLM_CACHE", "off").lower()
+LLM_CACHE_PATH      = os.path.join(os.path.expanduser("~"), ".groqagent", "llm_cache.sqlite")
+LLM_CACHE_TTL       = 7 * 24 * 3600     # seconds; ignored in replay mode
+LLM_CACHE_MAX_BYTES = 50 * 1024 * 1024  # least recently used entries go first
+
+
+class ReplayMiss(Exception):
+    """Raised in replay mode when a request was never recorded."""
+
+
+class ResponseCache:
+    """SQLite-backed key/value store with TTL and size-bounded LRU eviction."""
+
+    def __init__(self, path: str, ttl: float, max_bytes: int):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl       = ttl
+        self.max_bytes = max_bytes
+        self.hits      = 0
+        self.misses    = 0
+        self._lock     = threading.Lock()
+        self._db       = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT, "
+            "created REAL, accessed REAL, size INTEGER)")
+        self._db.commit()
+
+    @staticmethod
+    def key(request: dict) -> str:
+        canonical = json.dumps(request, sort_keys=True, ensure_ascii=False,
+                               separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, ignore_ttl: bool = False):
+        with self._lock:
+            row = self._db.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row and (ignore_ttl or time.time() - row[1] <= self.ttl):
+                self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+                self._db.commit()
+                self.hits += 1
+                return json.loads(row[0])
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value) -> None:
+        data = json.dumps(value, ensure_ascii=False, default=str)
+        now  = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                             (key, data, now, now, len(data)))
+            self._db.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl,))
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            for old_key, size in self._db.execute(
+                    "SELECT key, size FROM entries ORDER BY accessed").fetchall():
+                if total <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM entries WHERE key = ?", (old_key,))
+                total -= size
+            self._db.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+response_cache = (ResponseCache(LLM_CACHE_PATH, LLM_CACHE_TTL, LLM_CACHE_MAX_BYTES)
+                  if LLM_CACHE_MODE in ("on", "replay") else None)
+
+
+def _cache_key(kwargs: dict, requested: str = None) -> str:
+    """Key of a request. It names the model the task asked for (requested), not
+    the one routing or a fallback sent it to, so replays don't depend on the
+    router's stats or the quota of the day."""
+    return ResponseCache.key({**kwargs, "model": requested or kwargs["model"]})
+
+
+def _cache_lookup(kwargs: dict, requested: str = None):
+    """Return the recorded reply for this request, or None. Replay mode never misses silently."""
+    if response_cache is None:
+        return None
+    hit = response_cache.get(_cache_key(kwargs, requested), ignore_ttl=LLM_CACHE_MODE == "replay")
+    if hit is None and LLM_CACHE_MODE == "replay":
+        raise ReplayMiss(f"no recorded response for this {kwargs['model']} request (replay mode)")
+    return hit
+
+
+def _cache_store(kwargs: dict, response, requested: str = None) -> None:
+    if response_cache is None:
+        return
+    choice = response.choices[0]
+    response_cache.put(_cache_key(kwargs, requested), {
+        "content":       choice.message.content,
+        "finish_reason": choice.finish_reason,
+        "tool_calls":    [{"id": tc.id, "name": tc.function.name, "arguments": tc.function.arguments}
+                          for tc in choice.message.tool_calls or []],
+    })
+
+
+def _cached_response(data: dict, stream: bool):
+    """Rebuild a response-shaped object from a cache entry."""
+    print(" ✓ 💾")
+    if stream and data["content"]:
+        print(f"\n🤖 Agent: {data['content']}\n")
+    tool_calls = [
+        SimpleNamespace(id=tc["id"], type="function",
+                        function=SimpleNamespace(name=tc["name"], arguments=tc["arguments"]))
+        for tc in data["tool_calls"]
+    ]
+    message = SimpleNamespace(content=data["content"], tool_calls=tool_calls or None)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason=data["finish_reason"])])
+
+
+# ─────────────────────────────────────────
+# RATE LIMITER - CLIENT-SIDE PACING
+# ─────────────────────────────────────────
+# Token buckets for requests/min and tokens/min per (API key, model). Calls
+# reserve capacity before they are sent and sleep until it is there, instead
+# of learning about the limit from a 429. Groq's x-ratelimit-* headers on
+# every response (and retry-after on a 429) keep the buckets in sync.
+RATE_LIMITS = {  # model -> (requests/min, tokens/min), free tier until headers say otherwise
+    MODEL_FAST:  (30, 6000),
+    MODEL_SMART: (30, 12000),
+}
+DEFAULT_RATE_LIMIT = (30, 6000)
+API_KEY_ID = hashlib.sha256(API_KEY.encode()).hexdigest()[:8]  # never keep the raw key around
+
+
+def _parse_duration(value) -> float:
+    """Parse Groq reset values like '7.66s', '2m59.56s' or '120ms' into seconds."""
+    value = str(value or "").strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+    return sum(float(n) * units[u] for n, u in re.findall(r"([\d.]+)(ms|h|m|s)", value))
+
+
+class TokenBucket:
+    """Refills at rate/second up to capacity. The level may go negative: that
+    debt is the queue of callers already promised a slot."""
+
+    def __init__(self, per_minute: int):
+        self.capacity      = float(per_minute)
+        self.rate          = per_minute / 60.0
+        self.level         = float(per_minute)
+        self.stamp         = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take amount now and return how long the caller must wait for it."""
+        self._refill(now)
+        self.level -= min(amount, self.capacity)  # oversized calls wait for a full bucket
+        wait_time = -self.level / self.rate if self.level < 0 else 0.0
+        return max(wait_time, self.blocked_until - now)
+
+    def wait_for(self, amount: float, now: float) -> float:
+        """Like reserve, without taking anything."""
+        self._refill(now)
+        deficit = min(amount, self.capacity) - self.level
+        return max(deficit / self.rate if deficit > 0 else 0.0, self.blocked_until - now)
+
+    def sync(self, limit, remaining, reset: float, now: float, per_minute: bool) -> None:
+        """Adopt the server's view. Only ever lowers the level."""
+        self._refill(now)
+        if limit and per_minute:
+            self.capacity, self.rate = float(limit), float(limit) / 60.0
+        if remaining is not None:
+            self.level = min(self.level, float(remaining))
+            if remaining <= 0 and reset:
+                self.blocked_until = max(self.blocked_until, now + reset)
+
+
+class RateLimiter:
+    def __init__(self, limits: dict):
+        self._limits  = limits
+        self._buckets = {}  # (key id, model) -> (requests bucket, tokens bucket)
+        self._strikes = {}  # model -> consecutive 429s without a retry-after
+        self._lock    = threading.Lock()
+        self.waiting   = 0  # callers currently sleeping for capacity
+        self.throttled = 0
+        self.waited    = 0.0
+
+    def _pair(self, model: str):
+        key = (API_KEY_ID, model)
+        if key not in self._buckets:
+            rpm, tpm = self._limits.get(model, DEFAULT_RATE_LIMIT)
+            self._buckets[key] = (TokenBucket(rpm), TokenBucket(tpm))
+        return self._buckets[key]
+
+    def reserve(self, model: str, tokens: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            requests, toks = self._pair(model)
+            return max(requests.reserve(1, now), toks.reserve(tokens, now))
+
+    def estimate_wait(self, model: str, tokens: int) -> float:
+        """Seconds a call of ~tokens would wait right now."""
+        with self._lock:
+            now = time.monotonic()
+            requests, toks = self._pair(model)
+            return max(requests.wait_for(1, now), toks.wait_for(tokens, now))
+
+    def _begin_wait(self, model: str, delay: float) -> None:
+        with self._lock:
+            self.waiting   += 1
+            self.throttled += 1
+            self.waited    += delay
+            depth = self.waiting
+        print(f"  [⏳ Pacing {model}: {delay:.1f}s, {depth} queued]", flush=True)
+
+    def _end_wait(self) -> None:
+        with self._lock:
+            self.waiting -= 1
+
+    def acquire(self, model: str, tokens: int) -> None:
+        delay = self.reserve(model, tokens)
+        if delay > 0:
+            self._begin_wait(model, delay)
+            try:
+                time.sleep(delay)
+            finally:
+                self._end_wait()
+
+    async def acquire_async(self, model: str, tokens: int) -> None:
+        delay = self.reserve(model, tokens)
+        if delay > 0:
+            self._begin_wait(model, delay)
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                self._end_wait()
+
+    def observe(self, model: str, headers) -> None:
+        """Update the buckets from x-ratelimit-* response headers."""
+        if not headers or headers.get("x-ratelimit-remaining-tokens") is None:
+            return
+
+        def num(name):
+            try:
+                return float(headers.get(name))
+            except (TypeError, ValueError):
+                return None
+
+        with self._lock:
+            now = time.monotonic()
+            requests, toks = self._pair(model)
+            # Groq's request limit is per day, its token limit per minute
+            requests.sync(num("x-ratelimit-limit-requests"), num("x-ratelimit-remaining-requests"),
+                          _parse_duration(headers.get("x-ratelimit-reset-requests")), now, per_minute=False)
+            toks.sync(num("x-ratelimit-limit-tokens"), num("x-ratelimit-remaining-tokens"),
+                      _parse_duration(headers.get("x-ratelimit-reset-tokens")), now, per_minute=True)
+            self._strikes.pop(model, None)
+
+    def penalize(self, model: str, error: Exception) -> float:
+        """Block the model after a 429 for retry-after seconds (or a growing backoff)."""
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        self.observe(model, headers)
+        retry_after = _parse_duration(headers.get("retry-after"))
+        with self._lock:
+            if not retry_after:
+                strikes = self._strikes[model] = self._strikes.get(model, 0) + 1
+                retry_after = min(2 ** strikes, 30)
+            now = time.monotonic()
+            for bucket in self._pair(model):
+                bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+        return retry_after
+
+    def describe(self) -> list:
+        with self._lock:
+            now = time.monotonic()
+            lines = []
+            for (_, model), (requests, toks) in self._buckets.items():
+                toks._refill(now)
+                lines.append(f"{model}: ~{max(toks.level, 0):.0f}/{toks.capacity:.0f} tokens/min")
+            return lines
+
+
+rate_limiter = RateLimiter(RATE_LIMITS)
+
+
+def _request_tokens(kwargs: dict) -> int:
+    return history_tokens(kwargs["messages"]) + _tools_tokens(kwargs)
+
+
+def _create(kwargs: dict, stream: bool = False):
+    """chat.completions.create paced by rate_limiter, which also reads the reply headers."""
+    rate_limiter.acquire(kwargs["model"], _request_tokens(kwargs))
+    count_model_call(kwargs["model"])
+    raw = client.chat.completions.with_raw_response.create(**kwargs, stream=stream)
+    rate_limiter.observe(kwargs["model"], raw.headers)
+    return raw.parse()
+
+
+async def _create_async(kwargs: dict):
+    await rate_limiter.acquire_async(kwargs["model"], _request_tokens(kwargs))
+    count_model_call(kwargs["model"])
+    raw = await aclient.chat.completions.with_raw_response.create(**kwargs)
+    rate_limiter.observe(kwargs["model"], raw.headers)
+    return await raw.parse()
 
 
 # ─────────────────────────────────────────
 # API WITH RETRY AND AUTO-FALLBACK
 # ─────────────────────────────────────────
-def call_api(messages: list, use_tools: bool = True, model: str = None, retries: int = 3):
-    """Call Groq API with automatic model fallback on errors."""
+class _StreamAssembler:
+    """Print text deltas as they arrive and assemble tool calls from fragments.
+
+    on_tool_call(tc, args) fires as soon as a call's arguments are complete,
+    in call order, so tools can start before the rest of the reply arrives.
+    result() returns an object shaped like a non-streaming response;
+    partial() the same, cut down to the calls already dispatched.
+    """
+
+    def __init__(self, on_tool_call=None):
+        self.on_tool_call  = on_tool_call
+        self.content       = []
+        self.calls         = {}
+        self.dispatched    = set()
+        self.finish_reason = None
+        self.first_chunk   = True
+        self.usage         = None
+
+    def feed(self, chunk) -> None:
+        if self.first_chunk:
+            print(" ✓")
+            self.first_chunk = False
+        x_groq = getattr(chunk, "x_groq", None)
+        if x_groq is not None and getattr(x_groq, "usage", None):
+            self.usage = x_groq.usage  # sent with the last chunk
+        if not chunk.choices:
+            return
+        choice = chunk.choices[0]
+        delta  = choice.delta
+
+        if delta.content:
+            if not self.content:
+                print("\n🤖 Agent: ", end="", flush=True)
+            print(delta.content, end="", flush=True)
+            self.content.append(delta.content)
+
+        for frag in delta.tool_calls or []:
+            tc = self.calls.setdefault(frag.index, SimpleNamespace(
+                id=None, type="function",
+                function=SimpleNamespace(name="", arguments=""),
+            ))
+            if frag.id:
+                tc.id = frag.id
+            if frag.function:
+                tc.function.name      += frag.function.name or ""
+                tc.function.arguments += frag.function.arguments or ""
+
+        if choice.finish_reason:
+            self.finish_reason = choice.finish_reason
+
+        if self.on_tool_call:
+            self._dispatch_complete()
+
+    def _dispatch_complete(self) -> None:
+        for i in sorted(self.calls):
+            if i in self.dispatched:
+                continue
+            tc = self.calls[i]
+            # Arguments are complete once they parse as JSON or the next call has started
+            try:
+                args = json.loads(tc.function.arguments)
+            except json.JSONDecodeError:
+                if not any(j > i for j in self.calls):
+                    break
+                args = {}
+            if not (tc.id and tc.function.name):
+                break
+            self.dispatched.add(i)
+            self.on_tool_call(tc, args if isinstance(args, dict) else {})
+
+    def result(self):
+        if self.content:
+            print("\n")
+        for tc in self.calls.values():
+            tc.function.arguments = tc.function.arguments or "{}"
+        message = SimpleNamespace(
+            content    = "".join(self.content) or None,
+            tool_calls = [self.calls[i] for i in sorted(self.calls)] or None,
+        )
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason=self.finish_reason)],
+                               usage=self.usage)
+
+    def partial(self):
+        """The reply so far, keeping only tool calls that were already started."""
+        self.calls = {i: tc for i, tc in self.calls.items() if i in self.dispatched}
+        self.finish_reason = "tool_calls"
+        return self.result()
+
+
+def _last_user(messages: list) -> str:
+    user_msgs = [m for m in messages if m["role"] == "user"]
+    return user_msgs[-1]["content"] if user_msgs else ""
+
+
+def _model_for(messages: list) -> str:
+    return choose_model(_last_user(messages))
+
+
+def _request_kwargs(messages: list, use_tools: bool, model: str, all_tools: bool = False) -> dict:
+    kwargs = {
+        "model":      model,
+        "messages":   messages,
+        "max_tokens": 4096,
+    }
+    if use_tools:
+        kwargs["tools"]       = select_tools(messages, all_tools)
+        kwargs["tool_choice"] = "auto"
+    return kwargs
+
+
+def _tools_tokens(kwargs: dict) -> int:
+    return estimate_tokens(json.dumps(kwargs["tools"])) if "tools" in kwargs else 0
+
+
+def _tools_label(kwargs: dict) -> str:
+    if "tools" not in kwargs:
+        return "tools: ❌"
+    if kwargs["tools"] is tools:
+        return "tools: ✅ all"
+    saved = _full_tools_tokens() - _tools_tokens(kwargs)
+    return f"tools: {len(kwargs['tools']) - 1}/{len(tools)}, -{saved} tok"
+
+
+def _retry_plan(e: Exception, model: str, attempt: int, retries: int):
+    """Decide how to recover from an API error.
+
+    Returns (model, seconds_to_wait) for the next attempt, or None to give up.
+    """
+    if isinstance(e, ReplayMiss):
+        return None
+    error_str = str(e).lower()
+    print(f"\n  [⚠️ Attempt {attempt+1}/{retries}: {str(e)[:80]}]")
+
+    # Rate limit - the limiter holds the model back, the next call waits for it
+    if "rate_limit" in error_str or "429" in error_str or "too many" in error_str:
+        blocked = rate_limiter.penalize(model, e)
+        if model == MODEL_SMART:
+            print(f"  [↩️ Switching to {MODEL_FAST}]")
+            return MODEL_FAST, 0
+        print(f"  [⏳ {model} rate limited for {blocked:.1f}s]")
+        return model, 0
+
+    # Tool use failed (only on this specific error, not generic "tool" string)
+    if "tool_use_failed" in error_str:
+        if attempt < retries - 1:
+            return model, 1
+
+    # Model unavailable
+    if "model" in error_str and ("not found" in error_str or "unavailable" in error_str):
+        if model == MODEL_SMART:
+            print(f"  [↩️ {MODEL_SMART} unavailable, using {MODEL_FAST}]")
+            return MODEL_FAST, 0
+
+    if attempt < retries - 1:
+        return model, 2
+    return None
+
+
+def call_api(messages: list, use_tools: bool = True, model: str = None, retries: int = 3,
+             stream: bool = None, on_tool_call=None):
+    """Call Groq API with automatic model fallback on errors.
+
+    With stream=True (default: STREAM_RESPONSES) text is printed as it arrives
+    and on_tool_call(tc, args) is called for each tool call as soon as its
+    arguments are complete. If the stream breaks after a tool was started,
+    the request is not retried (the retry would run the tools again): the
+    partial reply with the started calls is returned instead.
+    """
+    if stream is None:
+        stream = STREAM_RESPONSES
+    requested = model or keyword_model(_last_user(messages))
     if model is None:
-        user_msgs = [m for m in messages if m["role"] == "user"]
-        last_user = user_msgs[-1]["content"] if user_msgs else ""
-        model     = choose_model(last_user)
+        model = _model_for(messages)
+    all_tools = False
+    category  = task_category(messages)
 
     for attempt in range(retries):
+        assembler = None
         try:
-            kwargs = {
-                "model":      model,
-                "messages":   messages,
-                "max_tokens": 4096,
-            }
-            if use_tools:
-                kwargs["tools"]       = tools
-                kwargs["tool_choice"] = "auto"
-
-            print(f"  [🤖 {model} | tools: {'✅' if use_tools else '❌'}]", end="", flush=True)
-            response = client.chat.completions.create(**kwargs)
-            print(" ✓")
+            kwargs = _request_kwargs(messages, use_tools, model, all_tools)
+            kwargs["messages"] = messages[:] = compact_history(messages, model, _tools_tokens(kwargs))
+            print(f"  [🤖 {model} | {_tools_label(kwargs)}]", end="", flush=True)
+            cached = _cache_lookup(kwargs, requested)
+            if cached is not None:
+                model_router.note_route(messages, model, category)
+                return _cached_response(cached, stream)
+            started = time.monotonic()
+            if stream:
+                assembler = _StreamAssembler(on_tool_call)
+                for chunk in _create(kwargs, stream=True):
+                    assembler.feed(chunk)
+                response = assembler.result()
+            else:
+                response = _create(kwargs)
+                print(" ✓")
+            model_router.record_call(messages, model, category, time.monotonic() - started,
+                                     _usage_tokens(response, kwargs))
+            _cache_store(kwargs, response, requested)
             return response
 
         except Exception as e:
-            error_str = str(e).lower()
-            print(f"\n  [⚠️ Attempt {attempt+1}/{retries}: {str(e)[:80]}]")
-
-            # Rate limit
-            if "rate_limit" in error_str or "429" in error_str or "too many" in error_str:
-                if model == MODEL_SMART:
-                    print(f"  [↩️ Switching to {MODEL_FAST}]")
-                    model = MODEL_FAST
-                    continue
-                wait_time = min(2 ** attempt * 2, 30)
-                print(f"  [⏳ Waiting {wait_time}s...]")
-                time.sleep(wait_time)
-                continue
+            model_router.record_error(model, category, e)
+            if assembler is not None and assembler.dispatched:
+                model_router.note_route(messages, model, category)
+                print(f"\n  [⚠️ Stream broke after {len(assembler.dispatched)} tool call(s) started: "
+                      f"{str(e)[:80]} - keeping them]")
+                return assembler.partial()
+            plan = _retry_plan(e, model, attempt, retries)
+            if plan is None:
+                raise
+            model, wait_time = plan
+            # The model may have called a tool outside the subset - offer them all
+            all_tools = all_tools or "tool_use_failed" in str(e).lower()
+            time.sleep(wait_time)
+
+
+async def call_api_async(messages: list, use_tools: bool = True, model: str = None,
+                         retries: int = 3, tag: str = ""):
+    """Async twin of call_api on AsyncGroq, for sessions sharing one event loop.
+
+    Replies are not streamed: many sessions printing deltas at once would
+    interleave on the console.
+    """
+    requested = model or keyword_model(_last_user(messages))
+    if model is None:
+        model = _model_for(messages)
+    all_tools = False
+    category  = task_category(messages)
 
-            # Tool use failed (only on this specific error, not generic "tool" string)
-            if "tool_use_failed" in error_str:
-                if attempt < retries - 1:
-                    time.sleep(1)
-                    continue
-
-            # Model unavailable
-            if "model" in error_str and ("not found" in error_str or "unavailable" in error_str):
-                if model == MODEL_SMART:
-                    print(f"  [↩️ {MODEL_SMART} unavailable, using {MODEL_FAST}]")
-                    model = MODEL_FAST
-                    continue
-
-            if attempt < retries - 1:
-                time.sleep(2)
-                continue
-            raise
+    for attempt in range(retries):
+        try:
+            kwargs   = _request_kwargs(messages, use_tools, model, all_tools)
+            compact  = await asyncio.to_thread(compact_history, messages, model, _tools_tokens(kwargs))
+            kwargs["messages"] = messages[:] = compact
+            cached = _cache_lookup(kwargs, requested)
+            if cached is not None:
+                model_router.note_route(messages, model, category)
+                print(f"  [{tag}🤖 {model} | {_tools_label(kwargs)}]", end="")
+                return _cached_response(cached, stream=False)
+            started  = time.monotonic()
+            response = await _create_async(kwargs)
+            print(f"  [{tag}🤖 {model} | {_tools_label(kwargs)}] ✓")
+            model_router.record_call(messages, model, category, time.monotonic() - started,
+                                     _usage_tokens(response, kwargs))
+            _cache_store(kwargs, response, requested)
+            return response
+
+        except Exception as e:
+            model_router.record_error(model, category, e)
+            plan = _retry_plan(e, model, attempt, retries)
+            if plan is None:
+                raise
+            model, wait_time = plan
+            all_tools = all_tools or "tool_use_failed" in str(e).lower()
+            await asyncio.sleep(wait_time)
 
 
 def append_assistant(messages: list, msg) -> None:
@@ -1080,22 +3657,388 @@ def append_assistant(messages: list, msg) -> None:
 
 
 # ─────────────────────────────────────────
-# HISTORY MANAGEMENT
+# HISTORY MANAGEMENT - TOKEN BUDGET
 # ─────────────────────────────────────────
-MAX_MESSAGES = 50
-
+# Prompt budget (messages + tool schemas) per model. Kept well below the
+# context window: big prompts are slow and eat the tokens-per-minute quota.
+CONTEXT_BUDGET = {
+    MODEL_FAST:  16000,
+    MODEL_SMART: 24000,
+}
+DEFAULT_CONTEXT_BUDGET = 16000
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+
+
+def estimate_tokens(text: str) -> int:
+    """Fast local estimate: ~4 characters per token for English text and code."""
+    return (len(text) + 3) // 4
+
+
+def message_tokens(m: dict) -> int:
+    tokens = 4 + estimate_tokens(m.get("content") or "")  # role + framing
+    for tc in m.get("tool_calls") or []:
+        tokens += 8 + estimate_tokens(tc["function"]["name"] + tc["function"]["arguments"])
+    return tokens
+
+
+def history_tokens(messages: list) -> int:
+    return sum(message_tokens(m) for m in messages)
+
+
+def _evict_stale_tool_outputs(messages: list, budget: int) -> None:
+    """Shrink tool results the model has already answered, oldest first.
+
+    Results of the latest tool batch (after the last assistant message)
+    are kept: the model has not seen them yet.
+    """
+    last_assistant = max((i for i, m in enumerate(messages) if m["role"] == "assistant"), default=-1)
+    total = history_tokens(messages)
+    for i, m in enumerate(messages[:last_assistant]):
+        if total <= budget:
+            return
+        content = m.get("content") or ""
+        if m["role"] != "tool" or content.startswith("[evicted") or len(content) < 200:
+            continue
+        stub = f"[evicted stale tool output: {len(content)} chars]"
+        total -= estimate_tokens(content) - estimate_tokens(stub)
+        messages[i] = {**m, "content": stub}
+
+
+def _summarize(older: list) -> str:
+    """Condense older turns into a short note with the fast model."""
+    lines = []
+    for m in older:
+        content = (m.get("content") or "").strip()
+        content = content[:500] if m["role"] == "tool" else content[:2000]
+        for tc in m.get("tool_calls") or []:
+            content += f" [called {tc['function']['name']}({tc['function']['arguments'][:200]})]"
+        if content:
+            lines.append(f"{m['role'].upper()}: {content}")
+    kwargs = {
+        "model":      MODEL_FAST,
+        "max_tokens": 600,
+        "messages": [
+            {"role": "system", "content": (
+                "Summarize this conversation in under 250 words. Keep facts, numbers, "
+                "file paths, URLs, decisions and unfinished tasks. Drop small talk.")},
+            {"role": "user", "content": "\n".join(lines)},
+        ],
+    }
+    cached = _cache_lookup(kwargs)
+    if cached is not None:
+        return cached["content"].strip()
+    response = _create(kwargs)
+    _cache_store(kwargs, response)
+    return response.choices[0].message.content.strip()
+
+
+def compact_history(messages: list, model: str, reserved: int = 0) -> list:
+    """Fit the history into the model's token budget.
+
+    Stale tool outputs are evicted first. If that is not enough, older turns
+    (including any previous summary) are rolled into one summary written by
+    the fast model. As a last resort the oldest messages are dropped.
+    reserved is the part of the budget already taken, e.g. by tool schemas.
+    """
+    budget = CONTEXT_BUDGET.get(model, DEFAULT_CONTEXT_BUDGET) - reserved
+    if history_tokens(messages) <= budget:
+        return messages
 
-def trim_history(messages: list) -> list:
-    """Trim history to prevent context overflow."""
-    if len(messages) <= MAX_MESSAGES:
+    messages = list(messages)
+    _evict_stale_tool_outputs(messages, budget)
+    if history_tokens(messages) <= budget:
         return messages
-    system  = [m for m in messages if m["role"] == "system"]
-    rest    = [m for m in messages if m["role"] != "system"]
-    trimmed = rest[-(MAX_MESSAGES - len(system)):]
-    # Don't start with a tool response without a preceding tool call
-    while trimmed and trimmed[0]["role"] == "tool":
-        trimmed.pop(0)
-    return system + trimmed
+
+    def is_prompt(m):
+        return m["role"] == "system" and not m["content"].startswith(SUMMARY_PREFIX)
+    system = [m for m in messages if is_prompt(m)]
+    rest   = [m for m in messages if not is_prompt(m)]
+
+    # Keep recent messages worth about half the budget, starting at a user turn
+    cut, kept = len(rest), 0
+    while cut > 0 and kept + message_tokens(rest[cut - 1]) <= budget // 2:
+        cut  -= 1
+        kept += message_tokens(rest[cut])
+    user_starts = [i for i, m in enumerate(rest) if m["role"] == "user"]
+    cut = next((i for i in user_starts if i >= cut), user_starts[-1] if user_starts else cut)
+    older, recent = rest[:cut], rest[cut:]
+
+    if older:
+        try:
+            print(f"  [🗜️ Summarizing {len(older)} older messages]")
+            summary  = {"role": "system", "content": f"{SUMMARY_PREFIX}\n{_summarize(older)}"}
+            messages = system + [summary] + recent
+        except Exception as e:
+            print(f"  [⚠️ Summary failed: {str(e)[:80]}]")
+            messages = system + recent
+
+    # Last resort: drop the oldest messages, never starting on an orphaned tool result
+    while history_tokens(messages) > budget and len(messages) > len(system) + 1:
+        messages.pop(len(system))
+        while len(messages) > len(system) + 1 and messages[len(system)]["role"] == "tool":
+            messages.pop(len(system))
+    return messages
+
+
+# ─────────────────────────────────────────
+# TOOL SELECTION - PER-TURN SUBSETS
+# ─────────────────────────────────────────
+# Each request ships only the tool groups the current task needs: groups whose
+# keywords appear in the task, plus groups already used or requested for it.
+# A task with no keyword hit, request_tools("all") and a rejected tool call
+# all fall back to the full list.
+TOOL_GROUPS = {
+    "files":   {"read_file", "write_file", "list_files", "open_file", "delete_file",
+                "copy_file", "move_file", "create_directory"},
+    "browser": BROWSER_TOOLS,
+    "excel":   EXCEL_TOOLS,
+    "system":  {"run_command"},
+    "web":     {"read_webpage", "read_webpages"},
+}
+
+TOOL_GROUP_KEYWORDS = {
+    "files":   ["file", "folder", "director", "desktop", "save", "write", "copy", "move",
+                "delete", "remove", "rename", "path", ".txt", ".csv", ".json", ".py", ".html",
+                "document", "download"],
+    "browser": ["browser", "open ", "go to", "navigate", "click", "type ", "search", "google",
+                "screenshot", "website", "site", "page", "login", "log in", "form", "scroll",
+                "youtube", "http", "www.", ".com"],
+    "excel":   ["excel", "xlsx", "spreadsheet", "sheet", "workbook", "chart", "formula",
+                "cell", "table", "budget"],
+    "system":  ["run", "command", "cmd", "powershell", "ipconfig", "ping", "install", "pip ",
+                "process", "system", "network", "disk", "script"],
+    "web":     ["http", "www.", ".com", "url", "web", "page", "site", "fetch", "wikipedia",
+                "news", "article", "weather", "search"],
+}
+
+REQUEST_TOOLS_TOOL = {"type": "function", "function": {
+    "name": "request_tools",
+    "description": "Enable more tools for this task when the ones you need are not available. "
+                   "Groups: files, browser, excel, system, web, or all.",
+    "parameters": {"type": "object", "properties": {
+        "groups": {"type": "array", "items": {"type": "string",
+                   "enum": list(TOOL_GROUPS) + ["all"]}}},
+        "required": ["groups"]}}}
+
+tool_selection_stats = {"requests": 0, "subset": 0, "saved_tokens": 0}
+_full_tools_estimate = None
+
+
+def _full_tools_tokens() -> int:
+    global _full_tools_estimate
+    if _full_tools_estimate is None:
+        _full_tools_estimate = estimate_tokens(json.dumps(tools))
+    return _full_tools_estimate
+
+
+def request_tools(groups: list) -> str:
+    """Handled by select_tools on the next request; this only acknowledges."""
+    unknown = [g for g in groups if g not in TOOL_GROUPS and g != "all"]
+    if unknown:
+        return f"Unknown tool groups: {', '.join(unknown)}. Available: {', '.join(TOOL_GROUPS)}, all"
+    return f"Enabled tool groups: {', '.join(groups)}. They are available from the next step."
+
+
+def select_tool_groups(messages: list):
+    """Return the tool groups for the next request, or None for the full set."""
+    start = max((i for i, m in enumerate(messages) if m["role"] == "user"), default=None)
+    if start is None:
+        return None
+    task   = str(messages[start]["content"]).lower()
+    groups = {g for g, kws in TOOL_GROUP_KEYWORDS.items() if any(kw in task for kw in kws)}
+    if not groups:
+        return None
+
+    for m in messages[start + 1:]:
+        for tc in m.get("tool_calls") or []:
+            name = tc["function"]["name"]
+            if name != "request_tools":
+                groups.update(g for g, names in TOOL_GROUPS.items() if name in names)
+                continue
+            try:
+                wanted = json.loads(tc["function"]["arguments"] or "{}").get("groups") or ["all"]
+            except (json.JSONDecodeError, AttributeError):
+                wanted = ["all"]
+            if "all" in wanted:
+                return None
+            groups.update(g for g in wanted if g in TOOL_GROUPS)
+    return groups
+
+
+def select_tools(messages: list, all_tools: bool = False) -> list:
+    """Tool schemas for the next request. Records the prompt tokens saved."""
+    groups = None if all_tools else select_tool_groups(messages)
+    tool_selection_stats["requests"] += 1
+    if groups is None:
+        return tools
+    names  = set().union(*(TOOL_GROUPS[g] for g in groups))
+    subset = [t for t in tools if t["function"]["name"] in names] + [REQUEST_TOOLS_TOOL]
+    tool_selection_stats["subset"]       += 1
+    tool_selection_stats["saved_tokens"] += _full_tools_tokens() - estimate_tokens(json.dumps(subset))
+    return subset
+
+
+# ─────────────────────────────────────────
+# MODEL ROUTER - LIVE TELEMETRY
+# ─────────────────────────────────────────
+# Per model and task type (excel / browser / web / files / system / general)
+# the router keeps moving averages of latency, tokens, API errors and failed
+# tool calls, persisted across restarts. choose_model's keyword pick stands
+# until the numbers say the other model is clearly more reliable, or much
+# faster once rate-limit waits are counted.
+ROUTER_STATS_PATH   = os.path.join(os.path.expanduser("~"), ".groqagent", "router_stats.json")
+ROUTER_MIN_SAMPLES  = 5     # calls per model and task type before measurements count
+ROUTER_EWMA         = 0.2   # weight of the newest sample
+ROUTER_MIN_SUCCESS  = 0.6   # below this a model is steered away from a task type
+ROUTER_SLOW_MARGIN  = 15.0  # seconds the keyword pick may lag behind the other model
+TASK_CATEGORIES     = ["excel", "browser", "web", "files", "system"]  # first match wins
+# Tool results that count as failed: the error texts ToolResultCache won't cache,
+# "<X> error: ...", misses ("... not found"), timeouts and missing dependencies
+TOOL_FAILURE        = re.compile("^(?:" + "|".join(map(re.escape, ERROR_PREFIXES)) +
+                                 r"|❌|Unknown |Not found\b|Timeout\b|Timed out\b|No URLs given"
+                                 r"|[\w ()]{1,30} (?:error|not found)\b|[\w ]{1,30} not available\b)")
+
+
+def task_category(messages) -> str:
+    """Task type of the latest user turn (messages list or plain text)."""
+    text = messages
+    if isinstance(messages, list):
+        users = [m for m in messages if m["role"] == "user"]
+        text  = users[-1]["content"] if users else ""
+    text = str(text).lower()
+    return next((c for c in TASK_CATEGORIES
+                 if any(kw in text for kw in TOOL_GROUP_KEYWORDS[c])), "general")
+
+
+def _usage_tokens(response, kwargs: dict) -> int:
+    usage = getattr(response, "usage", None)
+    if usage is not None and getattr(usage, "total_tokens", None):
+        return usage.total_tokens
+    return _request_tokens(kwargs)
+
+
+class ModelRouter:
+    def __init__(self, path: str):
+        self.path   = path
+        self._lock  = threading.Lock()
+        self._routes = {}  # id(messages) -> (model, category) of the call whose tools run next
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.stats = json.load(f)
+        except (OSError, ValueError):
+            self.stats = {}
+
+    def _entry(self, model: str, category: str) -> dict:
+        return self.stats.setdefault(f"{model}|{category}", {
+            "calls": 0, "errors": 0, "tool_use_failed": 0, "rate_limited": 0,
+            "error_rate": 0.0, "latency": 0.0, "tokens": 0.0,
+            "tool_ok": 0, "tool_failed": 0, "tool_fail_rate": 0.0,
+        })
+
+    @staticmethod
+    def _ewma(entry: dict, field: str, value: float, first: bool) -> None:
+        entry[field] = value if first else (1 - ROUTER_EWMA) * entry[field] + ROUTER_EWMA * value
+
+    def _save(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.stats, f, indent=1)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass  # telemetry must never break a task
+
+    def note_route(self, messages: list, model: str, category: str) -> None:
+        # Every model call notes its route, so an id reused by a new list is
+        # overwritten before its first record_tools; replies without tool
+        # calls never pop theirs, hence the bound
+        self._routes.pop(id(messages), None)
+        self._routes[id(messages)] = (model, category)
+        while len(self._routes) > 256:
+            self._routes.pop(next(iter(self._routes)))
+
+    def record_call(self, messages: list, model: str, category: str, latency: float, tokens: int) -> None:
+        with self._lock:
+            e = self._entry(model, category)
+            first = e["calls"] == 0
+            e["calls"] += 1
+            self._ewma(e, "latency", latency, first)
+            self._ewma(e, "tokens", tokens, first)
+            self._ewma(e, "error_rate", 0.0, first)
+            self.note_route(messages, model, category)
+            self._save()
+
+    def record_error(self, model: str, category: str, error: Exception) -> None:
+        if isinstance(error, ReplayMiss):
+            return
+        text = str(error).lower()
+        with self._lock:
+            e = self._entry(model, category)
+            first = e["calls"] == 0
+            e["calls"]  += 1
+            e["errors"] += 1
+            if "tool_use_failed" in text:
+                e["tool_use_failed"] += 1
+            if "rate_limit" in text or "429" in text:
+                e["rate_limited"] += 1
+            else:  # being throttled says nothing about the model's competence
+                self._ewma(e, "error_rate", 1.0, first)
+            self._save()
+
+    def record_tools(self, messages: list, results: list) -> None:
+        """Count failed tool calls against the model that asked for them."""
+        route = self._routes.pop(id(messages), None)
+        if route is None or not results:
+            return
+        with self._lock:
+            e = self._entry(*route)
+            for result in results:
+                failed = bool(TOOL_FAILURE.match(str(result)))
+                first  = e["tool_ok"] + e["tool_failed"] == 0
+                e["tool_failed" if failed else "tool_ok"] += 1
+                self._ewma(e, "tool_fail_rate", 1.0 if failed else 0.0, first)
+            self._save()
+
+    def reliability(self, model: str, category: str):
+        """Share of calls that neither errored nor produced failing tool calls, or None if unknown."""
+        e = self.stats.get(f"{model}|{category}")
+        if not e or e["calls"] < ROUTER_MIN_SAMPLES:
+            return None
+        return (1 - e["error_rate"]) * (1 - e["tool_fail_rate"])
+
+    def expected_seconds(self, model: str, category: str) -> float:
+        e = self.stats.get(f"{model}|{category}") or {}
+        return rate_limiter.estimate_wait(model, int(e.get("tokens") or 2000)) + e.get("latency", 0.0)
+
+    def route(self, model: str, user_message: str, smart_left: bool) -> str:
+        other = MODEL_FAST if model == MODEL_SMART else MODEL_SMART
+        if other == MODEL_SMART and not smart_left:
+            return model
+        category = task_category(user_message)
+        mine, theirs = self.reliability(model, category), self.reliability(other, category)
+
+        if mine is not None and mine < ROUTER_MIN_SUCCESS and (theirs is None or theirs > mine + 0.15):
+            print(f"  [🧭 Router: {category} tasks succeed {mine:.0%} on {model} → {other}]")
+            return other
+        slower = self.expected_seconds(model, category) - self.expected_seconds(other, category)
+        if slower > ROUTER_SLOW_MARGIN and (theirs or 0) >= (mine if mine is not None else 1) - 0.1:
+            print(f"  [🧭 Router: {model} ~{slower:.0f}s slower right now → {other}]")
+            return other
+        return model
+
+    def describe(self) -> list:
+        lines = []
+        for key, e in sorted(self.stats.items()):
+            tools_total = e["tool_ok"] + e["tool_failed"]
+            lines.append(
+                f"{key.replace('|', ' / ')}: {e['calls']} calls, {e['error_rate']:.0%} errors, "
+                f"{e['tool_failed']}/{tools_total} tool calls failed, "
+                f"{e['latency']:.1f}s, ~{e['tokens']:.0f} tok")
+        return lines
+
+
+model_router = ModelRouter(ROUTER_STATS_PATH)
 
 
 # ─────────────────────────────────────────
@@ -1106,8 +4049,8 @@ SYSTEM_PROMPT = f"""You are an advanced AI assistant with full access to a Windo
 AVAILABLE TOOLS (ALWAYS USE THEM when a task requires it):
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 📁 FILES: read_file, write_file, list_files, open_file, delete_file, copy_file, move_file, create_directory
-🌐 BROWSER: browser_goto, browser_click, browser_type, browser_get_text, browser_screenshot, browser_get_links, browser_scroll, browser_press_key, browser_wait, browser_current_url, browser_go_back, browser_eval_js
-🔗 WEB: read_webpage (fast HTTP fetch without browser)
+🌐 BROWSER: browser_goto, browser_snapshot, browser_click, browser_type, browser_get_text, browser_screenshot, browser_get_links, browser_scroll, browser_press_key, browser_wait_for, browser_wait, browser_current_url, browser_go_back, browser_eval_js, browser_open_many, browser_set_profile
+🔗 WEB: read_webpage, read_webpages (fast HTTP fetch without browser; read_webpages takes many URLs at once)
 📊 EXCEL: create_excel, read_excel, edit_excel_cell, add_excel_formula, add_excel_chart, add_excel_sheet, excel_add_rows, excel_style_range
 ⚙️ SYSTEM: run_command
 
@@ -1127,14 +4070,151 @@ TOOL REMINDERS:
 - add_excel_chart   → adds charts (bar/line/pie) to an existing file
 - write_file        → creates any text file (txt, html, csv...)
 - run_command       → runs CMD/PowerShell commands
+- browser_snapshot  → numbered list of clickable/typeable elements; click/type with its refs (e.g. browser_click("e12")) instead of guessing selectors
+- browser_get_text(diff=true) → after click/type/scroll, returns only what changed on the page since you last read it
+- browser_wait_for  → waits for an element, text, URL change, network idle or a quiet DOM; use it instead of browser_wait
+- browser_open_many → loads several URLs at once (compare products, skim search results)
+- read_webpages    → fetches many URLs in one call ("summarize these articles") instead of one read_webpage per URL
+- browser_set_profile → the browser starts headless without images; switch to "visible" when the user wants to watch or needs images in a screenshot
 
 Desktop path: {DESKTOP}
 """
 
+# ─────────────────────────────────────────
+# ASYNC CORE - MANY SESSIONS IN ONE PROCESS
+# ─────────────────────────────────────────
+# Network-bound tools have native async versions. Browser, file and Excel
+# tools go through tool_executor: sync Playwright is bound to its own thread
+# and local file I/O is short, so sessions share those workers instead of
+# owning a thread each.
+ASYNC_TOOL_MAP = {
+    "read_webpage":  lambda a: read_webpage_async(a["url"]),
+    "read_webpages": lambda a: read_webpages_async(a["urls"]),
+    "run_command":   lambda a: run_command_async(a["command"]),
+}
+
+
+async def handle_tool_call_async(name: str, args: dict, session: str = None) -> str:
+    if name in ASYNC_TOOL_MAP:
+        preview = ", ".join(f"{k}={repr(v)[:50]}" for k, v in args.items())
+        print(f"  [🔧 {name}({preview})]")
+        if screenshot_writer.pending:
+            await asyncio.to_thread(screenshot_writer.wait_for, tool_resources(name, args))
+        if name in READ_ONLY_TOOLS:
+            return await tool_cache.acall(name, args, ASYNC_TOOL_MAP[name])
+        result = await ASYNC_TOOL_MAP[name](args)
+        tool_cache.invalidate(name, args)
+        return result
+    return await asyncio.wrap_future(tool_executor.submit(name, args, session))
+
+
+async def run_tool_calls_async(calls: list, session: str = None) -> list:
+    """Run (name, args) pairs concurrently; calls sharing a resource keep their order.
+
+    A tool that raises yields its error text instead, so one bad call never
+    leaves the assistant's other tool calls without a result.
+    """
+    tasks = []
+
+    async def run_after(deps, name, args):
+        if deps:
+            await asyncio.wait(deps)
+        return await handle_tool_call_async(name, args, session)
+
+    for name, args in calls:
+        keys = tool_resources(name, args)
+        deps = [t for k, t in tasks if _resources_conflict(keys, k)]
+        tasks.append((keys, asyncio.ensure_future(run_after(deps, name, args))))
+    results = await asyncio.gather(*(t for _, t in tasks), return_exceptions=True)
+    return [f"Tool error ({name}): {r}" if isinstance(r, Exception) else r
+            for (name, _), r in zip(calls, results)]
+
+
+class AgentSession:
+    """One conversation with its own history and browser page, driven on the
+    shared event loop."""
+
+    def __init__(self, name: str):
+        self.name     = name
+        self.messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+
+    async def ask(self, user_input: str) -> str:
+        self.messages.append({"role": "user", "content": user_input})
+        tag = f"{self.name} "
+
+        for _ in range(MAX_ITERATIONS):
+            response = await call_api_async(self.messages, tag=tag)
+            msg      = response.choices[0].message
+            append_assistant(self.messages, msg)
+
+            if not msg.tool_calls:
+                return msg.content or ""
+
+            calls = []
+            for tc in msg.tool_calls:
+                try:
+                    args = json.loads(tc.function.arguments)
+                except json.JSONDecodeError:
+                    args = {}
+                calls.append((tc.function.name, args))
+
+            results = await run_tool_calls_async(calls, self.name)
+            model_router.record_tools(self.messages, results)
+            for tc, result in zip(msg.tool_calls, results):
+                result_str = str(result)
+                if len(result_str) > 8000:
+                    result_str = result_str[:8000] + "\n[... truncated]"
+                self.messages.append({
+                    "role":         "tool",
+                    "tool_call_id": tc.id,
+                    "content":      result_str,
+                })
+
+        return f"⚠️ Reached iteration limit ({MAX_ITERATIONS})."
+
+
+async def run_batch(tasks: list) -> list:
+    """Run each task in its own session, all multiplexed on one event loop."""
+    sessions = [AgentSession(f"#{i+1}") for i in range(len(tasks))]
+
+    async def run_one(session, task):
+        try:
+            return await session.ask(task)
+        except Exception as e:
+            return f"❌ Error: {e}"
+        finally:
+            await asyncio.wrap_future(tool_executor.submit_to_browser_thread(
+                lambda: close_session_page(session.name)))
+
+    try:
+        return list(await asyncio.gather(*(run_one(s, t) for s, t in zip(sessions, tasks))))
+    finally:
+        await http_client.aclose()
+
+
 # ─────────────────────────────────────────
 # MAIN LOOP
 # ─────────────────────────────────────────
+MAX_ITERATIONS = 25
+
+# Extractor benchmark: python agent_ai.py --bench-extract bench/pages/ [rounds]
+if len(sys.argv) > 2 and sys.argv[1] == "--bench-extract":
+    print(benchmark_extractors(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 5))
+    sys.exit(0)
+
+# Batch mode: python agent_ai.py --batch tasks.txt (one task per line)
+if len(sys.argv) > 2 and sys.argv[1] == "--batch":
+    with open(sys.argv[2], "r", encoding="utf-8") as f:
+        batch_tasks = [line.strip() for line in f if line.strip()]
+    print(f"\n🚀 Running {len(batch_tasks)} sessions concurrently...\n")
+    prewarm_browser()
+    for i, (task, reply) in enumerate(zip(batch_tasks, asyncio.run(run_batch(batch_tasks)))):
+        print(f"━━━ #{i+1}: {task}\n🤖 {reply}\n")
+    tool_executor.run_in_browser_thread(close_browser)
+    sys.exit(0)
+
 messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+prewarm_browser()  # launches while the user types the first task
 
 print()
 print("╔══════════════════════════════════════════════════════╗")
@@ -1164,12 +4244,14 @@ while True:
         user_input = input("👤 You: ").strip()
     except (KeyboardInterrupt, EOFError):
         print("\n\n👋 Goodbye!")
-        close_browser()
+        tool_executor.run_in_browser_thread(close_browser)
+        http_client.close()
         break
 
     if user_input.lower() in ("exit", "quit"):
         print("👋 Goodbye!")
-        close_browser()
+        tool_executor.run_in_browser_thread(close_browser)
+        http_client.close()
         break
 
     if user_input.lower() in ("reset", "clear"):
@@ -1180,37 +4262,64 @@ while True:
     if user_input.lower() in ("status", "stats"):
         print(f"\n📊 Status:")
         print(f"  Smart calls today  : {_smart_calls_today}/{_MAX_SMART_CALLS}")
-        print(f"  Messages in history: {len(messages)}")
-        print(f"  Browser            : {'open (' + _page.url + ')' if _page else 'closed'}\n")
+        print(f"  Messages in history: {len(messages)} (~{history_tokens(messages)} tokens)")
+        print(f"  Tool result cache  : {tool_cache.hits} hits / {tool_cache.misses} misses")
+        print(f"  Rate limiter       : {rate_limiter.waiting} queued | {rate_limiter.throttled} calls paced, "
+              f"{rate_limiter.waited:.1f}s waited")
+        for line in rate_limiter.describe():
+            print(f"    {line}")
+        print(f"  Model router       : {ROUTER_STATS_PATH}")
+        for line in model_router.describe():
+            print(f"    {line}")
+        print(f"  Tool selection     : {tool_selection_stats['subset']}/{tool_selection_stats['requests']} "
+              f"requests with a subset, ~{tool_selection_stats['saved_tokens']} prompt tokens saved")
+        if response_cache:
+            print(f"  Response cache     : {LLM_CACHE_MODE} | {response_cache.count()} entries | "
+                  f"{response_cache.hits} hits / {response_cache.misses} misses")
+        print(f"  HTTP               : {http_client.describe()}")
+        if page_cache:
+            print(f"  Page cache         : {page_cache.describe()}")
+        print(f"  Screenshots        : {screenshot_writer.written} written "
+              f"({screenshot_writer.write_ms / max(screenshot_writer.written, 1):.0f} ms avg), "
+              f"{screenshot_writer.pending} pending, {screenshot_writer.failed} failed")
+        print(f"  Browser            : {'open (' + _page.url + ')' if _page else 'closed'} | "
+              f"profile {BROWSER_PROFILE}: {_describe_profile()} | {blocked_requests} requests blocked\n")
         continue
 
     if not user_input:
         continue
 
     messages.append({"role": "user", "content": user_input})
-    messages = trim_history(messages)
 
     try:
-        MAX_ITERATIONS = 25
-        iteration      = 0
+        iteration = 0
 
         while iteration < MAX_ITERATIONS:
             iteration += 1
-            response      = call_api(messages)
+            started       = {}  # tool_call_id -> future, for calls dispatched mid-stream
+            response      = call_api(messages, on_tool_call=lambda tc, args: started.__setitem__(
+                                tc.id, tool_executor.submit(tc.function.name, args)))
             msg           = response.choices[0].message
             finish_reason = response.choices[0].finish_reason
 
             append_assistant(messages, msg)
 
-            # Model wants to use tools
+            # Model wants to use tools - independent calls run in parallel
             if msg.tool_calls:
+                futures = []
                 for tc in msg.tool_calls:
+                    if tc.id in started:
+                        futures.append(started[tc.id])
+                        continue
                     try:
                         args = json.loads(tc.function.arguments)
                     except json.JSONDecodeError:
                         args = {}
+                    futures.append(tool_executor.submit(tc.function.name, args))
 
-                    result     = handle_tool_call(tc.function.name, args)
+                results = [future.result() for future in futures]
+                model_router.record_tools(messages, results)
+                for tc, result in zip(msg.tool_calls, results):
                     result_str = str(result)
                     if len(result_str) > 8000:
                         result_str = result_str[:8000] + "\n[... truncated]"
@@ -1222,8 +4331,8 @@ while True:
                     })
                 continue  # loop back so model processes tool results
 
-            # Model replied with text
-            if msg.content:
+            # Model replied with text (already printed while streaming)
+            if msg.content and not STREAM_RESPONSES:
                 print(f"\n🤖 Agent: {msg.content}\n")
             break
 
@@ -10,10 +10,18 @@ os.environ["PYTHONIOENCODING"] = "utf-8"
 # ─────────────────────────────────────────
 # STANDARD IMPORTS
 # ─────────────────────────────────────────
+import re
 import json
 import time
-import urllib.request
+import difflib
+import hashlib
+import sqlite3
+import codecs
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from html.parser import HTMLParser
+from email.utils import parsedate_tz, mktime_tz
 from datetime import datetime, date
 
 # ─────────────────────────────────────────
@@ -21,9 +29,10 @@ from datetime import datetime, date
 # ─────────────────────────────────────────
 from google import genai
 from google.genai import types
+import httpx  # installed with google-genai
 
 API_KEY = ""  # ← PASTE YOUR GOOGLE AI STUDIO KEY HERE
-client  = genai.Client(api_key=API_KEY)
+client  = genai.Client(api_key=API_KEY)  # client.aio is the async twin (--batch)
 
 # ─────────────────────────────────────────
 # MODELS - DUAL STRATEGY
@@ -31,16 +40,15 @@ client  = genai.Client(api_key=API_KEY)
 MODEL_FAST  = "gemini-2.0-flash"
 MODEL_SMART = "gemini-2.5-pro"
 
+STREAM_RESPONSES = True  # print text as it arrives, start tools before the turn ends
+
 _smart_calls_today = 0
 _smart_calls_date  = date.today()
 _MAX_SMART_CALLS   = 100
 
 
-def choose_model(user_message: str) -> str:
-    global _smart_calls_today, _smart_calls_date
-    if date.today() != _smart_calls_date:
-        _smart_calls_today = 0
-        _smart_calls_date  = date.today()
+def keyword_model(user_message: str) -> str:
+    """The model the task's wording asks for, before quota and measurements."""
     msg = user_message.lower()
     simple  = ["open","click","type","screenshot","save","read","scroll",
                "wait","close","show","list","go to","navigate","press"]
@@ -50,13 +58,26 @@ def choose_model(user_message: str) -> str:
                 "table","chart","graph","following","perform"]
     is_simple  = any(k in msg for k in simple)
     is_complex = any(k in msg for k in complex_) or len(user_message) > 200
-    if is_complex and _smart_calls_today < _MAX_SMART_CALLS:
-        _smart_calls_today += 1; return MODEL_SMART
-    if is_simple and not is_complex:
-        return MODEL_FAST
-    if _smart_calls_today < _MAX_SMART_CALLS:
-        _smart_calls_today += 1; return MODEL_SMART
-    return MODEL_FAST
+    return MODEL_FAST if is_simple and not is_complex else MODEL_SMART
+
+
+def choose_model(user_message: str) -> str:
+    global _smart_calls_today, _smart_calls_date
+    if date.today() != _smart_calls_date:
+        _smart_calls_today = 0
+        _smart_calls_date  = date.today()
+    model = keyword_model(user_message)
+    if LLM_CACHE_MODE == "replay": return model  # replays pick what the recording asked for, whatever the stats say
+    smart_left = _smart_calls_today < _MAX_SMART_CALLS
+    model = model if smart_left else MODEL_FAST
+    return model_router.route(model, user_message, smart_left)  # measurements can overrule keywords
+
+
+def count_model_call(model):
+    """Charge a request that actually goes out to the daily smart budget (cache/replay hits cost nothing)."""
+    global _smart_calls_today, _smart_calls_date
+    if date.today() != _smart_calls_date: _smart_calls_today, _smart_calls_date = 0, date.today()
+    if model == MODEL_SMART: _smart_calls_today += 1
 
 
 # ─────────────────────────────────────────
@@ -86,7 +107,63 @@ except ImportError:
 # CONFIG
 # ─────────────────────────────────────────
 DESKTOP = os.path.join(os.path.expanduser("~"), "Desktop")
-_playwright = _browser = _page = None
+_playwright = _browser = _context = _page = None  # _page: the "active" page of the single-page tools
+_session_pages = {}                 # --batch session name -> its own page
+_browser_owner = threading.local()  # .session: whose browser tool is running
+BROWSER_POOL_SIZE = 4   # pages _browser_open_many loads side by side
+MAX_OPEN_MANY     = 12  # URLs per browser_open_many call
+
+# Browser performance profiles: "fast" = headless, no slow_mo, images/media/fonts/trackers
+# aborted; "visible" = shown window, full rendering; "debug" = visible and slowed down.
+BROWSER_PROFILES = {
+    "fast":    {"headless": True,  "slow_mo": 0,   "block": True},
+    "visible": {"headless": False, "slow_mo": 0,   "block": False},
+    "debug":   {"headless": False, "slow_mo": 100, "block": False},
+}
+BROWSER_PROFILE = os.environ.get("AGENT_BROWSER_PROFILE", "fast").lower()
+if BROWSER_PROFILE not in BROWSER_PROFILES: BROWSER_PROFILE = "fast"
+# Cookies, localStorage and the disk cache persist here ("" = throwaway profile); the browser
+# is launched in the background at startup so the first browser tool doesn't pay for it.
+BROWSER_USER_DATA = os.environ.get("AGENT_BROWSER_DATA",
+                                   os.path.join(os.path.expanduser("~"), ".geminiagent", "browser_profile"))
+BROWSER_PREWARM   = os.environ.get("AGENT_BROWSER_PREWARM", "1") != "0"
+BLOCKED_RESOURCE_TYPES = {"image","media","font"}
+TRACKER_DOMAINS = ("doubleclick.net","googlesyndication.com","google-analytics.com","googletagmanager.com",
+                   "googleadservices.com","facebook.net","connect.facebook.com","scorecardresearch.com",
+                   "hotjar.com","adnxs.com","criteo.com","taboola.com","outbrain.com","amazon-adsystem.com")
+blocked_requests = 0
+
+# Condition-based waits: interactive tools return once a new document has loaded
+# or the DOM has gone quiet for ACTION_QUIET_MS, instead of sleeping a fixed time.
+ACTION_QUIET_MS, ACTION_SETTLE_MS = 150, 2000  # quiet window / give-up limit after an action
+WAIT_FOR_TIMEOUT = 10000  # default browser_wait_for timeout (ms)
+NETWORK_QUIET_MS = 500    # default quiet window for network_idle
+
+# click/type locator strategies are raced, and the winner per (domain, selector) is kept on disk
+LOCATE_TIMEOUT      = 3000  # ms all strategies share before "not found"
+SELECTOR_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".geminiagent", "selector_cache.json")
+TEXT_CHUNK = 6000  # chars browser_get_text returns per call
+PAGE_OBSERVATIONS = 20  # pages whose last text browser_get_text(diff=True) compares against
+SCREENSHOT_MAX_HEIGHT, SCREENSHOT_JPEG_QUALITY = 10000, 80  # taller full pages are split into tiles
+LINKS_PAGE = 40  # links browser_get_links returns per call
+SNAPSHOT_MAX_ELEMENTS = 150  # interactive elements listed by browser_snapshot
+# Plain web fetches share one keep-alive pool (connections + TLS sessions reused per host,
+# gzip/deflate/br bodies decompressed)
+HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT = 5, 15  # s to connect / between bytes
+HTTP_MAX_CONNECTIONS, HTTP_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY = 20, 10, 30  # open / idle kept / idle seconds
+HTTP_CHUNK = 16384  # bytes handed to the extractor at a time
+# read_webpage streams into the extractor and stops downloading at READ_SCAN_CHARS of text or READ_MAX_BYTES
+READ_TEXT_CHARS, READ_MAX_BYTES = 8000, 5 * 1024 * 1024
+READ_SCAN_CHARS = 4 * READ_TEXT_CHARS  # text seen before stopping: enough to pick the main content
+# Extracted pages stay on disk across sessions: fresh ones (max-age / Expires) are served without a request,
+# stale ones revalidated with If-None-Match / If-Modified-Since; least recently used go first past the size cap
+# AGENT_HTTP_CACHE=off turns it off; the file is only created on first use
+HTTP_DISK_CACHE = os.environ.get("AGENT_HTTP_CACHE", "on").lower() != "off"
+HTTP_DISK_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".geminiagent", "http_cache.sqlite")
+HTTP_DISK_CACHE_MAX_BYTES = 20 * 1024 * 1024
+HTTP_HEURISTIC_MAX_AGE = 24 * 3600  # cap for pages with only Last-Modified (10% of their age)
+# read_webpages: URLs per call, pages fetched at once, requests per host, text budget shared by the batch
+WEB_BATCH_MAX, WEB_BATCH_WORKERS, WEB_PER_HOST, WEB_BATCH_CHARS = 20, 8, 2, 24000
 
 
 def fix_path(p: str) -> str:
@@ -96,23 +173,169 @@ def fix_path(p: str) -> str:
 # ─────────────────────────────────────────
 # BROWSER HELPERS
 # ─────────────────────────────────────────
+def _is_tracker(url):
+    host = url.split("://", 1)[-1].split("/", 1)[0].split(":", 1)[0].lower()
+    return any(host == d or host.endswith("." + d) for d in TRACKER_DOMAINS)
+
+def _route_filter(route):
+    global blocked_requests
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES or _is_tracker(route.request.url):
+        blocked_requests += 1; route.abort()
+    else: route.continue_()
+
+def _get_context():
+    global _playwright, _browser, _context
+    if _context is None:
+        profile     = BROWSER_PROFILES[BROWSER_PROFILE]
+        options     = {"headless": profile["headless"], "slow_mo": profile["slow_mo"]}
+        viewport    = {"width": 1280, "height": 800}
+        _playwright = sync_playwright().start()
+        if BROWSER_USER_DATA:
+            try: _context = _playwright.chromium.launch_persistent_context(BROWSER_USER_DATA, viewport=viewport, **options)
+            except Exception as e:  # e.g. the profile is in use by another agent process
+                print(f"  [⚠️  Browser profile unavailable ({str(e).splitlines()[0][:80]}), using a temporary one]")
+        if _context is None:
+            _browser = _playwright.chromium.launch(**options); _context = _browser.new_context(viewport=viewport)
+        if profile["block"]: _context.route("**/*", _route_filter)
+    return _context
+
+
+def _watch_page(page):
+    _track_network(page); page.on("framenavigated", _on_navigated)
+    return page
+
 def get_page():
-    global _playwright, _browser, _page
+    global _page
+    session = getattr(_browser_owner, "session", None)
+    if session is not None:
+        page = _session_pages.get(session)
+        if page is None or page.is_closed():
+            page = _session_pages[session] = _watch_page(_get_context().new_page())
+        return page
     if _page is None:
-        _playwright = sync_playwright().start()
-        _browser    = _playwright.chromium.launch(headless=False, slow_mo=100)
-        _page       = _browser.new_page()
-        _page.set_viewport_size({"width": 1280, "height": 800})
+        context = _get_context()
+        free = [p for p in context.pages  # persistent: blank tab
+                if p not in page_pool and p not in _session_pages.values() and not p.is_closed()]
+        _page = _watch_page(free[0] if free else context.new_page())
     return _page
 
+def close_session_page(session):
+    """Close the page of a finished --batch session (browser thread only)."""
+    page = _session_pages.pop(session, None)
+    if page is not None:
+        _net_activity.pop(page, None)
+        try: page.close()
+        except: pass
+
+_page_version = 0  # bumped on navigation and after actions; browser_snapshot's cache key
+
+def _page_changed():
+    global _page_version
+    _page_version += 1
+
+def _on_navigated(frame):
+    if frame.parent_frame is None: _page_changed()  # iframes navigating don't replace the page
+
+def prewarm_browser():
+    """Launch the browser on the browser thread in the background."""
+    if not (PLAYWRIGHT_AVAILABLE and BROWSER_PREWARM): return
+    def warm():
+        try: get_page()
+        except Exception as e: print(f"  [⚠️  Browser pre-launch failed: {e}]")
+    tool_executor.submit_to_browser_thread(warm)
+
+
+_net_activity = {}  # page -> [requests in flight, monotonic time of the last start/end]
+
+def _track_network(page):
+    state = _net_activity[page] = [0, time.monotonic()]
+    def started(_): state[0] += 1; state[1] = time.monotonic()
+    def ended(_): state[0] = max(0, state[0] - 1); state[1] = time.monotonic()
+    page.on("request", started); page.on("requestfinished", ended); page.on("requestfailed", ended)
+
+# Resolves once no node was added/removed/retexted for `quiet` ms (or after `limit` ms).
+# Attribute changes are ignored: animations rewrite styles non-stop.
+_DOM_SETTLE_JS = """([quiet, limit]) => new Promise(resolve => {
+    const start = performance.now(); let last = start;
+    const obs = new MutationObserver(() => { last = performance.now(); });
+    obs.observe(document, {subtree: true, childList: true, characterData: true});
+    const tick = () => {
+        const now = performance.now();
+        if (now - last >= quiet || now - start >= limit) { obs.disconnect(); resolve(now - last >= quiet); }
+        else setTimeout(tick, Math.min(50, quiet));
+    };
+    setTimeout(tick, Math.min(50, quiet));
+})"""
+
+def _wait_dom_settled(page, quiet_ms, timeout_ms):
+    return bool(page.evaluate(_DOM_SETTLE_JS, [quiet_ms, timeout_ms]))
+
+def _wait_network_idle(page, quiet_ms, timeout_ms):
+    state = _net_activity.get(page)
+    if state is None: page.wait_for_load_state("networkidle", timeout=timeout_ms); return True
+    deadline = time.monotonic() + timeout_ms / 1000
+    while time.monotonic() < deadline:
+        if state[0] == 0 and time.monotonic() - state[1] >= quiet_ms / 1000: return True
+        page.wait_for_timeout(50)  # lets Playwright deliver the request events
+    return False
+
+def _after_action(page, url_before):
+    """Navigation (URL changed / settle script's document gone) waits for domcontentloaded;
+    otherwise the DOM only has to go quiet."""
+    _page_changed()
+    try:
+        if page.url == url_before:
+            _wait_dom_settled(page, ACTION_QUIET_MS, ACTION_SETTLE_MS)
+            if page.url == url_before: return
+    except Exception: pass  # "execution context was destroyed" - a navigation started
+    try: page.wait_for_load_state("domcontentloaded", timeout=10000)
+    except Exception: pass
+
+
+class PagePool:
+    """Extra pages of the shared context: checkout() lends one (None when all are busy),
+    release() takes it back. Only touched from the browser thread, so no locking."""
+    def __init__(self, size): self.size, self._idle, self._busy = size, [], set()
+
+    def checkout(self):
+        while self._idle:
+            page = self._idle.pop()
+            if not page.is_closed(): break
+        else:
+            if len(self._busy) >= self.size: return None
+            page = _get_context().new_page()
+        self._busy.add(page); return page
+
+    def release(self, page):
+        self._busy.discard(page)
+        if page.is_closed(): return
+        try: page.goto("about:blank"); self._idle.append(page)  # stop timers and media of the old document
+        except Exception:
+            try: page.close()
+            except: pass
+
+    def __contains__(self, page): return page in self._busy or page in self._idle
+
+    def reset(self): self._idle, self._busy = [], set()
+
+page_pool = PagePool(BROWSER_POOL_SIZE)
+
 
 def close_browser():
-    global _playwright, _browser, _page
-    for obj, method in [(_browser, "close"), (_playwright, "stop")]:
+    global _playwright, _browser, _context, _page
+    # context first: closing it flushes cookies and storage of a persistent profile
+    for obj, method in [(_context, "close"), (_browser, "close"), (_playwright, "stop")]:
         if obj:
             try: getattr(obj, method)()
             except: pass
-    _page = _browser = _playwright = None
+    page_pool.reset(); _session_pages.clear(); _net_activity.clear(); _snapshot_cache["page"] = None
+    _page = _context = _browser = _playwright = None
+
+
+def _describe_profile():
+    p = BROWSER_PROFILES[BROWSER_PROFILE]
+    return (f"{'headless' if p['headless'] else 'visible'}, slow_mo {p['slow_mo']} ms, "
+            f"{'blocking images/media/fonts/trackers' if p['block'] else 'full rendering'}")
 
 
 # ─────────────────────────────────────────
@@ -191,86 +414,517 @@ def _create_directory(path):
     try: os.makedirs(path, exist_ok=True); return f"Created: {path}"
     except Exception as e: return f"mkdir error: {e}"
 
+def _browser_set_profile(profile):
+    """The browser restarts with the new profile on the next browser tool."""
+    global BROWSER_PROFILE
+    profile = profile.lower()
+    if profile not in BROWSER_PROFILES:
+        return f"Unknown profile: {profile}. Available: {', '.join(BROWSER_PROFILES)}"
+    if profile != BROWSER_PROFILE: BROWSER_PROFILE = profile; close_browser()
+    return f"Browser profile: {profile} ({_describe_profile()})"
+
 def _browser_goto(url):
     if not PLAYWRIGHT_AVAILABLE: return "Playwright not available."
     try:
         if not url.startswith("http"): url = "https://" + url
-        page = get_page()
+        page, blocked, t0 = get_page(), blocked_requests, time.perf_counter()
         page.goto(url, wait_until="domcontentloaded", timeout=20000)
-        return f"Opened: {url} | Title: {page.title()}"
+        timing = f"loaded in {(time.perf_counter() - t0) * 1000:.0f} ms"
+        try:
+            ttfb = page.evaluate("() => { const n = performance.getEntriesByType('navigation')[0];"
+                                 " return n ? n.responseStart : null; }")
+            if ttfb: timing += f" (TTFB {ttfb:.0f} ms)"
+        except Exception: pass
+        if blocked_requests > blocked: timing += f", {blocked_requests - blocked} requests blocked"
+        return f"Opened: {url} | Title: {page.title()} | {timing}"
     except Exception as e: return f"Navigation error: {e}"
 
+CLICK_STRATEGIES = {
+    "text":   lambda page, s: page.get_by_text(s, exact=False),
+    "button": lambda page, s: page.get_by_role("button", name=s),
+    "link":   lambda page, s: page.get_by_role("link", name=s),
+    "css":    lambda page, s: page.locator(s),
+}
+TYPE_STRATEGIES = {
+    "placeholder": lambda page, s: page.get_by_placeholder(s),
+    "label":       lambda page, s: page.get_by_label(s),
+    "textbox":     lambda page, s: page.get_by_role("textbox", name=s),
+    "css":         lambda page, s: page.locator(s),
+    "searchbox":   lambda page, s: page.get_by_role("searchbox"),  # any search field
+}
+FALLBACK_STRATEGIES = {"searchbox"}  # catch-alls ignoring the selector: tried after the others missed, never cached
+
+class SelectorCache:
+    """Winning locator strategy per (domain, selector), persisted. Browser thread only, no locking."""
+    def __init__(self, path):
+        self.path = path
+        try:
+            with open(path, "r", encoding="utf-8") as f: self.entries = json.load(f)
+        except (OSError, ValueError): self.entries = {}
+
+    def get(self, domain, selector): return self.entries.get(domain, {}).get(selector)
+
+    def put(self, domain, selector, strategy):
+        if self.get(domain, selector) == strategy: return
+        self.entries.setdefault(domain, {})[selector] = strategy
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".tmp", "w", encoding="utf-8") as f: json.dump(self.entries, f, indent=1)
+            os.replace(self.path + ".tmp", self.path)
+        except OSError: pass  # a lost hint only costs speed
+
+selector_cache = SelectorCache(SELECTOR_CACHE_PATH)
+
+def _url_domain(url): return url.split("://", 1)[-1].split("/", 1)[0].lower()
+
+def _element_ref(selector):
+    """The browser_snapshot ref in a selector ("e12" or "ref=e12"), else None."""
+    m = re.fullmatch(r"\[?(?:ref=)?(e\d+)\]?", selector.strip())
+    return m.group(1) if m else None
+
+def _not_found(kind, selector):
+    hint = " (refs expire when the page changes - call browser_snapshot again)" if _element_ref(selector) else ""
+    return f"{kind} not found: {selector}{hint}"
+
+def _locate(page, selector, strategies, timeout_ms=LOCATE_TIMEOUT):
+    """Race the strategies: each round checks every one once (is_visible, no waiting), so a miss
+    costs timeout_ms in total. The domain's cached winner goes first; fallbacks are checked once
+    after the others ran out of time. (None, None) on a miss. A snapshot ref resolves directly."""
+    ref = _element_ref(selector)
+    if ref:
+        loc = page.locator(f'[data-agent-ref="{ref}"]').first
+        return ("ref", loc) if loc.count() else (None, None)
+    cached = selector_cache.get(_url_domain(page.url), selector)
+    order = sorted((n for n in strategies if n not in FALLBACK_STRATEGIES), key=lambda n: n != cached)
+    fallbacks, deadline = [n for n in strategies if n in FALLBACK_STRATEGIES], time.monotonic() + timeout_ms / 1000
+    def first_visible(names):
+        for name in names:
+            loc = strategies[name](page, selector).first
+            try:
+                if loc.is_visible(): return name, loc
+            except Exception: pass  # e.g. visible text that is not valid CSS
+        return None, None
+    while True:
+        name, loc = first_visible(order)
+        if loc is not None: return name, loc
+        if time.monotonic() >= deadline: return first_visible(fallbacks)
+        page.wait_for_timeout(100)
+
+def _remember_strategy(url, selector, strategy):
+    if strategy != "ref" and strategy not in FALLBACK_STRATEGIES: selector_cache.put(_url_domain(url), selector, strategy)
+
 def _browser_click(selector):
     if not PLAYWRIGHT_AVAILABLE: return "Playwright not available."
     try:
-        page = get_page(); clicked = False
-        for s in [
-            lambda: page.get_by_text(selector, exact=False).first.click(timeout=3000),
-            lambda: page.get_by_role("button", name=selector).first.click(timeout=3000),
-            lambda: page.get_by_role("link",   name=selector).first.click(timeout=3000),
-            lambda: page.click(selector, timeout=3000),
-        ]:
-            try: s(); clicked = True; break
-            except: pass
-        if not clicked: return f"Element not found: {selector}"
-        page.wait_for_load_state("domcontentloaded")
+        page = get_page(); url_before = page.url
+        strategy, loc = _locate(page, selector, CLICK_STRATEGIES)
+        if loc is None: return _not_found("Element", selector)
+        loc.click(timeout=LOCATE_TIMEOUT)
+        _remember_strategy(url_before, selector, strategy)
+        _after_action(page, url_before)
         return f"Clicked: {selector}"
     except Exception as e: return f"Click error: {e}"
 
 def _browser_type(selector, text):
     if not PLAYWRIGHT_AVAILABLE: return "Playwright not available."
     try:
-        page = get_page(); filled = False
-        for s in [
-            lambda: page.get_by_placeholder(selector).first.fill(text, timeout=3000),
-            lambda: page.get_by_label(selector).first.fill(text, timeout=3000),
-            lambda: page.get_by_role("textbox",   name=selector).first.fill(text, timeout=3000),
-            lambda: page.get_by_role("searchbox").first.fill(text, timeout=3000),
-            lambda: page.fill(selector, text, timeout=3000),
-        ]:
-            try: s(); filled = True; break
-            except: pass
-        if not filled: return f"Field not found: {selector}"
+        page = get_page(); url_before = page.url
+        strategy, loc = _locate(page, selector, TYPE_STRATEGIES)
+        if loc is None: return _not_found("Field", selector)
+        loc.fill(text, timeout=LOCATE_TIMEOUT)
+        _remember_strategy(url_before, selector, strategy)
+        _after_action(page, url_before)  # autocomplete / live validation
         return f"Typed '{text}' into: {selector}"
     except Exception as e: return f"Type error: {e}"
 
-def _browser_get_text():
+# In-page extraction: the main content block is picked by text density (paragraph scores
+# discounted by link density), boilerplate (nav, footers, cookie banners, hidden nodes) is
+# dropped and the rest rendered as compact markdown. The text stays in window.__agentText,
+# so continuation calls only slice it. Returns {text, end, total, root, all}; all is the
+# whole text when `full` is set (kept for diffs), else null.
+_PAGE_TEXT_JS = r"""([mode, offset, size, full]) => {
+    const SKIP = new Set(["SCRIPT", "STYLE", "NOSCRIPT", "TEMPLATE", "SVG", "CANVAS", "IFRAME",
+                          "NAV", "ASIDE", "FOOTER", "BUTTON", "SELECT", "OPTION", "DIALOG"]);
+    const BLOCK = new Set(["P", "DIV", "SECTION", "ARTICLE", "MAIN", "HEADER", "BLOCKQUOTE", "UL", "OL",
+                           "DL", "DT", "DD", "TABLE", "TBODY", "THEAD", "FIGURE", "FIGCAPTION", "FORM"]);
+    const BOILER = /(^|[\s_-])(nav|navbar|menu|footer|sidebar|breadcrumbs?|cookies?|consent|gdpr|banner|newsletter|subscribe|share|social|related|promo|advert|ads?|popup|modal|comments?)($|[\s_-])/i;
+    const BOILER_ROLES = new Set(["navigation", "banner", "contentinfo", "complementary", "dialog", "alert"]);
+
+    const boilerplate = el => {
+        const role = el.getAttribute("role");
+        if (role && BOILER_ROLES.has(role)) return true;
+        if (el.getAttribute("aria-hidden") === "true") return true;
+        const cls = typeof el.className === "string" ? el.className : "";
+        return BOILER.test(el.id + " " + cls);
+    };
+
+    const linkDensity = el => {
+        const total = el.textContent.length || 1;
+        let links = 0;
+        for (const a of el.querySelectorAll("a")) links += a.textContent.length;
+        return Math.min(1, links / total);
+    };
+
+    const pickRoot = () => {
+        const scores = new Map();
+        for (const p of document.body.querySelectorAll("p, pre, blockquote, td, li, h2, h3")) {
+            const text = p.textContent.trim();
+            if (text.length < 25) continue;
+            const score = 1 + (text.match(/,/g) || []).length + Math.min(text.length / 100, 3);
+            let node = p.parentElement, weight = 1;
+            for (let d = 0; node && node !== document.documentElement && d < 3; d++) {
+                scores.set(node, (scores.get(node) || 0) + score * weight);
+                node = node.parentElement; weight /= 2;
+            }
+        }
+        let best = null, bestScore = 0;
+        for (const [el, score] of scores) {
+            let s = score * (1 - linkDensity(el));
+            if (/^(ARTICLE|MAIN)$/.test(el.tagName) || el.getAttribute("role") === "main") s *= 1.5;
+            if (boilerplate(el)) s *= 0.2;
+            if (s > bestScore) { best = el; bestScore = s; }
+        }
+        return best && best.textContent.trim().length >= 500 ? best : document.body;
+    };
+
+    const render = root => {
+        const out = []; let line = "";
+        const flush = () => {
+            const l = line.replace(/\s+/g, " ").trim();
+            if (l && !/^(#+|-)$/.test(l)) out.push(l);
+            line = "";
+        };
+        const walk = el => {
+            for (const n of el.childNodes) {
+                if (n.nodeType === 3) { line += n.textContent; continue; }
+                if (n.nodeType !== 1) continue;
+                const tag = n.tagName;
+                if (SKIP.has(tag) || (n !== root && boilerplate(n))) continue;
+                if (n.checkVisibility && !n.checkVisibility()) continue;
+                if (root === document.body && tag === "HEADER" && !n.closest("article, main")) continue;
+                const h = /^H([1-6])$/.exec(tag);
+                if (h) { flush(); line = "#".repeat(+h[1]) + " "; walk(n); flush(); }
+                else if (tag === "LI") { flush(); line = "- "; walk(n); flush(); }
+                else if (tag === "TR") {
+                    flush();
+                    const cells = [...n.children].map(c => c.innerText.replace(/\s+/g, " ").trim());
+                    if (cells.some(Boolean)) out.push("| " + cells.join(" | ") + " |");
+                }
+                else if (tag === "PRE") { flush(); out.push("```\n" + n.innerText.trimEnd() + "\n```"); }
+                else if (tag === "BR") flush();
+                else if (BLOCK.has(tag)) { flush(); walk(n); flush(); }
+                else walk(n);
+            }
+        };
+        walk(root); flush();
+        return out.join("\n");
+    };
+
+    if (offset === 0 || window.__agentTextMode !== mode || typeof window.__agentText !== "string") {
+        const root = mode === "all" ? document.body : pickRoot();
+        window.__agentText = render(root);
+        window.__agentTextMode = mode;
+        window.__agentTextRoot = root.tagName.toLowerCase() + (root.id ? "#" + root.id : "")
+            + (typeof root.className === "string" && root.className.trim()
+               ? "." + root.className.trim().split(/\s+/)[0] : "");
+    }
+    const text = window.__agentText, total = text.length;
+    let end = Math.min(total, offset + size);
+    if (end < total) {
+        const cut = text.lastIndexOf("\n", end);
+        if (cut > offset + size / 2) end = cut + 1;
+    }
+    return {text: text.slice(offset, end), end, total, root: window.__agentTextRoot, all: full ? text : null};
+}"""
+
+
+_observations = {}  # (page, url without fragment, mode) -> text last returned, most recent last
+
+def _observe(key, text):
+    _observations.pop(key, None); _observations[key] = text
+    while len(_observations) > PAGE_OBSERVATIONS: _observations.pop(next(iter(_observations)))
+
+def _text_diff(old, new):
+    """Changed lines of new vs old, each hunk anchored on the line before it -> (text, added, removed)."""
+    a, b = old.splitlines(), new.splitlines()
+    out, added, removed = [], 0, 0
+    for op, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if op == "equal": continue
+        out.append(f"@ after: {b[j1 - 1][:80] if j1 else '(top of page)'}")
+        out += ["- " + l for l in a[i1:i2]] + ["+ " + l for l in b[j1:j2]]
+        removed, added = removed + i2 - i1, added + j2 - j1
+    return "\n".join(out), added, removed
+
+def _browser_get_text(offset=0, mode="main", diff=False):
+    """TEXT_CHUNK chars of markdown per call; mode "main" = main content, "all" = whole cleaned page.
+    diff returns only the lines added/removed since this page's text was last returned."""
     if not PLAYWRIGHT_AVAILABLE: return "Playwright not available."
     try:
-        text = get_page().inner_text("body")
-        return (text[:6000] + "\n[truncated]") if len(text) > 6000 else text
+        page = get_page()
+        mode, offset = ("all" if mode == "all" else "main"), (0 if diff else max(0, int(offset or 0)))
+        r, note = page.evaluate(_PAGE_TEXT_JS, [mode, offset, TEXT_CHUNK, offset == 0]), ""
+        if offset == 0:
+            key = (page, page.url.split("#")[0], mode)
+            previous = _observations.get(key)
+            _observe(key, r["all"])
+            if diff and previous is not None:
+                if previous == r["all"]: return f"[no changes since the last observation of {page.url}]"
+                changes, added, removed = _text_diff(previous, r["all"])
+                if len(changes) <= len(r["all"]) * 0.6:
+                    if len(changes) > TEXT_CHUNK: changes = changes[:TEXT_CHUNK] + "\n[... diff truncated]"
+                    return f"[changes since the last observation of {page.url} | +{added} / -{removed} lines]\n{changes}"
+                note = "[the page changed substantially - full text]\n"
+            elif diff: note = "[no earlier observation of this page - full text]\n"
+        if not r["total"]: return "No text on the page."
+        if offset >= r["total"]: return f"No more text (the page has {r['total']} chars)."
+        head = f"[{'page' if mode == 'all' else 'main content: ' + r['root']} | chars {offset}-{r['end']} of {r['total']}]"
+        more = (f"\n[... more: browser_get_text(offset={r['end']}{', mode=all' if mode == 'all' else ''})]"
+                if r["end"] < r["total"] else "")
+        return f"{note}{head}\n{r['text']}{more}"
     except Exception as e: return f"Get text error: {e}"
 
-def _browser_screenshot(path):
+def _screenshot_path(path, fmt=""):
+    """The extension picks the format unless fmt is given."""
+    path, ext = fix_path(path), os.path.splitext(path)[1].lower()
+    if fmt in ("jpeg","jpg"): return path if ext in (".jpg",".jpeg") else path + ".jpg"
+    return path if ext in (".jpg",".jpeg",".png") else path + ".png"
+
+class ScreenshotWriter:
+    """Writes captured screenshots on a background thread, so the tool returns once the bytes
+    are captured. Tools touching a path with a pending write wait for it (handle_tool_call)."""
+    def __init__(self):
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="screenshot")
+        self._lock, self._pending = threading.Lock(), {}  # path key -> Future of its write
+        self.written = self.failed = 0; self.write_ms = 0.0
+
+    def write(self, path, data):
+        key = _path_key(path)
+        with self._lock: fut = self._pending[key] = self._pool.submit(self._write, path, data)
+        fut.add_done_callback(lambda f: self._forget(key, f))
+
+    def _forget(self, key, fut):
+        with self._lock:
+            if self._pending.get(key) is fut: del self._pending[key]
+
+    def _write(self, path, data):
+        t0 = time.perf_counter()
+        try:
+            d = os.path.dirname(path)
+            if d: os.makedirs(d, exist_ok=True)
+            with open(path, "wb") as f: f.write(data)
+            self.written += 1; self.write_ms += (time.perf_counter() - t0) * 1000
+        except OSError as e: self.failed += 1; print(f"  [⚠️  Screenshot write failed: {path}: {e}]")
+
+    def wait_for(self, resources):
+        with self._lock: futures = [f for k, f in self._pending.items() if _resources_conflict({k}, resources)]
+        wait(futures)
+
+    @property
+    def pending(self):
+        with self._lock: return len(self._pending)
+
+screenshot_writer = ScreenshotWriter()
+
+def _browser_screenshot(path, scope="full", selector="", clip=None, fmt="", quality=SCREENSHOT_JPEG_QUALITY,
+                        max_height=SCREENSHOT_MAX_HEIGHT):
+    """Page / viewport / element / clip capture; full pages taller than max_height become numbered tiles."""
     if not PLAYWRIGHT_AVAILABLE: return "Playwright not available."
-    path = fix_path(path)
-    if not path.endswith(".png"): path += ".png"
+    path = _screenshot_path(path, fmt)
+    opts = {"type": "jpeg" if path.lower().endswith((".jpg",".jpeg")) else "png"}
+    if opts["type"] == "jpeg": opts["quality"] = max(1, min(int(quality or SCREENSHOT_JPEG_QUALITY), 100))
     try:
-        d = os.path.dirname(path)
-        if d: os.makedirs(d, exist_ok=True)
-        get_page().screenshot(path=path, full_page=True)
-        return f"Screenshot saved: {path}"
+        page, t0, shots = get_page(), time.perf_counter(), []  # shots: (path, bytes)
+        if scope == "element":
+            if not selector: return "Screenshot error: scope 'element' needs a selector."
+            shots.append((path, page.locator(selector).first.screenshot(timeout=LOCATE_TIMEOUT, **opts)))
+        elif scope == "clip":
+            if not clip: return "Screenshot error: scope 'clip' needs clip {x, y, width, height}."
+            region = {k: float(clip[k]) for k in ("x","y","width","height")}
+            shots.append((path, page.screenshot(clip=region, full_page=True, **opts)))
+        elif scope == "viewport": shots.append((path, page.screenshot(**opts)))
+        else:
+            width, height = page.evaluate("() => [document.documentElement.scrollWidth, document.documentElement.scrollHeight]")
+            max_height = int(max_height or 0)
+            if not max_height or height <= max_height: shots.append((path, page.screenshot(full_page=True, **opts)))
+            else:
+                base, ext = os.path.splitext(path)
+                for n, y in enumerate(range(0, height, max_height), start=1):
+                    region = {"x": 0, "y": y, "width": width, "height": min(max_height, height - y)}
+                    shots.append((f"{base}_{n}{ext}", page.screenshot(clip=region, full_page=True, **opts)))
+        capture_ms = (time.perf_counter() - t0) * 1000
+        for shot_path, data in shots: screenshot_writer.write(shot_path, data)
+        size  = sum(len(d) for _, d in shots) / 1024
+        where = shots[0][0] if len(shots) == 1 else f"{len(shots)} tiles {shots[0][0]} ... {shots[-1][0]}"
+        return f"Screenshot saved: {where} | {opts['type'].upper()}, {size:.0f} KB, capture+encode {capture_ms:.0f} ms, write queued"
     except Exception as e: return f"Screenshot error: {e}"
 
-def _browser_get_links():
+# In-page link list: http(s) links deduped by URL without fragment, same-page anchors dropped,
+# nav/header/footer/banner regions skipped (not an article's own header) unless filtered,
+# visible first then top to bottom. Links keep their full URL.
+# filter is a substring, or /regex/, matched against text and URL.
+_LINKS_JS = r"""([filter, domain, offset, limit]) => {
+    const BOILER = /(^|[\s_-])(nav|navbar|menu|footer|sidebar|breadcrumbs?|cookies?|consent|banner|social|share|promo|advert|ads?)($|[\s_-])/i;
+    const HEADER = /(^|[\s_-])header($|[\s_-])/i;
+    // Inside an article / main, headers hold the title link, and the wrappers
+    // around the region (e.g. "has-sidebar" layouts) say nothing about it
+    const boilerplate = a => {
+        const region = a.closest("article, main, [role=main]");
+        const chrome = a.closest(region ? "nav, footer, aside, [role=navigation], [role=contentinfo]"
+                                        : "nav, header, footer, aside, [role=navigation], [role=banner], [role=contentinfo]");
+        if (chrome && !(region && chrome.contains(region))) return true;
+        for (let el = a.parentElement; el && el !== document.body && el !== region; el = el.parentElement) {
+            const words = el.id + " " + (typeof el.className === "string" ? el.className : "");
+            if (BOILER.test(words) || (!region && HEADER.test(words))) return true;
+        }
+        return false;
+    };
+    let match = () => true;
+    if (filter) {
+        const rx = /^\/(.+)\/$/.exec(filter);
+        if (rx) { const re = new RegExp(rx[1], "i"); match = s => re.test(s); }
+        else { const needle = filter.toLowerCase(); match = s => s.toLowerCase().includes(needle); }
+    }
+    const norm = u => { u.hash = ""; return u.href.replace(/\/$/, ""); };  // de-dup key only
+    const here = norm(new URL(location.href));
+    const best = new Map();
+    for (const a of document.querySelectorAll("a[href]")) {
+        let url;
+        try { url = new URL(a.href, location.href); } catch (e) { continue; }
+        if (url.protocol !== "http:" && url.protocol !== "https:") continue;
+        const href = url.href;
+        const key = norm(url);
+        if (key === here) continue;  // same-page anchor
+        if (domain && url.hostname !== domain && !url.hostname.endsWith("." + domain)) continue;
+        const text = (a.innerText || a.getAttribute("aria-label") || a.title || "").replace(/\s+/g, " ").trim();
+        if (!text || !match(text + " " + key)) continue;
+        if (!filter && boilerplate(a)) continue;
+        const r = a.getBoundingClientRect();
+        const visible = r.width > 0 && r.height > 0 && (!a.checkVisibility || a.checkVisibility());
+        const rank = (visible ? 0 : 1e7) + r.top + window.scrollY;  // visible first, then top to bottom
+        const prev = best.get(key);
+        if (!prev || rank < prev.rank) best.set(key, {text: text.slice(0, 80), href, rank});
+    }
+    const links = [...best.values()].sort((x, y) => x.rank - y.rank);
+    return {total: links.length, links: links.slice(offset, offset + limit).map(l => [l.text, l.href])};
+}"""
+
+def _browser_get_links(match="", domain="", offset=0, limit=LINKS_PAGE):
     if not PLAYWRIGHT_AVAILABLE: return "Playwright not available."
     try:
-        links = get_page().eval_on_selector_all(
-            "a[href]", "els=>els.map(e=>({text:e.innerText.trim(),href:e.href})).filter(l=>l.text&&l.href)")
-        return "\n".join(f"{l['text'][:60]} -> {l['href']}" for l in links[:40]) or "No links."
+        offset, limit = max(0, int(offset or 0)), max(1, min(int(limit or LINKS_PAGE), 200))
+        domain = domain.lower().removeprefix("www.") if domain else ""
+        r = get_page().evaluate(_LINKS_JS, [match or "", domain, offset, limit])
+        if not r["total"]: return "No links."
+        if not r["links"]: return f"No more links (the page has {r['total']})."
+        end = offset + len(r["links"])
+        out = [f"{n}. {text} -> {href}" for n, (text, href) in enumerate(r["links"], start=offset + 1)]
+        out.append(f"[links {offset + 1}-{end} of {r['total']}"
+                   + (f" - more: browser_get_links(offset={end})]" if end < r["total"] else "]"))
+        return "\n".join(out)
     except Exception as e: return f"Get links error: {e}"
 
+# In-page snapshot: visible interactive elements (links, buttons, fields, ARIA widgets) with role,
+# accessible name and state, plus h1-h3 for context. Elements are tagged data-agent-ref="eN";
+# tagged ones keep their ref and numbering continues from seq, so refs are never reused.
+_SNAPSHOT_JS = r"""([seq, max]) => {
+    const SEL = "a[href], button, input:not([type=hidden]), textarea, select, summary, [contenteditable=''], "
+              + "[contenteditable=true], [role=button], [role=link], [role=checkbox], [role=radio], [role=tab], "
+              + "[role=menuitem], [role=option], [role=switch], [role=combobox], [role=textbox], [role=searchbox], "
+              + "h1, h2, h3";
+    const clean = s => (s || "").replace(/\s+/g, " ").trim().slice(0, 80);
+    const role = el => {
+        const r = el.getAttribute("role"), t = el.tagName;
+        if (r) return r;
+        if (t === "A") return "link";
+        if (t === "BUTTON" || t === "SUMMARY") return "button";
+        if (t === "SELECT") return "combobox";
+        if (t === "INPUT") {
+            if (el.type === "checkbox" || el.type === "radio") return el.type;
+            if (/^(submit|button|reset|image)$/.test(el.type)) return "button";
+            return el.type === "search" ? "searchbox" : "textbox";
+        }
+        return "textbox";  // textarea, contenteditable
+    };
+    const name = el => {
+        const by = el.getAttribute("aria-labelledby");
+        if (by) {
+            const t = clean(by.split(/\s+/).map(id => (document.getElementById(id) || {}).innerText || "").join(" "));
+            if (t) return t;
+        }
+        if (el.getAttribute("aria-label")) return clean(el.getAttribute("aria-label"));
+        if (el.labels && el.labels.length) return clean(el.labels[0].innerText);
+        if (el.tagName === "INPUT" && /^(submit|button|reset)$/.test(el.type)) return clean(el.value);
+        const text = clean(el.innerText);
+        if (text && el.tagName !== "SELECT") return text;
+        const img = el.querySelector("img[alt]");
+        if (img && clean(img.alt)) return clean(img.alt);
+        return clean(el.getAttribute("placeholder") || el.getAttribute("title") || el.getAttribute("name") || "");
+    };
+    const lines = [];
+    let count = 0, skipped = 0;
+    for (const el of document.querySelectorAll(SEL)) {
+        if (el.checkVisibility ? !el.checkVisibility() : !el.getClientRects().length) continue;
+        const h = /^H([1-3])$/.exec(el.tagName);
+        if (h) {
+            const t = clean(el.innerText);
+            if (t) lines.push("#".repeat(+h[1]) + " " + t);
+            continue;
+        }
+        if (count >= max) { skipped++; continue; }
+        let ref = el.getAttribute("data-agent-ref");
+        if (!ref) { ref = "e" + (++seq); el.setAttribute("data-agent-ref", ref); }
+        count++;
+        const r = role(el);
+        let line = `[${ref}] ${r} "${name(el)}"`;
+        if (el.checked || el.getAttribute("aria-checked") === "true") line += " checked";
+        if (el.getAttribute("aria-expanded")) line += el.getAttribute("aria-expanded") === "true" ? " expanded" : " collapsed";
+        if (el.getAttribute("aria-selected") === "true") line += " selected";
+        if (el.tagName === "SELECT") line += ` = "${clean((el.selectedOptions[0] || {}).text)}"`;
+        else if (r === "textbox" || r === "searchbox") {
+            if (el.value && el.type !== "password") line += ` = "${clean(el.value)}"`;
+            else if (el.placeholder && name(el) !== clean(el.placeholder)) line += ` (${clean(el.placeholder)})`;
+        }
+        if (el.disabled || el.getAttribute("aria-disabled") === "true") line += " disabled";
+        if (r === "link") {
+            const href = el.getAttribute("href") || "";
+            if (href && !href.startsWith("javascript:") && href !== "#") line += " -> " + href.slice(0, 80);
+        }
+        lines.push(line);
+    }
+    return {text: lines.join("\n"), seq, count, skipped};
+}"""
+
+_snapshot_cache, _ref_seq = {"page": None, "version": -1, "text": ""}, 0
+
+def _browser_snapshot():
+    """Refs work as click/type selectors. Cached until the page navigates or an action may have changed it."""
+    global _ref_seq
+    if not PLAYWRIGHT_AVAILABLE: return "Playwright not available."
+    try:
+        page = get_page()
+        if _snapshot_cache["page"] is page and _snapshot_cache["version"] == _page_version:
+            return _snapshot_cache["text"] + "\n[unchanged since the last snapshot]"
+        r = page.evaluate(_SNAPSHOT_JS, [_ref_seq, SNAPSHOT_MAX_ELEMENTS]); _ref_seq = r["seq"]
+        text = (f"[snapshot of {page.url} | {r['count']} elements - pass a ref (e.g. e12) as the selector of "
+                f"browser_click / browser_type]\n{r['text'] or 'No interactive elements.'}"
+                + (f"\n[{r['skipped']} more elements not listed]" if r["skipped"] else ""))
+        _snapshot_cache.update(page=page, version=_page_version, text=text)
+        return text
+    except Exception as e: return f"Snapshot error: {e}"
+
 def _browser_scroll(direction):
     if not PLAYWRIGHT_AVAILABLE: return "Playwright not available."
     try:
-        get_page().keyboard.press({"down":"PageDown","up":"PageUp","top":"Home","bottom":"End"}.get(direction,"PageDown"))
-        time.sleep(0.3); return f"Scrolled: {direction}"
+        page = get_page(); url_before = page.url
+        page.keyboard.press({"down":"PageDown","up":"PageUp","top":"Home","bottom":"End"}.get(direction,"PageDown"))
+        _after_action(page, url_before); return f"Scrolled: {direction}"  # lazy-loaded content
     except Exception as e: return f"Scroll error: {e}"
 
 def _browser_press_key(key):
     if not PLAYWRIGHT_AVAILABLE: return "Playwright not available."
     try:
-        get_page().keyboard.press(key); time.sleep(0.5); return f"Pressed: {key}"
+        page = get_page(); url_before = page.url
+        page.keyboard.press(key); _after_action(page, url_before); return f"Pressed: {key}"
     except Exception as e: return f"Key error: {e}"
 
 def _browser_select_option(selector, value):
@@ -279,6 +933,7 @@ def _browser_select_option(selector, value):
         page = get_page()
         try: page.select_option(selector, label=value, timeout=5000)
         except: page.select_option(selector, value=value, timeout=5000)
+        _page_changed()
         return f"Selected '{value}' in: {selector}"
     except Exception as e: return f"Select error: {e}"
 
@@ -286,6 +941,29 @@ def _browser_wait(seconds):
     try: time.sleep(min(float(seconds), 30)); return f"Waited {seconds}s"
     except Exception as e: return f"Wait error: {e}"
 
+def _browser_wait_for(condition, value="", timeout_ms=WAIT_FOR_TIMEOUT):
+    """selector/text: element visible; url: URL contains value (empty = any change);
+    network_idle / dom_settle: no requests / DOM mutations for value ms."""
+    if not PLAYWRIGHT_AVAILABLE: return "Playwright not available."
+    try:
+        page, timeout = get_page(), min(int(timeout_ms or WAIT_FOR_TIMEOUT), 30000)
+        t0, ready = time.perf_counter(), True
+        if condition == "selector": page.wait_for_selector(value, state="visible", timeout=timeout)
+        elif condition == "text": page.get_by_text(value, exact=False).first.wait_for(state="visible", timeout=timeout)
+        elif condition == "url":
+            current = page.url
+            page.wait_for_url(lambda u: value in u if value else u != current, timeout=timeout)
+        elif condition == "network_idle": ready = _wait_network_idle(page, int(value or NETWORK_QUIET_MS), timeout)
+        elif condition == "dom_settle": ready = _wait_dom_settled(page, int(value or 300), timeout)
+        else: return f"Unknown condition: {condition}. Use selector, text, url, network_idle or dom_settle."
+        took = (time.perf_counter() - t0) * 1000
+        if not ready: return f"Timed out after {took:.0f} ms waiting for {condition}"
+        return f"Ready after {took:.0f} ms: {condition}{' ' + value if value else ''}"
+    except Exception as e:
+        if "Timeout" in type(e).__name__ or "Timeout" in str(e):
+            return f"Timed out waiting for {condition} {value}".rstrip()
+        return f"Wait error: {e}"
+
 def _browser_current_url():
     if not PLAYWRIGHT_AVAILABLE: return "Playwright not available."
     try: p = get_page(); return f"URL: {p.url} | Title: {p.title()}"
@@ -301,11 +979,180 @@ def _browser_go_back():
 def _browser_eval_js(script):
     if not PLAYWRIGHT_AVAILABLE: return "Playwright not available."
     try:
-        r = get_page().evaluate(script)
+        r = get_page().evaluate(script); _page_changed()
         return str(r)[:3000] if r else "OK (no result)"
     except Exception as e: return f"JS error: {e}"
 
+def _browser_open_many(urls):
+    """Load URLs side by side in pooled pages (the active page is untouched). Each batch
+    starts every goto (returns on commit) before waiting on any, so pages load concurrently."""
+    if not PLAYWRIGHT_AVAILABLE: return "Playwright not available."
+    urls = [u if u.startswith("http") else "https://" + u for u in urls if u][:MAX_OPEN_MANY]
+    if not urls: return "No URLs given."
+    per_url, out = max(300, 6000 // len(urls)), []
+    try:
+        for i in range(0, len(urls), page_pool.size):
+            loaded = []
+            for url in urls[i:i + page_pool.size]:
+                page = page_pool.checkout()
+                try: page.goto(url, wait_until="commit", timeout=20000); loaded.append((url, page, None))
+                except Exception as e: loaded.append((url, page, e))
+            for n, (url, page, error) in enumerate(loaded, start=i + 1):
+                try:
+                    if error: raise error
+                    page.wait_for_load_state("domcontentloaded", timeout=20000)
+                    r = page.evaluate(_PAGE_TEXT_JS, ["main", 0, per_url])
+                    out.append(f"[{n}] {url} | Title: {page.title()}\n{r['text']}{' [...]' if r['end'] < r['total'] else ''}")
+                except Exception as e:
+                    out.append(f"[{n}] {url} | Navigation error: {str(e).splitlines()[0][:200]}")
+                finally: page_pool.release(page)
+        return "\n\n".join(out)
+    except Exception as e: return f"Open many error: {e}"
+
+# read_webpage's extractor, the HTTP twin of _PAGE_TEXT_JS: skipped regions are tracked by depth,
+# blocks become compact markdown and the main content block is picked by text density.
+SKIP_TAGS = {"head","script","style","noscript","template","svg","canvas","iframe","nav","aside","footer",
+             "button","select","option","dialog"}
+VOID_TAGS = {"area","base","br","col","embed","hr","img","input","link","meta","param","source","track","wbr"}
+BLOCK_TAGS = {"p","div","section","article","main","header","blockquote","ul","ol","dl","dt","dd","table",
+              "tbody","thead","figure","figcaption","form"}
+HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+PARA_TAGS = {"p","pre","blockquote","tr","li","h2","h3"}  # lines that score their ancestors
+# class / id words of boilerplate; "has-sidebar" style state modifiers don't count
+BOILER_RE = re.compile(r"(^|\s|(?<!\bhas)(?<!\bwith)(?<!\bno)[_-])(nav|navbar|menu|footer|sidebar|breadcrumbs?|cookies?|consent|gdpr|banner|"
+                       r"newsletter|subscribe|share|social|related|promo|advert|ads?|popup|modal|comments?)($|[\s_-])", re.I)
+BOILER_ROLES = {"navigation","banner","contentinfo","complementary","dialog","alert"}
+# a start tag closes the open tags in its set, searching up to the first boundary tag
+IMPLIED_END = {"li": ({"li"}, {"ul","ol"}), "dt": ({"dt","dd"}, {"dl"}), "dd": ({"dt","dd"}, {"dl"}),
+               "tr": ({"tr","td","th"}, {"table","tbody","thead","tfoot"}),
+               "td": ({"td","th"}, {"tr","table"}), "th": ({"td","th"}, {"tr","table"})}
+
+class _Node:
+    __slots__ = ("tag", "parent", "bonus", "text", "links", "score")
+    def __init__(self, tag, parent, attrs):
+        self.tag, self.parent, self.text, self.links, self.score = tag, parent, 0, 0, 0.0
+        self.bonus = 1.5 if tag in ("article","main") or attrs.get("role") == "main" else 1.0
+
 class TextExtractor(HTMLParser):
+    """Streaming HTML -> compact markdown of the main content; size = text chars extracted so far.
+    markdown() keeps the element whose paragraphs score highest (commas, length, minus link density),
+    or the whole page when no block has 500+ chars. A region skipped only for its class/id is entered again
+    for an article / main inside it ("site-content has-sidebar" wrappers can hold the content)."""
+    def __init__(self):
+        super().__init__()
+        self.root = _Node("document", None, {}); self.stack = [self.root]  # open elements, innermost last
+        self.skip_at = self.in_link = self.size = 0  # skip_at = stack depth that opened a skipped region
+        self.by_class, self.kept = False, []  # region opened by a class/id match; (depth, skip_at) kept inside one
+        self.in_title, self.title, self.line, self.prefix = False, "", [], ""
+        self.cells = self.pre = None  # open table row cells / <pre> text
+        self.lines, self.scored = [], set()  # (markdown line, element it was emitted in)
+    def _boilerplate(self, tag, attrs):
+        if tag == "header" and not any(n.tag in ("article","main") for n in self.stack): return True
+        if not attrs: return False
+        if attrs.get("role") in BOILER_ROLES or attrs.get("aria-hidden") == "true" or "hidden" in attrs: return True
+        style = attrs.get("style", "").replace(" ", "").lower()
+        if "display:none" in style or "visibility:hidden" in style: return True
+        return False
+    @staticmethod
+    def _boilerplate_class(tag, attrs):
+        if not attrs or tag in ("html","body","main","article") or attrs.get("role") == "main": return False
+        return bool(BOILER_RE.search(attrs.get("id", "") + " " + attrs.get("class", "")))
+    def handle_starttag(self, tag, attrs):
+        if tag == "title" and not self.title:  # the document title only, not <svg><title> or a hidden one
+            opener = self.stack[self.skip_at - 1].tag if self.skip_at else None
+            self.in_title = opener == "head" or (opener is None and not any(n.tag == "body" for n in self.stack))
+        if tag in VOID_TAGS:
+            if tag == "br" and not self.skip_at: self._flush()
+            return
+        if tag in IMPLIED_END:
+            (closes, boundary), match = IMPLIED_END[tag], 0
+            for i in range(len(self.stack) - 1, 0, -1):
+                if self.stack[i].tag in closes: match = i
+                elif self.stack[i].tag in boundary: break
+            if match: self._close_to(match)
+        elif self.stack[-1].tag == "p" and (tag in BLOCK_TAGS or tag in HEADING_TAGS or tag == "pre"):
+            self._close_to(len(self.stack) - 1)
+        attrs = {k: v or "" for k, v in attrs}
+        self.stack.append(_Node(tag, self.stack[-1], attrs))
+        if self.skip_at:
+            if not (self.by_class and self.stack[-1].bonus > 1): return
+            self.kept.append((len(self.stack), self.skip_at)); self.skip_at = 0
+        if tag in SKIP_TAGS or self._boilerplate(tag, attrs): self.skip_at, self.by_class = len(self.stack), False
+        elif self._boilerplate_class(tag, attrs): self.skip_at, self.by_class = len(self.stack), True
+        elif tag in HEADING_TAGS: self._flush(); self.prefix = "#" * HEADING_TAGS[tag] + " "
+        elif tag == "li": self._flush(); self.prefix = "- "
+        elif tag == "tr": self._flush(); self.cells = []
+        elif tag in ("td","th") and self.cells is not None: self.cells.append([])
+        elif tag == "pre": self._flush(); self.pre = []
+        elif tag == "a": self.in_link += 1
+        elif tag in BLOCK_TAGS: self._flush()
+    def handle_endtag(self, tag):
+        if tag == "title": self.in_title = False
+        if tag in VOID_TAGS: return
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].tag == tag: self._close_to(i); return
+    def handle_data(self, data):
+        if self.in_title: self.title += data; return
+        if self.skip_at: return
+        node, chars = self.stack[-1], len(data.strip())
+        node.text += chars
+        if self.in_link: node.links += chars
+        if self.pre is not None: self.pre.append(data)
+        elif self.cells is not None:
+            if not self.cells: self.cells.append([])
+            self.cells[-1].append(data)
+        else: self.line.append(data)
+    def _close_to(self, depth):
+        """Close the open elements from the innermost down to stack[depth]."""
+        while len(self.stack) > depth:
+            node = self.stack[-1]
+            if not self.skip_at:
+                self._end(node)
+                if self.kept and self.kept[-1][0] == len(self.stack): self.skip_at, self.by_class = self.kept.pop()[1], True
+            elif len(self.stack) == self.skip_at: self.skip_at = 0
+            self.stack.pop(); node.parent.text += node.text; node.parent.links += node.links
+    def _end(self, node):
+        tag = node.tag
+        if tag == "a": self.in_link = max(0, self.in_link - 1)
+        elif tag == "pre" and self.pre is not None:
+            text, self.pre = "".join(self.pre).strip("\n"), None
+            if text.strip(): self._emit(f"```\n{text}\n```", node)
+        elif tag == "tr" and self.cells is not None:
+            cells, self.cells = [" ".join("".join(c).split()) for c in self.cells], None
+            if any(cells): self._emit("| " + " | ".join(cells) + " |", node)
+        elif tag in HEADING_TAGS or tag == "li": self._flush(); self.prefix = ""
+        elif tag in BLOCK_TAGS: self._flush()
+    def _flush(self):
+        text, self.line = " ".join("".join(self.line).split()), []
+        if text: self._emit(self.prefix + text, self.stack[-1]); self.prefix = ""
+    def _emit(self, line, node):
+        self.lines.append((line, node)); self.size += len(line) + 1
+        if node.tag in PARA_TAGS and len(line) >= 25:
+            score, parent = 1 + line.count(",") + min(len(line) / 100, 3), node.parent
+            for weight in (1, 0.5, 0.25):
+                if parent is None: break
+                parent.score += score * weight; self.scored.add(parent); parent = parent.parent
+    def _main(self):
+        best, best_score = self.root, 0.0
+        for node in self.scored:
+            score = node.score * (1 - min(1.0, node.links / max(node.text, 1))) * node.bonus
+            if score > best_score and node.text >= 500: best, best_score = node, score
+        return best
+    def markdown(self):
+        """The main content as markdown, led by the page title. Closes what is still open."""
+        self._flush(); self._close_to(1)
+        main = self._main(); inside = {main: True, self.root: main is self.root}
+        def within(node):
+            chain = []
+            while node not in inside: chain.append(node); node = node.parent
+            for n in chain: inside[n] = inside[node]
+            return inside[node]
+        lines = [line for line, node in self.lines if within(node)]
+        title = " ".join(self.title.split())
+        return "\n".join(([f"Title: {title}"] if title else []) + lines)
+
+class _PlainTextExtractor(HTMLParser):
+    """The earlier flat extractor, kept as the --bench-extract baseline."""
     def __init__(self): super().__init__(); self.text = []; self.skip = False
     def handle_starttag(self, tag, attrs):
         if tag in ("script","style","nav","footer","head","noscript"): self.skip = True
@@ -316,16 +1163,326 @@ class TextExtractor(HTMLParser):
             s = data.strip()
             if s: self.text.append(s)
 
+def benchmark_extractors(folder, rounds=5):
+    """TextExtractor vs the flat parser on saved .html pages: time on the whole page, time streamed the way
+    read_webpage reads (stopping at READ_SCAN_CHARS), chars returned within READ_TEXT_CHARS and the share of
+    the flat output the new one drops as boilerplate."""
+    files = sorted(f for f in os.listdir(folder) if f.lower().endswith((".html", ".htm")))
+    if not files: return f"No .html files in {folder}"
+    rows = [f"{'page':<30} {'KB':>6} {'flat ms':>8} {'new ms':>8} {'streamed':>9} {'flat chars':>10} {'new chars':>9} {'dropped':>8}"]
+    totals = [0, 0.0, 0.0, 0.0]
+    for name in files:
+        with open(os.path.join(folder, name), "r", encoding="utf-8", errors="replace") as f: html = f.read()
+        started = time.perf_counter()
+        for _ in range(rounds):
+            flat = _PlainTextExtractor(); flat.feed(html); flat.close(); flat_text = "\n".join(flat.text)
+        flat_ms, started = (time.perf_counter() - started) * 1000 / rounds, time.perf_counter()
+        for _ in range(rounds):
+            new = TextExtractor(); new.feed(html); new.close(); new_text = new.markdown()
+        new_ms, started = (time.perf_counter() - started) * 1000 / rounds, time.perf_counter()
+        for _ in range(rounds):
+            streamed = TextExtractor()
+            for i in range(0, len(html), HTTP_CHUNK):
+                streamed.feed(html[i:i + HTTP_CHUNK])
+                if streamed.size >= READ_SCAN_CHARS: break
+            streamed.markdown()
+        streamed_ms = (time.perf_counter() - started) * 1000 / rounds
+        flat_lines = flat_text[:READ_TEXT_CHARS].splitlines()
+        dropped = sum(len(line) for line in flat_lines if line not in new_text)
+        rows.append(f"{name[:30]:<30} {len(html) / 1024:>6.0f} {flat_ms:>8.1f} {new_ms:>8.1f} {streamed_ms:>9.1f} "
+                    f"{min(len(flat_text), READ_TEXT_CHARS):>10} {min(len(new_text), READ_TEXT_CHARS):>9} "
+                    f"{dropped / max(sum(map(len, flat_lines)), 1):>8.0%}")
+        totals = [totals[0] + len(html), totals[1] + flat_ms, totals[2] + new_ms, totals[3] + streamed_ms]
+    rows.append(f"{f'{len(files)} pages':<30} {totals[0] / 1024:>6.0f} {totals[1]:>8.1f} {totals[2]:>8.1f} {totals[3]:>9.1f}")
+    return "\n".join(rows)
+
+class HttpClient:
+    """Keep-alive HTTP for every plain web fetch: a sync pool for tool threads, an async one for
+    the event loop. Requests are timed from httpcore trace events (connect = DNS + TCP, tls, ttfb, total).
+    With a sink the body is streamed instead of read whole, so the caller can stop the download."""
+    PHASES = ("connect", "tls", "ttfb", "total")
+    def __init__(self):
+        self._client = self._async = None; self._lock = threading.Lock()
+        self.requests = self.reused = self.wire = self.body = 0  # wire = bytes before decompression
+        self.totals = dict.fromkeys(self.PHASES, 0.0)  # ms
+    @staticmethod
+    def _options():
+        return {"headers": {"User-Agent":"Mozilla/5.0"}, "follow_redirects": True,
+                "timeout": httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                "limits": httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_KEEPALIVE,
+                                       keepalive_expiry=HTTP_KEEPALIVE_EXPIRY)}
+    def _record(self, r, marks, started, body):
+        def span(name):
+            begin, end = marks.get(name + ".started"), marks.get(name + ".complete")
+            return (end - begin) * 1000 if begin and end else 0.0
+        ended = time.perf_counter()
+        headers = (marks.get("http11.receive_response_headers.complete")
+                   or marks.get("http2.receive_response_headers.complete") or ended)
+        t = {"connect": span("connection.connect_tcp"), "tls": span("connection.start_tls"),
+             "ttfb": (headers - started) * 1000, "total": (ended - started) * 1000,
+             "reused": "connection.connect_tcp.started" not in marks, "status": r.status_code,
+             "wire": r.num_bytes_downloaded, "body": body, "encoding": r.headers.get("Content-Encoding", "")}
+        with self._lock:
+            self.requests += 1; self.reused += t["reused"]; self.wire += t["wire"]; self.body += t["body"]
+            for phase in self.PHASES: self.totals[phase] += t[phase]
+        return t
+    @staticmethod
+    def _decoder(r):
+        try: return codecs.getincrementaldecoder(r.encoding or "utf-8")(errors="replace")
+        except LookupError: return codecs.getincrementaldecoder("utf-8")(errors="replace")
+    @staticmethod
+    def _feed(r, decoder, chunk, sink):
+        """Pass one chunk on -> why reading stops ("enough" / "cap") or None."""
+        if sink(decoder.decode(chunk)): return "enough"
+        return "cap" if r.num_bytes_downloaded >= READ_MAX_BYTES else None
+    def get(self, url, headers=None, method="GET", sink=None):
+        """Sync request -> (response, timing). Without sink the body is read whole; with one, decoded
+        text goes to sink(text) chunk by chunk until it returns True or READ_MAX_BYTES arrived
+        (timing["stopped"] says which)."""
+        with self._lock:
+            if self._client is None: self._client = httpx.Client(**self._options())
+        marks, started = {}, time.perf_counter()
+        ext = {"trace": lambda event, info: marks.__setitem__(event, time.perf_counter())}
+        if sink is None:
+            r = self._client.request(method, url, headers=headers, extensions=ext)
+            return r, self._record(r, marks, started, len(r.content))
+        with self._client.stream(method, url, headers=headers, extensions=ext) as r:
+            body, stopped, decoder = 0, None, self._decoder(r)
+            if not r.is_error:
+                for chunk in r.iter_bytes(HTTP_CHUNK):
+                    body += len(chunk); stopped = self._feed(r, decoder, chunk, sink)
+                    if stopped: break
+                else: sink(decoder.decode(b"", final=True))
+            timing = self._record(r, marks, started, body)
+        timing["stopped"] = stopped
+        return r, timing
+    async def aget(self, url, headers=None, method="GET", sink=None):
+        if self._async is None: self._async = httpx.AsyncClient(**self._options())  # inside the event loop
+        marks = {}
+        async def trace(event, info): marks[event] = time.perf_counter()
+        started = time.perf_counter()
+        if sink is None:
+            r = await self._async.request(method, url, headers=headers, extensions={"trace": trace})
+            return r, self._record(r, marks, started, len(r.content))
+        async with self._async.stream(method, url, headers=headers, extensions={"trace": trace}) as r:
+            body, stopped, decoder = 0, None, self._decoder(r)
+            if not r.is_error:
+                async for chunk in r.aiter_bytes(HTTP_CHUNK):
+                    body += len(chunk); stopped = self._feed(r, decoder, chunk, sink)
+                    if stopped: break
+                else: sink(decoder.decode(b"", final=True))
+            timing = self._record(r, marks, started, body)
+        timing["stopped"] = stopped
+        return r, timing
+    def close(self):
+        if self._client is not None: self._client.close(); self._client = None
+    async def aclose(self):
+        if self._async is not None: await self._async.aclose(); self._async = None
+    @staticmethod
+    def describe_timing(t):
+        size = f"{t['body'] / 1024:.0f} KB" + (f" ({t['encoding']} {t['wire'] / 1024:.0f} KB)" if t["encoding"] else "")
+        link = "reused connection" if t["reused"] else f"connect {t['connect']:.0f} ms, tls {t['tls']:.0f} ms"
+        return f"{t['status']} | {size} | {link}, ttfb {t['ttfb']:.0f} ms, total {t['total']:.0f} ms"
+    def describe(self):
+        if not self.requests: return "no requests yet"
+        fresh = max(self.requests - self.reused, 1)
+        return (f"{self.requests} requests, {self.reused} on reused connections | avg connect "
+                f"{self.totals['connect'] / fresh:.0f} ms, tls {self.totals['tls'] / fresh:.0f} ms (new connections), "
+                f"ttfb {self.totals['ttfb'] / self.requests:.0f} ms, total {self.totals['total'] / self.requests:.0f} ms | "
+                f"{self.wire / 1024:.0f} KB received for {self.body / 1024:.0f} KB of content")
+
+http_client = HttpClient()
+
+class _PageReader:
+    """HttpClient sink: feeds streamed HTML to a TextExtractor, enough once READ_SCAN_CHARS are extracted."""
+    def __init__(self): self.parser = TextExtractor()
+    def __call__(self, html): self.parser.feed(html); return self.parser.size >= READ_SCAN_CHARS
+    def text(self, r, timing):
+        if not timing["stopped"]: self.parser.close()
+        text, notes = self.parser.markdown(), []
+        if not text: return "No content."
+        if len(text) > READ_TEXT_CHARS: text = text[:READ_TEXT_CHARS]; notes.append(f"truncated to {READ_TEXT_CHARS} chars")
+        if timing["stopped"]:
+            read, length = f"{timing['wire'] / 1024:.0f} KB", r.headers.get("Content-Length", "")
+            if length.isdigit() and int(length) > timing["wire"]:
+                read += f" of {int(length) / 1024:.0f} KB, {(int(length) - timing['wire']) / 1024:.0f} KB skipped"
+            notes.append(f"download capped at {READ_MAX_BYTES // (1024 * 1024)} MB: read {read}"
+                         if timing["stopped"] == "cap" else f"stopped reading after {read}")
+        return text + (f"\n[... {'; '.join(notes)}]" if notes else "")
+
+def _http_date(value):
+    parsed = parsedate_tz(value or "")
+    return mktime_tz(parsed) if parsed else None
+
+def _freshness(headers):
+    """Seconds a response may be reused without asking the server; None = don't store it. The lifetime
+    (max-age, Expires - Date or 10% of the Last-Modified age) minus the current age: Age, or the time
+    since Date when longer (RFC 9111 4.2.3)."""
+    directives = {}
+    for part in headers.get("Cache-Control", "").lower().split(","):
+        name, _, value = part.strip().partition("="); directives[name] = value.strip('"')
+    if "no-store" in directives: return None
+    if "no-cache" in directives: return 0
+    now = time.time(); date_header = _http_date(headers.get("Date")) or now
+    age = headers.get("Age", "").strip(); age = max(int(age) if age.isdigit() else 0, now - date_header, 0)
+    if directives.get("max-age", "").isdigit(): lifetime = int(directives["max-age"])
+    elif "Expires" in headers: lifetime = (_http_date(headers.get("Expires")) or 0) - date_header  # invalid = expired
+    else:
+        modified = _http_date(headers.get("Last-Modified"))
+        lifetime = 0 if modified is None else min(max(0, date_header - modified) / 10, HTTP_HEURISTIC_MAX_AGE)
+    return max(0, lifetime - age)
+
+class PageCache:
+    """Extracted pages on disk (SQLite) with their validators; fresh entries skip the request, stale ones are
+    re-requested conditionally (304 keeps the text). Size-bounded, least recently used first."""
+    def __init__(self, path, max_bytes):
+        self.path, self.max_bytes = path, max_bytes
+        self.hits = self.revalidated = self.misses = 0  # served fresh / 304 / body downloaded
+        self._lock = threading.Lock(); self._db = None
+    def _open(self):
+        """The database, opened on first use; call with the lock held."""
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, text TEXT, etag TEXT, "
+                             "last_modified TEXT, expires REAL, accessed REAL, size INTEGER)")
+            self._db.commit()
+        return self._db
+    def lookup(self, url):
+        """{"text", "etag", "last_modified", "fresh"} of a stored page, or None."""
+        with self._lock:
+            db = self._open()
+            row = db.execute("SELECT text, etag, last_modified, expires FROM pages WHERE url = ?", (url,)).fetchone()
+            if row is None: return None
+            fresh = time.time() < row[3]
+            if fresh:
+                db.execute("UPDATE pages SET accessed = ? WHERE url = ?", (time.time(), url)); db.commit()
+                self.hits += 1
+        if fresh: print(f"  [💾 {url} fresh in the page cache]")
+        return {"text": row[0], "etag": row[1], "last_modified": row[2], "fresh": fresh}
+    @staticmethod
+    def conditional(entry):
+        headers = {}
+        if entry and entry["etag"]: headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]: headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+    def refresh(self, url, headers):
+        """304: the stored text is current for another max-age."""
+        now = time.time()
+        with self._lock:
+            db = self._open()
+            self.revalidated += 1
+            db.execute("UPDATE pages SET expires = ?, accessed = ?, etag = COALESCE(?, etag) WHERE url = ?",
+                       (now + (_freshness(headers) or 0), now, headers.get("ETag"), url))
+            db.commit()
+    def store(self, url, text, headers):
+        """Record a downloaded page; kept when the server allows it and it can be reused or revalidated."""
+        freshness, etag, modified, now = _freshness(headers), headers.get("ETag"), headers.get("Last-Modified"), time.time()
+        with self._lock:
+            db = self._open()
+            self.misses += 1
+            if freshness is None or not (freshness or etag or modified):
+                db.execute("DELETE FROM pages WHERE url = ?", (url,)); db.commit(); return
+            db.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (url, text, etag, modified, now + freshness, now, len(text)))
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM pages").fetchone()[0]
+            for old_url, size in db.execute("SELECT url, size FROM pages ORDER BY accessed").fetchall():
+                if total <= self.max_bytes: break
+                db.execute("DELETE FROM pages WHERE url = ?", (old_url,)); total -= size
+            db.commit()
+    def describe(self):
+        with self._lock:
+            db = self._open()
+            count, size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pages").fetchone()
+        return (f"{self.hits} fresh hits / {self.revalidated} revalidated (304) / {self.misses} misses | "
+                f"{count} pages, {size / 1024:.0f} KB")
+
+page_cache = PageCache(HTTP_DISK_CACHE_PATH, HTTP_DISK_CACHE_MAX_BYTES) if HTTP_DISK_CACHE else None
+
+def _fetched(url, r, timing, reader, cached):
+    print(f"  [🌐 {HttpClient.describe_timing(timing)}]")
+    if r.status_code == 304 and cached: page_cache.refresh(url, r.headers); return cached["text"]
+    r.raise_for_status()
+    text = reader.text(r, timing)
+    if page_cache: page_cache.store(url, text, r.headers)
+    return text
+
+def _read_page(url, timing):
+    """One page through the page cache; timing is filled in when a request is made."""
+    cached = page_cache.lookup(url) if page_cache else None
+    if cached and cached["fresh"]: return cached["text"]
+    reader = _PageReader(); r, t = http_client.get(url, PageCache.conditional(cached), sink=reader)
+    timing.update(t); return _fetched(url, r, t, reader, cached)
+
+async def _read_page_async(url, timing):
+    """_read_page on the event loop; the page cache's SQLite work runs in a thread."""
+    cached = await asyncio.to_thread(page_cache.lookup, url) if page_cache else None
+    if cached and cached["fresh"]: return cached["text"]
+    reader = _PageReader(); r, t = await http_client.aget(url, PageCache.conditional(cached), sink=reader)
+    timing.update(t); return await asyncio.to_thread(_fetched, url, r, t, reader, cached)
+
 def _read_webpage(url):
-    try:
-        if not url.startswith("http"): url = "https://" + url
-        req = urllib.request.Request(url, headers={"User-Agent":"Mozilla/5.0"})
-        with urllib.request.urlopen(req, timeout=15) as r:
-            html = r.read().decode("utf-8", errors="ignore")
-        p = TextExtractor(); p.feed(html); text = "\n".join(p.text)
-        return (text[:8000] + "\n[truncated]") if len(text) > 8000 else text or "No content."
+    try: return _read_page(_normalize_url(url), {})
+    except Exception as e: return f"Fetch error: {e}"
+
+async def _read_webpage_async(url):
+    try: return await _read_page_async(_normalize_url(url), {})
     except Exception as e: return f"Fetch error: {e}"
 
+_web_pool = ThreadPoolExecutor(max_workers=WEB_BATCH_WORKERS, thread_name_prefix="web")
+
+def _batch_urls(urls):
+    out = []
+    for url in urls:
+        url = _normalize_url(url.strip()) if url and url.strip() else ""
+        if url and url not in out: out.append(url)
+    return out[:WEB_BATCH_MAX]
+
+def _batch_report(urls, results, elapsed):
+    """One section per URL: status and timing, then its share of WEB_BATCH_CHARS."""
+    per_url, out = max(1000, WEB_BATCH_CHARS // len(urls)), []
+    for n, (url, (text, timing)) in enumerate(zip(urls, results), start=1):
+        failed = text.startswith("Fetch error")
+        state = f"{timing['status']} | {timing['total']:.0f} ms" if timing else ("failed" if failed else "cached")
+        if failed: out.append(f"[{n}] {url} | {state} | {text.splitlines()[0][:200]}"); continue
+        out.append(f"[{n}] {url} | {state}\n{text[:per_url] + ' [...]' if len(text) > per_url else text}")
+    fetched = sum(not text.startswith("Fetch error") for text, _ in results)
+    return (f"Fetched {fetched}/{len(urls)} pages in {elapsed:.1f} s ({WEB_BATCH_WORKERS} at a time, "
+            f"at most {WEB_PER_HOST} per host)\n\n" + "\n\n".join(out))
+
+def _read_webpages(urls):
+    """Fetch several pages concurrently through the read_webpage cache; misses run on
+    WEB_BATCH_WORKERS threads, at most WEB_PER_HOST per host."""
+    urls = _batch_urls(urls)
+    if not urls: return "No URLs given."
+    slots = {host: threading.Semaphore(WEB_PER_HOST) for host in map(_url_domain, urls)}
+    def fetch_one(url):
+        timing = {}
+        def fetch(args):
+            with slots[_url_domain(url)]:
+                try: return _read_page(url, timing)
+                except Exception as e: return f"Fetch error: {e}"
+        return tool_cache.call("read_webpage", {"url": url}, fetch), timing
+    started = time.perf_counter()
+    results = list(_web_pool.map(fetch_one, urls))
+    return _batch_report(urls, results, time.perf_counter() - started)
+
+async def _read_webpages_async(urls):
+    urls = _batch_urls(urls)
+    if not urls: return "No URLs given."
+    workers = asyncio.Semaphore(WEB_BATCH_WORKERS)
+    slots = {host: asyncio.Semaphore(WEB_PER_HOST) for host in map(_url_domain, urls)}
+    async def fetch_one(url):
+        timing = {}
+        async def fetch(args):
+            async with workers, slots[_url_domain(url)]:
+                try: return await _read_page_async(url, timing)
+                except Exception as e: return f"Fetch error: {e}"
+        return await tool_cache.acall("read_webpage", {"url": url}, fetch), timing
+    started = time.perf_counter()
+    results = await asyncio.gather(*(fetch_one(url) for url in urls))
+    return _batch_report(urls, results, time.perf_counter() - started)
+
 def _thin_border():
     t = Side(style="thin")
     return Border(left=t, right=t, top=t, bottom=t)
@@ -454,6 +1611,16 @@ def _run_command(command):
     except subprocess.TimeoutExpired: return "Timeout."
     except Exception as e: return f"Command error: {e}"
 
+async def _run_command_async(command):
+    try:
+        proc = await asyncio.create_subprocess_shell(
+            command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try: out, err = await asyncio.wait_for(proc.communicate(), timeout=30)
+        except asyncio.TimeoutError: proc.kill(); await proc.wait(); return "Timeout."
+        out = (out + err).decode("utf-8", errors="ignore")
+        return (out[:5000] + "\n[truncated]") if len(out) > 5000 else out or "Done (no output)."
+    except Exception as e: return f"Command error: {e}"
+
 
 # ─────────────────────────────────────────
 # TOOL DISPATCHER
@@ -470,17 +1637,27 @@ TOOL_MAP = {
     "browser_goto":          lambda a: _browser_goto(a["url"]),
     "browser_click":         lambda a: _browser_click(a["selector"]),
     "browser_type":          lambda a: _browser_type(a["selector"], a["text"]),
-    "browser_get_text":      lambda a: _browser_get_text(),
-    "browser_screenshot":    lambda a: _browser_screenshot(a["path"]),
-    "browser_get_links":     lambda a: _browser_get_links(),
+    "browser_get_text":      lambda a: _browser_get_text(a.get("offset", 0), a.get("mode", "main"), a.get("diff", False)),
+    "browser_screenshot":    lambda a: _browser_screenshot(a["path"], a.get("scope","full"), a.get("selector",""),
+                                                           dict(a["clip"]) if a.get("clip") else None,
+                                                           a.get("format",""), a.get("quality", SCREENSHOT_JPEG_QUALITY),
+                                                           a.get("max_height", SCREENSHOT_MAX_HEIGHT)),
+    "browser_get_links":     lambda a: _browser_get_links(a.get("filter",""), a.get("domain",""),
+                                                          a.get("offset", 0), a.get("limit", LINKS_PAGE)),
+    "browser_snapshot":      lambda a: _browser_snapshot(),
     "browser_scroll":        lambda a: _browser_scroll(a["direction"]),
     "browser_press_key":     lambda a: _browser_press_key(a["key"]),
     "browser_select_option": lambda a: _browser_select_option(a["selector"], a["value"]),
     "browser_wait":          lambda a: _browser_wait(a["seconds"]),
+    "browser_wait_for":      lambda a: _browser_wait_for(a["condition"], str(a.get("value") or ""),
+                                                        a.get("timeout_ms", WAIT_FOR_TIMEOUT)),
     "browser_current_url":   lambda a: _browser_current_url(),
     "browser_go_back":       lambda a: _browser_go_back(),
     "browser_eval_js":       lambda a: _browser_eval_js(a["script"]),
+    "browser_open_many":     lambda a: _browser_open_many(list(a["urls"])),
+    "browser_set_profile":   lambda a: _browser_set_profile(a["profile"]),
     "read_webpage":          lambda a: _read_webpage(a["url"]),
+    "read_webpages":         lambda a: _read_webpages(a["urls"]),
     "create_excel":          lambda a: _create_excel(a["path"], a["sheets_data"]),
     "read_excel":            lambda a: _read_excel(a["path"]),
     "edit_excel_cell":       lambda a: _edit_excel_cell(a["path"], a["sheet_name"], a["cell"], a["value"]),
@@ -493,6 +1670,7 @@ TOOL_MAP = {
                                                            a.get("bold", False), a.get("bg_color"),
                                                            a.get("font_size")),
     "run_command":           lambda a: _run_command(a["command"]),
+    "request_tools":         lambda a: _request_tools(a.get("groups") or ["all"]),
 }
 
 
@@ -500,7 +1678,177 @@ def handle_tool_call(name: str, args: dict) -> str:
     preview = ", ".join(f"{k}={repr(v)[:50]}" for k, v in args.items())
     print(f"  [🔧 {name}({preview})]")
     handler = TOOL_MAP.get(name)
-    return str(handler(args)) if handler else f"Unknown tool: {name}"
+    if not handler: return f"Unknown tool: {name}"
+    if name not in BROWSER_TOOLS: screenshot_writer.wait_for(tool_resources(name, args))
+    if name in READ_ONLY_TOOLS: return str(tool_cache.call(name, args, handler))
+    result = handler(args)
+    tool_cache.invalidate(name, args)
+    return str(result)
+
+
+# ─────────────────────────────────────────
+# TOOL EXECUTOR - PARALLEL INDEPENDENT CALLS
+# Calls sharing a resource (browser page, same path) keep their order.
+# Browser tools run on one dedicated thread: sync Playwright is thread-bound.
+# ─────────────────────────────────────────
+MAX_TOOL_WORKERS = 4
+BROWSER_TOOLS = {n for n in TOOL_MAP if n.startswith("browser_")}
+EXCEL_TOOLS   = {"create_excel","read_excel","edit_excel_cell","add_excel_formula",
+                 "add_excel_chart","add_excel_sheet","excel_add_rows","excel_style_range"}
+
+def _path_key(path, suffix=""):
+    path = fix_path(path or ".")
+    if suffix and not path.endswith(suffix): path += suffix
+    return "path:" + os.path.normcase(os.path.abspath(path))
+
+def tool_resources(name, args):
+    if name in BROWSER_TOOLS:
+        if name != "browser_screenshot": return {"browser"}
+        return {"browser", _path_key(_screenshot_path(args.get("path",""), args.get("format","")))}
+    if name in EXCEL_TOOLS: return {_path_key(args.get("path",""), ".xlsx")}
+    if name in ("copy_file","move_file"): return {_path_key(args.get("src","")), _path_key(args.get("dst",""))}
+    if name == "list_files": return {_path_key(args.get("directory","."))}
+    if name in ("read_file","write_file","open_file","delete_file","create_directory"):
+        return {_path_key(args.get("path",""))}
+    if name == "run_command": return {"*"}  # a shell command can touch anything
+    return set()
+
+def _resources_conflict(a, b):
+    if "*" in a or "*" in b: return True
+    for ka in a:
+        for kb in b:
+            if ka == kb: return True
+            if ka.startswith("path:") and kb.startswith("path:") and \
+               (ka.startswith(kb + os.sep) or kb.startswith(ka + os.sep)): return True
+    return False
+
+class ToolExecutor:
+    def __init__(self, max_workers=MAX_TOOL_WORKERS):
+        self._pool    = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        self._browser = ThreadPoolExecutor(max_workers=1, thread_name_prefix="browser")
+        self._lock    = threading.Lock()
+        self._pending = []  # (resources, future)
+
+    def submit(self, name, args, session=None):
+        """Browser tools of a named session drive its own page, independent of other sessions."""
+        keys = tool_resources(name, args)
+        if session is not None and "browser" in keys: keys = (keys - {"browser"}) | {"browser:" + session}
+        with self._lock:
+            self._pending = [(k, f) for k, f in self._pending if not f.done()]
+            deps = [f for k, f in self._pending if _resources_conflict(keys, k)]
+            pool = self._browser if name in BROWSER_TOOLS else self._pool
+            fut  = pool.submit(self._run, deps, name, args, session)
+            self._pending.append((keys, fut))
+        return fut
+
+    @staticmethod
+    def _run(deps, name, args, session=None):
+        wait(deps)
+        if name not in BROWSER_TOOLS: return handle_tool_call(name, args)
+        _browser_owner.session = session
+        try: return handle_tool_call(name, args)
+        finally: _browser_owner.session = None
+
+    def run_all(self, calls):
+        futures = [self.submit(n, a) for n, a in calls]
+        return [f.result() for f in futures]
+
+    def submit_to_browser_thread(self, fn): return self._browser.submit(fn)
+
+    def run_in_browser_thread(self, fn):
+        return self.submit_to_browser_thread(fn).result()
+
+tool_executor = ToolExecutor()
+
+
+# ─────────────────────────────────────────
+# TOOL RESULT CACHE - READ-ONLY TOOLS
+# Files: reused while mtime/size are unchanged. Pages are not kept here - the page
+# cache honors their Cache-Control / Expires - but identical calls in flight
+# (pages included) share one run. Write tools drop the paths they touch.
+# ─────────────────────────────────────────
+READ_ONLY_TOOLS = {"read_file","read_excel","list_files","read_webpage"}
+ERROR_PREFIXES  = ("Read error","Excel read error","List error","Fetch error","openpyxl not available")
+
+def _normalize_url(url): return url if url.startswith("http") else "https://" + url
+
+def _tool_target(name, args):
+    return fix_path(args.get("directory",".") if name == "list_files" else args.get("path",""))
+
+def _file_validator(path):
+    """(mtime, size) of a file; of every entry for a folder, whose own mtime misses in-place rewrites."""
+    try:
+        if not os.path.isdir(path): st = os.stat(path); return (st.st_mtime_ns, st.st_size)
+        with os.scandir(path) as it: return sorted((e.name, e.stat().st_mtime_ns, e.stat().st_size) for e in it)
+    except OSError: return None
+
+class ToolResultCache:
+    def __init__(self):
+        self._entries, self._inflight = {}, {}  # key -> entry dict / Future
+        self._lock = threading.Lock(); self.hits = self.misses = 0
+
+    @staticmethod
+    def _key(name, args):
+        if name == "read_webpage": return "read_webpage:" + _normalize_url(args.get("url",""))
+        return name + ":" + os.path.normcase(os.path.abspath(_tool_target(name, args)))
+
+    def lookup(self, name, args):
+        if name == "read_webpage": return None
+        key, entry = self._key(name, args), self._entries.get(self._key(name, args))
+        if entry is not None and entry["validator"] == _file_validator(_tool_target(name, args)):
+            self.hits += 1; print(f"  [💾 {name} cached]"); return entry["result"]
+        self._entries.pop(key, None); self.misses += 1
+        return None
+
+    def store(self, name, args, result):
+        if name == "read_webpage" or str(result).startswith(ERROR_PREFIXES): return
+        validator = _file_validator(_tool_target(name, args))
+        if validator is None: return
+        self._entries[self._key(name, args)] = {"result": result, "validator": validator,
+                                                "paths": {_path_key(_tool_target(name, args))}}
+
+    def call(self, name, args, handler):
+        key = self._key(name, args)
+        with self._lock:
+            fut = self._inflight.get(key); owner = fut is None
+            if owner: fut = self._inflight[key] = Future()
+        if not owner:
+            print(f"  [💾 {name} joined an identical call in flight]"); return fut.result()
+        try:
+            result = self.lookup(name, args)
+            if result is None:
+                result = handler(args); self.store(name, args, result)
+            fut.set_result(result); return result
+        except BaseException as e:
+            fut.set_exception(e); raise
+        finally:
+            with self._lock: self._inflight.pop(key, None)
+
+    async def acall(self, name, args, handler):
+        """call() for a coroutine handler; joins identical calls from sessions and tool threads alike."""
+        key = self._key(name, args)
+        with self._lock:
+            fut = self._inflight.get(key); owner = fut is None
+            if owner: fut = self._inflight[key] = Future()
+        if not owner:
+            print(f"  [💾 {name} joined an identical call in flight]"); return await asyncio.wrap_future(fut)
+        try:
+            result = await asyncio.to_thread(self.lookup, name, args)
+            if result is None:
+                result = await handler(args); self.store(name, args, result)
+            fut.set_result(result); return result
+        except BaseException as e:
+            fut.set_exception(e); raise
+        finally:
+            with self._lock: self._inflight.pop(key, None)
+
+    def invalidate(self, name, args):
+        if name in READ_ONLY_TOOLS: return
+        touched = tool_resources(name, args)
+        for key, entry in list(self._entries.items()):
+            if _resources_conflict(entry["paths"], touched): self._entries.pop(key, None)
+
+tool_cache = ToolResultCache()
 
 
 # ─────────────────────────────────────────
@@ -554,22 +1902,50 @@ TOOL_DECLARATIONS = [
     FD(name="browser_goto", description="Navigate to a URL in the Chromium browser.",
        parameters=S(type=T.OBJECT, properties={"url": _s(T.STRING)}, required=["url"])),
 
-    FD(name="browser_click", description="Click an element by visible text or CSS selector.",
+    FD(name="browser_click", description="Click an element by browser_snapshot ref, visible text or CSS selector.",
        parameters=S(type=T.OBJECT, properties={"selector": _s(T.STRING)}, required=["selector"])),
 
-    FD(name="browser_type", description="Type text into a form field (placeholder, label, or CSS selector).",
+    FD(name="browser_type", description="Type text into a form field (browser_snapshot ref, placeholder, label, or CSS selector).",
        parameters=S(type=T.OBJECT, properties={
            "selector": _s(T.STRING,"Field identifier"),
            "text":     _s(T.STRING,"Text to type"),
        }, required=["selector","text"])),
 
-    FD(name="browser_get_text", description="Get all visible text from the current page (max 6000 chars).",
-       parameters=S(type=T.OBJECT, properties={})),
+    FD(name="browser_get_text", description="Get the page's main content as compact markdown (menus, cookie banners "
+                                            "and footers removed), 6000 chars per call. Long pages end with the "
+                                            "offset that returns the next chunk.",
+       parameters=S(type=T.OBJECT, properties={
+           "offset": _s(T.INTEGER, "Continue from this char (default 0)"),
+           "mode":   S(type=T.STRING, enum=["main","all"], description="main = main content (default), all = whole page"),
+           "diff":   _s(T.BOOLEAN, "Only the lines added/removed since you last read this page. Use it after click / type / scroll."),
+       })),
 
-    FD(name="browser_screenshot", description="Take a full-page screenshot and save as PNG.",
-       parameters=S(type=T.OBJECT, properties={"path": _s(T.STRING,"Output file path")}, required=["path"])),
+    FD(name="browser_screenshot", description="Save a screenshot of the page (default: full page, PNG). A .jpg path "
+                                              "or format 'jpeg' saves a much smaller JPEG.",
+       parameters=S(type=T.OBJECT, properties={
+           "path":       _s(T.STRING, "Output file path"),
+           "scope":      S(type=T.STRING, enum=["full","viewport","element","clip"],
+                           description="full page (default), visible viewport, one element, or a region"),
+           "selector":   _s(T.STRING, "CSS selector for scope 'element'"),
+           "clip":       S(type=T.OBJECT, description="Region for scope 'clip' in page pixels", properties={
+                             "x": _s(T.NUMBER), "y": _s(T.NUMBER), "width": _s(T.NUMBER), "height": _s(T.NUMBER)}),
+           "format":     S(type=T.STRING, enum=["png","jpeg"]),
+           "quality":    _s(T.INTEGER, "JPEG quality 1-100 (default 80)"),
+           "max_height": _s(T.INTEGER, "Split taller full pages into numbered tiles (default 10000 px)"),
+       }, required=["path"])),
+
+    FD(name="browser_get_links", description="List the page's content links (deduplicated, menus and footers skipped "
+                                             "unless filtered), visible ones first, 40 per call.",
+       parameters=S(type=T.OBJECT, properties={
+           "filter": _s(T.STRING, "Substring or /regex/ matched against link text and URL"),
+           "domain": _s(T.STRING, "Only links to this domain (and its subdomains)"),
+           "offset": _s(T.INTEGER, "Skip this many links (paging)"),
+           "limit":  _s(T.INTEGER, "Links per call (default 40, max 200)"),
+       })),
 
-    FD(name="browser_get_links", description="Return up to 40 links from the current page.",
+    FD(name="browser_snapshot", description="List the page's interactive elements (links, buttons, fields...) with "
+                                            "numbered refs. Pass a ref such as e12 as the selector of browser_click / "
+                                            "browser_type instead of guessing selectors. Refs stay valid until the page changes.",
        parameters=S(type=T.OBJECT, properties={})),
 
     FD(name="browser_scroll", description="Scroll the page: up, down, top, or bottom.",
@@ -585,9 +1961,19 @@ TOOL_DECLARATIONS = [
            "selector": _s(T.STRING), "value": _s(T.STRING),
        }, required=["selector","value"])),
 
-    FD(name="browser_wait", description="Wait N seconds (max 30).",
+    FD(name="browser_wait", description="Sleep N seconds (max 30). Prefer browser_wait_for.",
        parameters=S(type=T.OBJECT, properties={"seconds": _s(T.NUMBER)}, required=["seconds"])),
 
+    FD(name="browser_wait_for", description="Wait until the page is ready: an element or text is visible, the URL "
+                                            "changes, the network is idle or the DOM stops changing. Returns as soon "
+                                            "as it happens.",
+       parameters=S(type=T.OBJECT, properties={
+           "condition":  S(type=T.STRING, enum=["selector","text","url","network_idle","dom_settle"]),
+           "value":      _s(T.STRING, "CSS selector, text, URL part (empty = any change), or quiet window "
+                                      "in ms for network_idle / dom_settle"),
+           "timeout_ms": _s(T.INTEGER, "Default 10000, max 30000"),
+       }, required=["condition"])),
+
     FD(name="browser_current_url", description="Return the current URL and page title.",
        parameters=S(type=T.OBJECT, properties={})),
 
@@ -597,9 +1983,27 @@ TOOL_DECLARATIONS = [
     FD(name="browser_eval_js", description="Execute JavaScript on the page and return the result.",
        parameters=S(type=T.OBJECT, properties={"script": _s(T.STRING)}, required=["script"])),
 
+    FD(name="browser_open_many", description="Open several URLs at once in background pages and return each "
+                                             "page's title and opening text. The current page is not changed.",
+       parameters=S(type=T.OBJECT, properties={
+           "urls": S(type=T.ARRAY, items=_s(T.STRING), description="Up to 12 URLs")}, required=["urls"])),
+
+    FD(name="browser_set_profile", description="Switch the browser profile: 'fast' (headless, no images/media/"
+                                               "fonts/trackers), 'visible' (shown window, full rendering - use it "
+                                               "for screenshots that need images) or 'debug' (visible, slowed down). "
+                                               "The browser restarts.",
+       parameters=S(type=T.OBJECT, properties={
+           "profile": S(type=T.STRING, enum=["fast","visible","debug"])}, required=["profile"])),
+
     # ── WEB ──────────────────────────────────────────────────────────────
-    FD(name="read_webpage", description="Fast HTTP text fetch without a browser (max 8000 chars).",
+    FD(name="read_webpage", description="Fast HTTP fetch of a page's main content as markdown, without a browser "
+                                        "(menus and footers removed, max 8000 chars).",
        parameters=S(type=T.OBJECT, properties={"url": _s(T.STRING)}, required=["url"])),
+    FD(name="read_webpages", description="Fetch the text of several URLs at once via HTTP (no browser). Returns every page "
+                                         "with its status and timing in one result - use it instead of many read_webpage "
+                                         "calls when researching or summarizing several pages.",
+       parameters=S(type=T.OBJECT, properties={
+           "urls": S(type=T.ARRAY, items=_s(T.STRING), description="Up to 20 URLs")}, required=["urls"])),
 
     # ── EXCEL ─────────────────────────────────────────────────────────────
     FD(name="create_excel",
@@ -693,6 +2097,187 @@ TOOL_DECLARATIONS = [
 GEMINI_TOOLS = types.Tool(function_declarations=TOOL_DECLARATIONS)
 
 
+# ─────────────────────────────────────────
+# TOOL SELECTION - PER-TURN SUBSETS
+# Each request declares only the tool groups the current task needs: keyword
+# hits in the task plus groups already used or requested for it. No keyword
+# hit, request_tools("all") or a malformed call fall back to the full set.
+# ─────────────────────────────────────────
+TOOL_GROUPS = {
+    "files":   {"read_file","write_file","list_files","open_file","delete_file",
+                "copy_file","move_file","create_directory"},
+    "browser": BROWSER_TOOLS,
+    "excel":   EXCEL_TOOLS,
+    "system":  {"run_command"},
+    "web":     {"read_webpage","read_webpages"},
+}
+TOOL_GROUP_KEYWORDS = {
+    "files":   ["file","folder","director","desktop","save","write","copy","move","delete","remove",
+                "rename","path",".txt",".csv",".json",".py",".html","document","download"],
+    "browser": ["browser","open ","go to","navigate","click","type ","search","google","screenshot",
+                "website","site","page","login","log in","form","scroll","youtube","http","www.",".com"],
+    "excel":   ["excel","xlsx","spreadsheet","sheet","workbook","chart","formula","cell","table","budget"],
+    "system":  ["run","command","cmd","powershell","ipconfig","ping","install","pip ","process",
+                "system","network","disk","script"],
+    "web":     ["http","www.",".com","url","web","page","site","fetch","wikipedia","news","article",
+                "weather","search"],
+}
+REQUEST_TOOLS_DECL = FD(name="request_tools",
+    description="Enable more tools for this task when the ones you need are not available. "
+                "Groups: files, browser, excel, system, web, or all.",
+    parameters=S(type=T.OBJECT, properties={
+        "groups": S(type=T.ARRAY, items=_s(T.STRING, enum=list(TOOL_GROUPS) + ["all"]))}, required=["groups"]))
+
+tool_selection_stats = {"requests": 0, "subset": 0, "saved_tokens": 0}
+
+def _request_tools(groups):
+    """Handled by select_tools on the next request; this only acknowledges."""
+    unknown = [g for g in groups if g not in TOOL_GROUPS and g != "all"]
+    if unknown: return f"Unknown tool groups: {', '.join(unknown)}. Available: {', '.join(TOOL_GROUPS)}, all"
+    return f"Enabled tool groups: {', '.join(groups)}. They are available from the next step."
+
+def select_tool_groups(hist):
+    """Tool groups for the next request, or None for the full set."""
+    start = max((i for i, c in enumerate(hist) if _is_user_text(c)), default=None)
+    if start is None: return None
+    task   = " ".join(p.text for p in hist[start].parts if p.text).lower()
+    groups = {g for g, kws in TOOL_GROUP_KEYWORDS.items() if any(kw in task for kw in kws)}
+    if not groups: return None
+    for c in hist[start+1:]:
+        for p in c.parts or []:
+            fc = p.function_call
+            if not fc: continue
+            if fc.name != "request_tools":
+                groups.update(g for g, names in TOOL_GROUPS.items() if fc.name in names); continue
+            wanted = list((fc.args or {}).get("groups") or ["all"])
+            if "all" in wanted: return None
+            groups.update(g for g in wanted if g in TOOL_GROUPS)
+    return groups
+
+def select_tools(hist, all_tools=False):
+    """types.Tool for the next request. Records the prompt tokens saved."""
+    groups = None if all_tools else select_tool_groups(hist)
+    tool_selection_stats["requests"] += 1
+    if groups is None: return GEMINI_TOOLS
+    names = set().union(*(TOOL_GROUPS[g] for g in groups))
+    decls = [d for d in TOOL_DECLARATIONS if d.name in names] + [REQUEST_TOOLS_DECL]
+    tool_selection_stats["subset"] += 1
+    tool_selection_stats["saved_tokens"] += TOOLS_TOKENS - estimate_tokens(repr(decls))
+    return types.Tool(function_declarations=decls)
+
+def _tools_label(config):
+    tool = config.tools[0]
+    if tool is GEMINI_TOOLS: return "tools: all"
+    saved = TOOLS_TOKENS - estimate_tokens(repr(tool.function_declarations))
+    return f"tools: {len(tool.function_declarations) - 1}/{len(TOOL_DECLARATIONS)}, -{saved} tok"
+
+
+# ─────────────────────────────────────────
+# MODEL ROUTER - LIVE TELEMETRY
+# Per model and task type: moving averages of latency, tokens, API errors and
+# failed tool calls, persisted across restarts. choose_model's keyword pick
+# stands until the numbers show the other model is clearly more reliable, or
+# much faster once rate-limit waits are counted.
+# ─────────────────────────────────────────
+ROUTER_STATS_PATH  = os.path.join(os.path.expanduser("~"), ".geminiagent", "router_stats.json")
+ROUTER_MIN_SAMPLES = 5     # calls per model and task type before measurements count
+ROUTER_EWMA        = 0.2   # weight of the newest sample
+ROUTER_MIN_SUCCESS = 0.6   # below this a model is steered away from a task type
+ROUTER_SLOW_MARGIN = 15.0  # seconds the keyword pick may lag behind the other model
+TASK_CATEGORIES    = ["excel","browser","web","files","system"]  # first match wins
+# failed tool results: ToolResultCache's ERROR_PREFIXES, "<X> error: ...", misses, timeouts, missing deps
+TOOL_FAILURE       = re.compile("^(?:" + "|".join(map(re.escape, ERROR_PREFIXES)) +
+                                r"|❌|Unknown |Not found\b|Timeout\b|Timed out\b|No URLs given"
+                                r"|[\w ()]{1,30} (?:error|not found)\b|[\w ]{1,30} not available\b)")
+
+def task_category(source):
+    """Task type of a user text, or of the latest user turn in a history."""
+    if not isinstance(source, str):
+        users  = [c for c in source if _is_user_text(c)]
+        source = " ".join(p.text for p in users[-1].parts if p.text) if users else ""
+    text = source.lower()
+    return next((c for c in TASK_CATEGORIES if any(kw in text for kw in TOOL_GROUP_KEYWORDS[c])), "general")
+
+class ModelRouter:
+    def __init__(self, path):
+        self.path, self._lock = path, threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f: self.stats = json.load(f)
+        except (OSError, ValueError): self.stats = {}
+
+    def _entry(self, model, category):
+        return self.stats.setdefault(f"{model}|{category}", {
+            "calls": 0, "errors": 0, "quota_errors": 0, "error_rate": 0.0, "latency": 0.0, "tokens": 0.0,
+            "tool_ok": 0, "tool_failed": 0, "tool_fail_rate": 0.0})
+
+    @staticmethod
+    def _ewma(e, field, value, first):
+        e[field] = value if first else (1 - ROUTER_EWMA) * e[field] + ROUTER_EWMA * value
+
+    def _save(self):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".tmp", "w", encoding="utf-8") as f: json.dump(self.stats, f, indent=1)
+            os.replace(self.path + ".tmp", self.path)
+        except OSError: pass  # telemetry must never break a task
+
+    def record_call(self, model, category, latency, tokens):
+        with self._lock:
+            e = self._entry(model, category); first = e["calls"] == 0; e["calls"] += 1
+            self._ewma(e, "latency", latency, first); self._ewma(e, "tokens", tokens, first)
+            self._ewma(e, "error_rate", 0.0, first); self._save()
+
+    def record_error(self, model, category, error):
+        if isinstance(error, ReplayMiss): return
+        err = str(error).lower()
+        with self._lock:
+            e = self._entry(model, category); first = e["calls"] == 0
+            e["calls"] += 1; e["errors"] += 1
+            # Being throttled says nothing about the model's competence
+            if "quota" in err or "429" in err or "resource_exhausted" in err: e["quota_errors"] += 1
+            else: self._ewma(e, "error_rate", 1.0, first)
+            self._save()
+
+    def record_tools(self, model, category, results):
+        if not results: return
+        with self._lock:
+            e = self._entry(model, category)
+            for r in results:
+                failed = bool(TOOL_FAILURE.match(str(r))); first = e["tool_ok"] + e["tool_failed"] == 0
+                e["tool_failed" if failed else "tool_ok"] += 1
+                self._ewma(e, "tool_fail_rate", 1.0 if failed else 0.0, first)
+            self._save()
+
+    def reliability(self, model, category):
+        """Share of calls without API errors or failing tool calls, or None while unmeasured."""
+        e = self.stats.get(f"{model}|{category}")
+        if not e or e["calls"] < ROUTER_MIN_SAMPLES: return None
+        return (1 - e["error_rate"]) * (1 - e["tool_fail_rate"])
+
+    def expected_seconds(self, model, category):
+        e = self.stats.get(f"{model}|{category}") or {}
+        return rate_limiter.estimate_wait(model, int(e.get("tokens") or 2000)) + e.get("latency", 0.0)
+
+    def route(self, model, user_message, smart_left):
+        other = MODEL_FAST if model == MODEL_SMART else MODEL_SMART
+        if other == MODEL_SMART and not smart_left: return model
+        category = task_category(user_message)
+        mine, theirs = self.reliability(model, category), self.reliability(other, category)
+        if mine is not None and mine < ROUTER_MIN_SUCCESS and (theirs is None or theirs > mine + 0.15):
+            print(f"  [🧭 Router: {category} tasks succeed {mine:.0%} on {model} → {other}]"); return other
+        slower = self.expected_seconds(model, category) - self.expected_seconds(other, category)
+        if slower > ROUTER_SLOW_MARGIN and (theirs or 0) >= (mine if mine is not None else 1) - 0.1:
+            print(f"  [🧭 Router: {model} ~{slower:.0f}s slower right now → {other}]"); return other
+        return model
+
+    def describe(self):
+        return [f"{k.replace('|', ' / ')}: {e['calls']} calls, {e['error_rate']:.0%} errors, "
+                f"{e['tool_failed']}/{e['tool_ok'] + e['tool_failed']} tool calls failed, "
+                f"{e['latency']:.1f}s, ~{e['tokens']:.0f} tok" for k, e in sorted(self.stats.items())]
+
+model_router = ModelRouter(ROUTER_STATS_PATH)
+
+
 # ─────────────────────────────────────────
 # SYSTEM PROMPT
 # ─────────────────────────────────────────
@@ -700,8 +2285,8 @@ SYSTEM_PROMPT = f"""You are an advanced AI assistant with full access to a Windo
 
 AVAILABLE TOOLS (ALWAYS USE THEM when the task requires it):
 📁 FILES: read_file, write_file, list_files, open_file, delete_file, copy_file, move_file, create_directory
-🌐 BROWSER: browser_goto, browser_click, browser_type, browser_get_text, browser_screenshot, browser_get_links, browser_scroll, browser_press_key, browser_wait, browser_current_url, browser_go_back, browser_eval_js
-🔗 WEB: read_webpage
+🌐 BROWSER: browser_goto, browser_snapshot, browser_click, browser_type, browser_get_text, browser_screenshot, browser_get_links, browser_scroll, browser_press_key, browser_wait_for, browser_wait, browser_current_url, browser_go_back, browser_eval_js, browser_open_many, browser_set_profile
+🔗 WEB: read_webpage, read_webpages
 📊 EXCEL: create_excel, read_excel, edit_excel_cell, add_excel_formula, add_excel_chart, add_excel_sheet, excel_add_rows, excel_style_range
 ⚙️ SYSTEM: run_command
 
@@ -712,87 +2297,589 @@ CRITICAL RULES:
 4. If something fails, try an alternative approach.
 5. Google: browser_goto("google.com") → browser_type("q","query") → browser_press_key("Enter")
 6. Do NOT ask the user for data you can find with tools.
+7. To compare or skim several pages, load them together with browser_open_many.
+8. Before clicking or typing on an unfamiliar page, call browser_snapshot and use its refs (browser_click("e12")).
+9. Wait for page changes with browser_wait_for (element, text, url, network_idle, dom_settle), not browser_wait.
+10. The browser starts headless without images; browser_set_profile("visible") when the user wants to watch or needs images.
+11. After clicking, typing or scrolling, read what changed with browser_get_text(diff=true) instead of the whole page again.
+12. To read several known URLs, fetch them all in one read_webpages call.
 
 User desktop: {DESKTOP}"""
 
 
+# ─────────────────────────────────────────
+# RESPONSE CACHE - OPT-IN, ON DISK
+# off: always call the API | on: serve identical requests from disk
+# replay: recorded responses only, no network (fast regression runs)
+# ─────────────────────────────────────────
+LLM_CACHE_MODE      = os.environ.get("AGENT_LLM_CACHE", "off").lower()
+LLM_CACHE_PATH      = os.path.join(os.path.expanduser("~"), ".geminiagent", "llm_cache.sqlite")
+LLM_CACHE_TTL       = 7 * 24 * 3600     # seconds; ignored in replay mode
+LLM_CACHE_MAX_BYTES = 50 * 1024 * 1024  # least recently used entries go first
+
+
+class ReplayMiss(Exception):
+    """Raised in replay mode when a request was never recorded."""
+
+
+class ResponseCache:
+    """SQLite-backed key/value store with TTL and size-bounded LRU eviction."""
+    def __init__(self, path, ttl, max_bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.ttl, self.max_bytes, self.hits, self.misses = ttl, max_bytes, 0, 0
+        self._lock = threading.Lock()
+        self._db   = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT, "
+                         "created REAL, accessed REAL, size INTEGER)")
+        self._db.commit()
+
+    @staticmethod
+    def key(request):
+        canonical = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key, ignore_ttl=False):
+        with self._lock:
+            row = self._db.execute("SELECT value, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row and (ignore_ttl or time.time() - row[1] <= self.ttl):
+                self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+                self._db.commit(); self.hits += 1
+                return json.loads(row[0])
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        data, now = json.dumps(value, ensure_ascii=False, default=str), time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)", (key, data, now, now, len(data)))
+            self._db.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl,))
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            for old_key, size in self._db.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall():
+                if total <= self.max_bytes: break
+                self._db.execute("DELETE FROM entries WHERE key = ?", (old_key,)); total -= size
+            self._db.commit()
+
+    def count(self):
+        with self._lock: return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+
+response_cache = (ResponseCache(LLM_CACHE_PATH, LLM_CACHE_TTL, LLM_CACHE_MAX_BYTES)
+                  if LLM_CACHE_MODE in ("on", "replay") else None)
+
+
+def _dump(obj): return obj.model_dump(mode="json", exclude_none=True)
+
+def _cache_key(model, contents, config):
+    """model = the one the task asked for (keyword_model), not where routing or a fallback sent it,
+    so replays don't depend on the router's stats or the day's quota."""
+    if response_cache is None: return None
+    if not isinstance(contents, str): contents = [_dump(c) for c in contents]
+    return ResponseCache.key({"model": model, "contents": contents, "config": _dump(config)})
+
+def _cache_lookup(key, model):
+    """Return the recorded model Content (as a dict), or None. Replay mode never misses silently."""
+    if key is None: return None
+    hit = response_cache.get(key, ignore_ttl=LLM_CACHE_MODE == "replay")
+    if hit is None and LLM_CACHE_MODE == "replay":
+        raise ReplayMiss(f"no recorded response for this {model} request (replay mode)")
+    return hit
+
+
+# ─────────────────────────────────────────
+# RATE LIMITER - CLIENT-SIDE PACING
+# Token buckets for requests/min and tokens/min per (API key, model): calls wait
+# for capacity before they are sent instead of finding out from a 429. Gemini
+# sends no rate-limit headers, so usage_metadata settles each call's real cost
+# and quota errors (QuotaFailure quotaValue, RetryInfo retryDelay) resize/block.
+# ─────────────────────────────────────────
+RATE_LIMITS = {MODEL_FAST: (15, 1_000_000), MODEL_SMART: (5, 250_000)}  # free tier (rpm, tpm)
+DEFAULT_RATE_LIMIT = (10, 250_000)
+API_KEY_ID = hashlib.sha256(API_KEY.encode()).hexdigest()[:8]  # never keep the raw key around
+
+class TokenBucket:
+    """Refills at rate/second up to capacity. A negative level is the debt of callers already promised a slot."""
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute); self.rate = per_minute / 60.0; self.level = float(per_minute)
+        self.stamp = time.monotonic(); self.blocked_until = 0.0
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.stamp) * self.rate); self.stamp = now
+    def reserve(self, amount, now):
+        self._refill(now); self.level -= min(amount, self.capacity)
+        return max(-self.level / self.rate if self.level < 0 else 0.0, self.blocked_until - now)
+    def wait_for(self, amount, now):
+        self._refill(now); deficit = min(amount, self.capacity) - self.level
+        return max(deficit / self.rate if deficit > 0 else 0.0, self.blocked_until - now)
+    def resize(self, per_minute, now):
+        self._refill(now); self.capacity = float(per_minute); self.rate = per_minute / 60.0
+        self.level = min(self.level, self.capacity)
+
+class RateLimiter:
+    def __init__(self, limits):
+        self._limits, self._buckets, self._strikes = limits, {}, {}
+        self._lock = threading.Lock(); self.waiting = self.throttled = 0; self.waited = 0.0
+
+    def _pair(self, model):
+        key = (API_KEY_ID, model)
+        if key not in self._buckets:
+            rpm, tpm = self._limits.get(model, DEFAULT_RATE_LIMIT)
+            self._buckets[key] = (TokenBucket(rpm), TokenBucket(tpm))
+        return self._buckets[key]
+
+    def reserve(self, model, tokens):
+        with self._lock:
+            now = time.monotonic(); requests, toks = self._pair(model)
+            return max(requests.reserve(1, now), toks.reserve(tokens, now))
+
+    def estimate_wait(self, model, tokens):
+        """Seconds a call of ~tokens would wait right now, without reserving anything."""
+        with self._lock:
+            now = time.monotonic(); requests, toks = self._pair(model)
+            return max(requests.wait_for(1, now), toks.wait_for(tokens, now))
+
+    def _wait(self, model, delay, delta):
+        with self._lock:
+            self.waiting += delta
+            if delta > 0: self.throttled += 1; self.waited += delay
+            depth = self.waiting
+        if delta > 0: print(f"  [⏳ Pacing {model}: {delay:.1f}s, {depth} queued]", flush=True)
+
+    def acquire(self, model, tokens):
+        """Block until model has capacity for one call of ~tokens. Returns tokens for settle()."""
+        delay = self.reserve(model, tokens)
+        if delay > 0:
+            self._wait(model, delay, +1)
+            try: time.sleep(delay)
+            finally: self._wait(model, delay, -1)
+        return tokens
+
+    async def acquire_async(self, model, tokens):
+        delay = self.reserve(model, tokens)
+        if delay > 0:
+            self._wait(model, delay, +1)
+            try: await asyncio.sleep(delay)
+            finally: self._wait(model, delay, -1)
+        return tokens
+
+    def settle(self, model, reserved, usage):
+        """Replace the estimate with the real token count from usage_metadata."""
+        used = getattr(usage, "total_token_count", None)
+        if used is None: return
+        with self._lock:
+            self._pair(model)[1].level += reserved - used; self._strikes.pop(model, None)
+
+    def penalize(self, model, error):
+        """Apply a quota error: resize per-minute buckets, block for retryDelay (or a growing backoff)."""
+        text = str(error)
+        delay = re.search(r"retryDelay['\"]?\s*:\s*['\"]([\d.]+)s", text)
+        with self._lock:
+            now = time.monotonic(); requests, toks = self._pair(model)
+            for quota_id, value in re.findall(r"quotaId['\"]?\s*:\s*['\"]([\w-]+)['\"].*?quotaValue['\"]?\s*:\s*['\"](\d+)", text):
+                if "PerMinute" in quota_id: (toks if "Token" in quota_id else requests).resize(int(value), now)
+            if delay: blocked = float(delay.group(1))
+            else:
+                strikes = self._strikes[model] = self._strikes.get(model, 0) + 1
+                blocked = min(2 ** strikes * 5, 60)
+            for b in (requests, toks): b.blocked_until = max(b.blocked_until, now + blocked)
+        return blocked
+
+    def describe(self):
+        with self._lock:
+            now, lines = time.monotonic(), []
+            for (_, model), (requests, toks) in self._buckets.items():
+                toks._refill(now); requests._refill(now)
+                lines.append(f"{model}: ~{max(requests.level, 0):.0f}/{requests.capacity:.0f} req/min, "
+                             f"~{max(toks.level, 0):.0f}/{toks.capacity:.0f} tokens/min")
+            return lines
+
+rate_limiter = RateLimiter(RATE_LIMITS)
+
+def _prompt_tokens(contents, config):
+    n = estimate_tokens(contents) if isinstance(contents, str) else history_tokens(contents)
+    if config.tools: n += estimate_tokens(repr(config.tools[0].function_declarations))
+    return n + estimate_tokens(config.system_instruction or "")
+
+
 # ─────────────────────────────────────────
 # CONVERSATION HISTORY + API LOOP
 # ─────────────────────────────────────────
-MAX_TURNS = 50
+MAX_ITER  = 25
 history: list[types.Content] = []
 
+# Prompt budget per model (history + tool declarations). Big prompts are slow
+# and eat the tokens-per-minute quota long before the context window fills.
+CONTEXT_BUDGET = {MODEL_FAST: 32000, MODEL_SMART: 32000}
+SUMMARY_PREFIX = "Summary of the earlier conversation:"
+
+
+def estimate_tokens(text):
+    """Fast local estimate: ~4 characters per token."""
+    return (len(text) + 3) // 4
+
+TOOLS_TOKENS = estimate_tokens(repr(TOOL_DECLARATIONS))
+
+def content_tokens(c):
+    n = 4
+    for p in c.parts or []:
+        if p.text: n += estimate_tokens(p.text)
+        if p.function_call:
+            n += 8 + estimate_tokens(p.function_call.name + json.dumps(dict(p.function_call.args or {}), default=str))
+        if p.function_response:
+            n += 8 + estimate_tokens(json.dumps(p.function_response.response, default=str))
+    return n
+
+def history_tokens(hist): return sum(content_tokens(c) for c in hist)
+
+def _is_user_text(c): return c.role == "user" and any(p.text for p in c.parts or [])
+
+
+def _evict_stale_tool_outputs(hist, budget):
+    """Shrink tool results the model has already answered, oldest first."""
+    last_model = max((i for i, c in enumerate(hist) if c.role == "model"), default=-1)
+    total = history_tokens(hist)
+    for i, c in enumerate(hist[:last_model]):
+        if total > budget and any(p.function_response for p in c.parts or []):
+            parts = []
+            for p in c.parts:
+                r = p.function_response
+                if r and len(str(r.response.get("result", ""))) >= 200:
+                    p = types.Part(function_response=types.FunctionResponse(name=r.name, response={
+                        "result": f"[evicted stale tool output: {len(str(r.response['result']))} chars]"}))
+                parts.append(p)
+            new = types.Content(role=c.role, parts=parts)
+            total += content_tokens(new) - content_tokens(c); hist[i] = new
+
+
+def _summarize(older):
+    lines = []
+    for c in older:
+        for p in c.parts or []:
+            if p.text: lines.append(f"{c.role.upper()}: {p.text[:2000]}")
+            if p.function_call: lines.append(f"{c.role.upper()}: [called {p.function_call.name}({str(p.function_call.args)[:200]})]")
+            if p.function_response: lines.append(f"TOOL {p.function_response.name}: {str(p.function_response.response)[:500]}")
+    config = types.GenerateContentConfig(
+        system_instruction="Summarize this conversation in under 250 words. Keep facts, numbers, file paths, "
+                           "URLs, decisions and unfinished tasks. Drop small talk.",
+        max_output_tokens=600)
+    key = _cache_key(MODEL_FAST, "\n".join(lines), config)
+    hit = _cache_lookup(key, MODEL_FAST)
+    if hit is not None: return hit["text"]
+    reserved = rate_limiter.acquire(MODEL_FAST, _prompt_tokens("\n".join(lines), config))
+    count_model_call(MODEL_FAST)
+    response = client.models.generate_content(model=MODEL_FAST, contents="\n".join(lines), config=config)
+    rate_limiter.settle(MODEL_FAST, reserved, response.usage_metadata)
+    text = response.text.strip()
+    if key: response_cache.put(key, {"text": text})
+    return text
+
+
+def compact_history(hist, model):
+    """Fit the history into the model's token budget: evict stale tool outputs,
+    then roll older turns into one summary (fast model), then drop the oldest."""
+    budget = CONTEXT_BUDGET.get(model, 32000) - TOOLS_TOKENS
+    if history_tokens(hist) <= budget: return hist
+    hist = list(hist)
+    _evict_stale_tool_outputs(hist, budget)
+    if history_tokens(hist) <= budget: return hist
+
+    # Keep recent turns worth about half the budget, starting at a user message
+    cut, kept = len(hist), 0
+    while cut > 0 and kept + content_tokens(hist[cut-1]) <= budget // 2:
+        cut -= 1; kept += content_tokens(hist[cut])
+    starts = [i for i, c in enumerate(hist) if _is_user_text(c)]
+    cut = next((i for i in starts if i >= cut), starts[-1] if starts else cut)
+    older, recent = hist[:cut], hist[cut:]
+    if older:
+        try:
+            print(f"  [🗜️  Summarizing {len(older)} older messages]")
+            hist = [types.Content(role="user",  parts=[types.Part(text=f"{SUMMARY_PREFIX}\n{_summarize(older)}")]),
+                    types.Content(role="model", parts=[types.Part(text="Understood.")])] + recent
+        except Exception as e:
+            print(f"  [⚠️  Summary failed: {str(e)[:80]}]"); hist = recent
 
-def trim_history():
-    global history
-    if len(history) > MAX_TURNS * 2:
-        history = history[-(MAX_TURNS * 2):]
+    # Last resort: drop the oldest, always restarting at a user text message
+    while history_tokens(hist) > budget and len(hist) > 1:
+        hist.pop(0)
+        while len(hist) > 1 and not _is_user_text(hist[0]): hist.pop(0)
+    return hist
 
 
-def call_gemini(user_text: str, retries: int = 3) -> str:
-    global history
-    model = choose_model(user_text)
-    history.append(types.Content(role="user", parts=[types.Part(text=user_text)]))
-    trim_history()
+class StreamInterrupted(Exception):
+    """A streamed turn broke off after some of its tool calls had already started."""
+    def __init__(self, error, parts, futures):
+        super().__init__(str(error)); self.parts, self.futures = parts, futures
 
-    config = types.GenerateContentConfig(
+
+def _stream_gemini(model, config):
+    """Stream one model turn. Text is printed as it arrives and each tool starts
+    as soon as its function_call part lands. Returns (model_content, futures, usage)."""
+    parts, futures, printed, usage = [], [], False, None
+    reserved = rate_limiter.acquire(model, _prompt_tokens(history, config))
+    count_model_call(model)
+    stream = client.models.generate_content_stream(model=model, contents=history, config=config)
+    try:
+        for i, chunk in enumerate(stream):
+            if i == 0: print(" ✓")
+            usage = chunk.usage_metadata or usage
+            if not chunk.candidates or not chunk.candidates[0].content: continue
+            for p in chunk.candidates[0].content.parts or []:
+                parts.append(p)
+                if p.function_call:
+                    fc = p.function_call
+                    futures.append(tool_executor.submit(fc.name, dict(fc.args) if fc.args else {}))
+                elif p.text:
+                    if not printed: print("\n🤖 Agent: ", end="", flush=True); printed = True
+                    print(p.text, end="", flush=True)
+    except Exception as e:
+        if futures: raise StreamInterrupted(e, [p for p in parts if p.function_call], futures) from e
+        raise
+    if printed: print("\n")
+    rate_limiter.settle(model, reserved, usage)
+    return types.Content(role="model", parts=parts), futures, usage
+
+
+def _generate(model, config, requested=None):
+    """One model turn on the global history, served from the response cache when possible.
+    Returns (model_content, futures); futures is None when no tool was started yet."""
+    key = _cache_key(requested or model, history, config)
+    hit = _cache_lookup(key, model)
+    if hit is not None:
+        content = types.Content.model_validate(hit); print(" ✓ 💾")
+        text = "".join(p.text for p in content.parts or [] if p.text)
+        if STREAM_RESPONSES and text: print(f"\n🤖 Agent: {text}\n")
+        return content, None
+    started = time.monotonic()
+    if STREAM_RESPONSES:
+        content, futures, usage = _stream_gemini(model, config)
+    else:
+        reserved = rate_limiter.acquire(model, _prompt_tokens(history, config))
+        count_model_call(model)
+        response = client.models.generate_content(model=model, contents=history, config=config)
+        rate_limiter.settle(model, reserved, response.usage_metadata)
+        content, futures, usage = response.candidates[0].content, None, response.usage_metadata; print(" ✓")
+    model_router.record_call(model, task_category(history), time.monotonic() - started,
+                             getattr(usage, "total_token_count", None) or _prompt_tokens(history, config))
+    if key: response_cache.put(key, _dump(content))
+    return content, futures
+
+
+def _gemini_config(hist, all_tools=False):
+    return types.GenerateContentConfig(
         system_instruction=SYSTEM_PROMPT,
-        tools=[GEMINI_TOOLS],
+        tools=[select_tools(hist, all_tools)],
         temperature=0.2,
         max_output_tokens=4096,
     )
 
+
+def _retry_plan(e, model, attempt, retries):
+    """Returns (model, seconds_to_wait) for the next attempt, or None to give up."""
+    if isinstance(e, ReplayMiss): return None
+    err = str(e).lower()
+    print(f"\n  [⚠️  Attempt {attempt+1}/{retries}: {str(e)[:120]}]")
+    if "quota" in err or "429" in err or "resource_exhausted" in err:
+        blocked = rate_limiter.penalize(model, e)  # the next call waits in the limiter
+        if model == MODEL_SMART:
+            print(f"  [↩️  Switching to {MODEL_FAST}]"); return MODEL_FAST, 0
+        print(f"  [⏳ {model} rate limited for {blocked:.1f}s]"); return model, 0
+    if "not found" in err or "unavailable" in err:
+        if model == MODEL_SMART:
+            print(f"  [↩️  Falling back to {MODEL_FAST}]"); return MODEL_FAST, 0
+    if attempt < retries - 1: return model, 3
+    return None
+
+
+def _tool_calls(parts):
+    return [(p.function_call.name, dict(p.function_call.args) if p.function_call.args else {})
+            for p in parts if p.function_call]
+
+
+def _collect_results(calls, futures):
+    """Wait for a tool batch (submitting it if nothing started yet). A tool that
+    raises reports its error to the model instead of failing the whole turn."""
+    if futures is None: futures = [tool_executor.submit(n, a) for n, a in calls]
+    results = []
+    for (name, _), f in zip(calls, futures):
+        try: results.append(f.result())
+        except Exception as e: results.append(f"Tool error ({name}): {e}")
+    return results
+
+
+def call_gemini(user_text: str, retries: int = 3) -> str:
+    """Run one task. Progress is checkpointed after every model turn and tool
+    batch: a retry redoes only the failed API call, never finished tool work."""
+    global history
+    model, requested = choose_model(user_text), keyword_model(user_text)
+    history.append(types.Content(role="user", parts=[types.Part(text=user_text)]))
+    all_tools, category = False, task_category(user_text)
+    step, pending = 0, None  # finished steps; (calls, futures) of a model turn still owed its results
+
     for attempt in range(retries):
         try:
-            print(f"  [🤖 {model}]", end="", flush=True)
-            MAX_ITER = 25
-            for _ in range(MAX_ITER):
-                response      = client.models.generate_content(model=model, contents=history, config=config)
-                model_content = response.candidates[0].content
-                history.append(model_content)
-                print(" ✓")
-
-                tool_parts = [p for p in model_content.parts if p.function_call]
-                text_parts = [p for p in model_content.parts if p.text]
-
-                if not tool_parts:
-                    return " ".join(p.text for p in text_parts if p.text).strip()
-
-                # Execute tools
-                result_parts = []
-                for part in tool_parts:
-                    fc   = part.function_call
-                    args = dict(fc.args) if fc.args else {}
-                    result_parts.append(types.Part(
-                        function_response=types.FunctionResponse(
-                            name=fc.name,
-                            response={"result": handle_tool_call(fc.name, args)},
-                        )
-                    ))
-                history.append(types.Content(role="user", parts=result_parts))
-                print(f"  [🤖 {model}]", end="", flush=True)
+            if attempt:
+                print(f"  [↻ Resuming at step {step + 1}{' with its tool calls kept' if pending else ''}]")
+            while step < MAX_ITER:
+                if pending is None:
+                    history = compact_history(history, model)
+                    config  = _gemini_config(history, all_tools)
+                    print(f"  [🤖 {model} | {_tools_label(config)}]", end="", flush=True)
+                    model_content, futures = _generate(model, config, requested)
+                    history.append(model_content)
+
+                    if not any(p.function_call for p in model_content.parts):
+                        if STREAM_RESPONSES: return ""  # already printed while streaming
+                        return " ".join(p.text for p in model_content.parts if p.text).strip()
+                    pending = (_tool_calls(model_content.parts), futures)  # checkpoint: model turn
+
+                # Execute tools - independent calls run in parallel
+                calls, futures = pending
+                results = _collect_results(calls, futures)
+                model_router.record_tools(model, category, results)
+                history.append(types.Content(role="user", parts=[
+                    types.Part(function_response=types.FunctionResponse(name=name, response={"result": result}))
+                    for (name, _), result in zip(calls, results)]))
+                step, pending = step + 1, None  # checkpoint: tool batch
 
             return "⚠️ Reached iteration limit."
 
         except Exception as e:
-            err = str(e).lower()
-            print(f"\n  [⚠️  Attempt {attempt+1}/{retries}: {str(e)[:120]}]")
-            if "quota" in err or "429" in err or "resource_exhausted" in err:
-                if model == MODEL_SMART:
-                    print(f"  [↩️  Switching to {MODEL_FAST}]"); model = MODEL_FAST; continue
-                wait = min(2**attempt * 5, 60)
-                print(f"  [⏳ Waiting {wait}s...]"); time.sleep(wait); continue
-            if "not found" in err or "unavailable" in err:
-                if model == MODEL_SMART:
-                    print(f"  [↩️  Falling back to {MODEL_FAST}]"); model = MODEL_FAST; continue
-            if attempt < retries - 1:
-                time.sleep(3); continue
-            raise
+            if isinstance(e, StreamInterrupted):  # keep the calls that already started, drop the rest
+                history.append(types.Content(role="model", parts=e.parts))
+                pending = (_tool_calls(e.parts), e.futures)
+            model_router.record_error(model, category, e)
+            plan = _retry_plan(e, model, attempt, retries)
+            if plan is None: raise
+            model, wait_s = plan
+            # The model may have reached for a tool outside the subset - offer them all
+            all_tools = all_tools or "function" in str(e).lower()
+            time.sleep(wait_s)
+
+
+# ─────────────────────────────────────────
+# ASYNC CORE - MANY SESSIONS IN ONE PROCESS
+# Network-bound tools are natively async; browser/file/Excel tools go through
+# tool_executor (sync Playwright is thread-bound), so no thread per session.
+# ─────────────────────────────────────────
+ASYNC_TOOL_MAP = {
+    "read_webpage":  lambda a: _read_webpage_async(a["url"]),
+    "read_webpages": lambda a: _read_webpages_async(a["urls"]),
+    "run_command":   lambda a: _run_command_async(a["command"]),
+}
+
+async def handle_tool_call_async(name, args, session=None):
+    if name in ASYNC_TOOL_MAP:
+        preview = ", ".join(f"{k}={repr(v)[:50]}" for k, v in args.items())
+        print(f"  [🔧 {name}({preview})]")
+        if screenshot_writer.pending: await asyncio.to_thread(screenshot_writer.wait_for, tool_resources(name, args))
+        if name in READ_ONLY_TOOLS: return await tool_cache.acall(name, args, ASYNC_TOOL_MAP[name])
+        result = await ASYNC_TOOL_MAP[name](args)
+        tool_cache.invalidate(name, args)
+        return result
+    return await asyncio.wrap_future(tool_executor.submit(name, args, session))
+
+async def run_tool_calls_async(calls, session=None):
+    """Run (name, args) pairs concurrently; calls sharing a resource keep their order.
+    A tool that raises yields its error text, so one bad call never loses the batch."""
+    tasks = []
+    async def run_after(deps, name, args):
+        if deps: await asyncio.wait(deps)
+        return await handle_tool_call_async(name, args, session)
+    for name, args in calls:
+        keys = tool_resources(name, args)
+        deps = [t for k, t in tasks if _resources_conflict(keys, k)]
+        tasks.append((keys, asyncio.ensure_future(run_after(deps, name, args))))
+    results = await asyncio.gather(*(t for _, t in tasks), return_exceptions=True)
+    return [f"Tool error ({name}): {r}" if isinstance(r, Exception) else r
+            for (name, _), r in zip(calls, results)]
+
+
+class AgentSession:
+    """One conversation with its own history and browser page, driven on the shared event loop."""
+    def __init__(self, name):
+        self.name = name; self.history = []
+
+    async def ask(self, user_text, retries=3):
+        model, requested = choose_model(user_text), keyword_model(user_text)
+        self.history.append(types.Content(role="user", parts=[types.Part(text=user_text)]))
+        all_tools, category = False, task_category(user_text)
+        step = 0  # model turns whose tool batch is done; retries resume here
+        for attempt in range(retries):
+            try:
+                while step < MAX_ITER:
+                    self.history = await asyncio.to_thread(compact_history, self.history, model)
+                    config = _gemini_config(self.history, all_tools)
+                    key = _cache_key(requested, self.history, config)
+                    hit = _cache_lookup(key, model)
+                    if hit is not None:
+                        model_content = types.Content.model_validate(hit)
+                        print(f"  [{self.name} 🤖 {model} | {_tools_label(config)}] ✓ 💾")
+                    else:
+                        reserved = await rate_limiter.acquire_async(model, _prompt_tokens(self.history, config))
+                        count_model_call(model)
+                        started  = time.monotonic()
+                        response = await client.aio.models.generate_content(
+                            model=model, contents=self.history, config=config)
+                        rate_limiter.settle(model, reserved, response.usage_metadata)
+                        model_router.record_call(model, category, time.monotonic() - started,
+                                                 getattr(response.usage_metadata, "total_token_count", None) or reserved)
+                        print(f"  [{self.name} 🤖 {model} | {_tools_label(config)}] ✓")
+                        model_content = response.candidates[0].content
+                        if key: response_cache.put(key, _dump(model_content))
+                    self.history.append(model_content)
+                    tool_parts = [p for p in model_content.parts if p.function_call]
+                    if not tool_parts:
+                        return " ".join(p.text for p in model_content.parts if p.text).strip()
+                    calls   = [(p.function_call.name, dict(p.function_call.args) if p.function_call.args else {})
+                               for p in tool_parts]
+                    results = await run_tool_calls_async(calls, self.name)
+                    model_router.record_tools(model, category, results)
+                    self.history.append(types.Content(role="user", parts=[
+                        types.Part(function_response=types.FunctionResponse(name=n, response={"result": r}))
+                        for (n, _), r in zip(calls, results)]))
+                    step += 1
+                return "⚠️ Reached iteration limit."
+            except Exception as e:
+                model_router.record_error(model, category, e)
+                plan = _retry_plan(e, model, attempt, retries)
+                if plan is None: raise
+                model, wait_s = plan
+                all_tools = all_tools or "function" in str(e).lower()
+                await asyncio.sleep(wait_s)
+
+
+async def run_batch(tasks):
+    """Run each task in its own session, all multiplexed on one event loop."""
+    async def run_one(session, task):
+        try: return await session.ask(task)
+        except Exception as e: return f"❌ Error: {e}"
+        finally:
+            await asyncio.wrap_future(tool_executor.submit_to_browser_thread(
+                lambda: close_session_page(session.name)))
+    try:
+        return list(await asyncio.gather(*(run_one(AgentSession(f"#{i+1}"), t) for i, t in enumerate(tasks))))
+    finally:
+        await http_client.aclose()
+
+
+# Extractor benchmark: python agent_gemini.py --bench-extract bench/pages/ [rounds]
+if len(sys.argv) > 2 and sys.argv[1] == "--bench-extract":
+    print(benchmark_extractors(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 5)); sys.exit(0)
+
+# Batch mode: python agent_gemini.py --batch tasks.txt (one task per line)
+if len(sys.argv) > 2 and sys.argv[1] == "--batch":
+    with open(sys.argv[2], "r", encoding="utf-8") as f:
+        batch_tasks = [line.strip() for line in f if line.strip()]
+    print(f"\n🚀 Running {len(batch_tasks)} sessions concurrently...\n")
+    prewarm_browser()
+    for i, (task, reply) in enumerate(zip(batch_tasks, asyncio.run(run_batch(batch_tasks)))):
+        print(f"━━━ #{i+1}: {task}\n🤖 {reply}\n")
+    tool_executor.run_in_browser_thread(close_browser)
+    sys.exit(0)
 
 
 # ─────────────────────────────────────────
 # STARTUP BANNER
 # ─────────────────────────────────────────
+prewarm_browser()  # launches while the user types the first task
 print()
 print("╔══════════════════════════════════════════════════════╗")
 print("║      🤖  GeminiAgent  (Dual Model Strategy)         ║")
@@ -815,18 +2902,35 @@ while True:
     try:
         user_input = input("👤 You: ").strip()
     except (KeyboardInterrupt, EOFError):
-        print("\n👋 Goodbye!"); close_browser(); break
+        print("\n👋 Goodbye!"); tool_executor.run_in_browser_thread(close_browser); http_client.close(); break
 
     if user_input.lower() in ("exit","quit"):
-        print("👋 Goodbye!"); close_browser(); break
+        print("👋 Goodbye!"); tool_executor.run_in_browser_thread(close_browser); http_client.close(); break
 
     if user_input.lower() in ("reset","clear"):
         history = []; print("🔄 History cleared.\n"); continue
 
     if user_input.lower() in ("status","stats"):
         print(f"\n📊 Smart calls: {_smart_calls_today}/{_MAX_SMART_CALLS} | "
-              f"History: {len(history)//2} turns | "
-              f"Browser: {'open' if _page else 'closed'}\n"); continue
+              f"History: {len(history)} messages (~{history_tokens(history)} tokens) | "
+              f"Browser: {'open' if _page else 'closed'} ({BROWSER_PROFILE}, {blocked_requests} blocked) | "
+              f"Tool cache: {tool_cache.hits} hits / {tool_cache.misses} misses | "
+              f"Tool subsets: {tool_selection_stats['subset']}/{tool_selection_stats['requests']} requests, "
+              f"~{tool_selection_stats['saved_tokens']} tokens saved\n")
+        print(f"  HTTP: {http_client.describe()}")
+        if page_cache: print(f"  Page cache: {page_cache.describe()}")
+        print(f"  Screenshots: {screenshot_writer.written} written "
+              f"({screenshot_writer.write_ms / max(screenshot_writer.written, 1):.0f} ms avg), "
+              f"{screenshot_writer.pending} pending, {screenshot_writer.failed} failed")
+        print(f"  Rate limiter: {rate_limiter.waiting} queued | {rate_limiter.throttled} calls paced, "
+              f"{rate_limiter.waited:.1f}s waited")
+        for line in rate_limiter.describe(): print(f"    {line}")
+        print(f"  Model router: {ROUTER_STATS_PATH}")
+        for line in model_router.describe(): print(f"    {line}")
+        if response_cache:
+            print(f"  Response cache: {LLM_CACHE_MODE} | {response_cache.count()} entries | "
+                  f"{response_cache.hits} hits / {response_cache.misses} misses\n")
+        continue
 
     if not user_input: continue
 